@@ -28,6 +28,7 @@ def get_interface(bucket_name=default_bucket,
                   force_bucket_creation=force_bucket_creation,
                   verbose=True,
                   backend='s3',
+                  cache=None,
                   **kwargs):
     """Return an interface to the cloud.
 
@@ -40,6 +41,9 @@ def get_interface(bucket_name=default_bucket,
         The URL for the S3 gateway
     backend : 's3'|'gdrive'
         What backend to hook on to
+    cache : bool, optional
+        Keep a local copy of downloaded objects on disk. Defaults to
+        the ``[cache]`` configuration (``use_cache``, ``path``, ``size``).
     kwargs :
         S3 only. kwargs passed to botocore. For example,
         >>> from botocore.client import Config
@@ -78,10 +82,30 @@ def get_interface(bucket_name=default_bucket,
                                  force_bucket_creation,
                                  verbose=verbose,
                                  backend = backend,
+                                 cache = cache,
                                  **kwargs)
     return interface
 
 
+def get_async_interface(*args, max_pool_connections=None, **kwargs):
+    """Return an asyncio interface to the cloud.
+
+    The arguments are those of ``get_interface``.
+
+    Parameters
+    ----------
+    max_pool_connections : int, optional
+        Maximum number of connections of the asynchronous S3 client
+
+    Returns
+    -------
+    acci : cottoncandy.asyncinterface.AsyncInterface
+    """
+    from cottoncandy.asyncinterface import AsyncInterface
+
+    return AsyncInterface(get_interface(*args, **kwargs), max_pool_connections = max_pool_connections)
+
+
 def get_browser(bucket_name=default_bucket,
                 ACCESS_KEY=ACCESS_KEY,
                 SECRET_KEY=SECRET_KEY,
@@ -131,4 +155,4 @@ def get_browser(bucket_name=default_bucket,
 
     return S3Directory('/', interface=interface)
 
-__all__ = ['get_interface', 'get_browser', 'interfaces', 'browser']
+__all__ = ['get_interface', 'get_async_interface', 'get_browser', 'interfaces', 'browser']
@@ -0,0 +1,591 @@
+'''asyncio interface to the cloud
+'''
+import asyncio
+import json
+import pickle
+from collections import deque
+from contextlib import AsyncExitStack
+from io import BytesIO
+from itertools import islice
+
+import numpy as np
+from botocore.utils import fix_s3_host
+
+from .backend import FileNotFoundError
+from .cacheclient import CacheClient
+from .interfaces import DO_COMPRESSION
+from .listing import CHUNK_SIZE, Listing
+from .s3client import S3Client
+from .utils import (
+    COMPRESSION_WORKERS,
+    DEFAULT_ACL,
+    IterStream,
+    MAGIC_CHECK,
+    MAX_POOL_CONNECTIONS,
+    MB,
+    MPD_CHUNKSIZE,
+    MPD_THRESHOLD,
+    MPU_CHUNKSIZE,
+    MPU_INFLIGHT_PARTS,
+    MPU_THRESHOLD,
+    SEPARATOR,
+    THREADS,
+    clean_object_name,
+    glob_regex,
+    has_magic,
+    parse_array_metadata,
+    sanitize_metadata,
+    split_byte_range,
+)
+
+try:
+    from aiobotocore.config import AioConfig
+    from aiobotocore.session import get_session
+    from botocore.exceptions import ClientError
+except ImportError:
+    get_session = None
+
+
+def _offloaded(method_name):
+    """Make an ``async`` method that runs ``method_name`` in a thread"""
+    async def run_method(self, *args, **kwargs):
+        return await self._run(method_name, *args, **kwargs)
+    run_method.__name__ = method_name
+    run_method.__doc__ = """Like ``DefaultInterface.%s``, run in the interface's executor
+
+        Cancelling the call does not stop the thread running it.
+        """ % method_name
+    return run_method
+
+
+class AsyncInterface(object):
+    """
+    asyncio counterpart of ``DefaultInterface``.
+
+    With the ``s3`` backend and ``aiobotocore`` installed (the ``async``
+    extra), objects and raw arrays are uploaded, downloaded, checked and
+    listed (unless the listing index is enabled) with an asynchronous
+    S3 client: concurrency is only limited
+    by ``max_pool_connections``, and cancelling a call cancels its
+    requests. Array compression and decompression run in the default
+    executor of the event loop. The other methods (files, directories,
+    ``ls``, ``cp``, ``rm``, etc.) run in the executor of the wrapped
+    interface (see ``DefaultInterface.submit``). All the methods run
+    in threads with the other backends.
+
+    Example
+    -------
+    >>> cci = cc.get_interface('my_bucket')
+    >>> async with AsyncInterface(cci) as acci:
+    ...     arrays = await asyncio.gather(*[acci.download_raw_array(name) for name in names])
+    """
+
+    def __init__(self, interface, max_pool_connections=None):
+        """
+        Parameters
+        ----------
+        interface : DefaultInterface
+            Interface to wrap. It is used for the calls run in threads.
+        max_pool_connections : int, optional
+            Maximum number of connections of the asynchronous S3
+            client. Defaults to the ``[basic]`` configuration.
+        """
+        self.interface = interface
+        self.max_pool_connections = max_pool_connections or MAX_POOL_CONNECTIONS
+        self._client = None
+        self._client_lock = None
+        self._exit_stack = None
+
+    def __repr__(self):
+        return '<async %r>' % self.interface
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Close the asynchronous S3 client"""
+        if self._exit_stack is not None:
+            exit_stack, self._exit_stack, self._client = self._exit_stack, None, None
+            await exit_stack.aclose()
+
+    @property
+    def is_native(self):
+        """Whether the objects are accessed with an asynchronous client"""
+        return ((get_session is not None) and (self.interface.backend == 's3') and
+                hasattr(self.interface.backend_interface, '_connect_kwargs'))
+
+    @property
+    def bucket_name(self):
+        return self.interface.bucket_name
+
+    async def _get_client(self):
+        """Asynchronous S3 client, created on first use"""
+        if self._client_lock is None:
+            self._client_lock = asyncio.Lock()
+        async with self._client_lock:
+            if self._client is None:
+                backend = self.interface.backend_interface
+                kwargs = dict(backend._connect_kwargs)
+                config = AioConfig(max_pool_connections = self.max_pool_connections)
+                if kwargs.get('config') is not None:
+                    config = config.merge(kwargs['config'])
+                kwargs['config'] = config
+                exit_stack = AsyncExitStack()
+                client = await exit_stack.enter_async_context(
+                    get_session().create_client('s3', endpoint_url = backend.url, **kwargs))
+                client.meta.events.unregister('before-sign.s3', fix_s3_host)
+                self._exit_stack, self._client = exit_stack, client
+            return self._client
+
+    async def _run(self, method_name, *args, **kwargs):
+        """Run a method of the wrapped interface in its executor"""
+        return await asyncio.wrap_future(self.interface.submit(method_name, *args, **kwargs))
+
+    async def _get_object(self, object_name, **kwargs):
+        """``GetObject`` response of an object, with its open body"""
+        client = await self._get_client()
+        try:
+            return await client.get_object(Bucket = self.bucket_name, Key = object_name, **kwargs)
+        except ClientError as error:
+            if error.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+                raise
+            raise FileNotFoundError('Object not found: ' + object_name)
+
+    @staticmethod
+    async def _read_into(body, buffer, blocksize=MB):
+        """Fill a writable buffer with the content of a response body"""
+        view = memoryview(buffer).cast('B')
+        position = 0
+        while position < view.nbytes:
+            data = await body.read(min(blocksize, view.nbytes - position))
+            if not data:
+                raise IOError('Stream ended after %i of %i bytes' % (position, view.nbytes))
+            view[position:position + len(data)] = data
+            position += len(data)
+        return position
+
+    async def _upload_stream(self, object_name, stream, acl=DEFAULT_ACL, threads=THREADS, **metadata):
+        """Upload a file-like object as it is read
+
+        The stream is read in the default executor, ``mpu_chunksize``
+        bytes at a time. Longer streams are uploaded in parts, with at
+        most ``mpu_inflight_parts`` parts in memory and ``threads``
+        parts uploaded at a time. The upload is aborted on errors,
+        and when the call is cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        client = await self._get_client()
+        data = await loop.run_in_executor(None, stream.read, MPU_CHUNKSIZE)
+        if len(data) < MPU_CHUNKSIZE:
+            try:
+                return await client.put_object(Bucket = self.bucket_name, Key = object_name, Body = data,
+                                               ACL = acl, Metadata = metadata)
+            finally:
+                self._invalidate(object_name)
+
+        upload = await client.create_multipart_upload(Bucket = self.bucket_name, Key = object_name,
+                                                      ACL = acl, Metadata = metadata)
+        upload_id = upload['UploadId']
+        slots = asyncio.Semaphore(max(min(threads, MPU_INFLIGHT_PARTS), 1))
+
+        async def upload_part(number, data):
+            try:
+                response = await client.upload_part(Bucket = self.bucket_name, Key = object_name,
+                                                    UploadId = upload_id, PartNumber = number, Body = data)
+                return dict(PartNumber = number, ETag = response['ETag'])
+            finally:
+                slots.release()
+
+        tasks = []
+        try:
+            while data:
+                await slots.acquire()
+                tasks.append(asyncio.ensure_future(upload_part(len(tasks) + 1, data)))
+                data = await loop.run_in_executor(None, stream.read, MPU_CHUNKSIZE)
+            parts = await asyncio.gather(*tasks)
+            return await client.complete_multipart_upload(Bucket = self.bucket_name, Key = object_name,
+                                                          UploadId = upload_id,
+                                                          MultipartUpload = dict(Parts = parts))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions = True)
+            await client.abort_multipart_upload(Bucket = self.bucket_name, Key = object_name,
+                                                UploadId = upload_id)
+            raise
+        finally:
+            self._invalidate(object_name)
+
+    def _invalidate(self, object_name):
+        # the wrapped interface may cache metadata, listings or contents
+        self.interface.backend_interface.invalidate(object_name)
+
+    @clean_object_name
+    async def exists_object(self, object_name, bucket_name=None, raise_err=False):
+        """Check whether object exists in bucket
+
+        Parameters
+        ----------
+        object_name : str
+        bucket_name : str, optional
+        raise_err : bool
+            Raise a ``FileNotFoundError`` if the object does not exist
+        """
+        if not self.is_native:
+            return await self._run('exists_object', object_name, bucket_name, raise_err)
+        client = await self._get_client()
+        try:
+            await client.head_object(Bucket = bucket_name or self.bucket_name, Key = object_name)
+        except ClientError as error:
+            if error.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+                raise
+            if raise_err:
+                raise FileNotFoundError('Object not found: ' + object_name)
+            return False
+        return True
+
+    @clean_object_name
+    async def upload_object(self, object_name, body, acl=DEFAULT_ACL, threads = THREADS, **metadata):
+        """Upload ``bytes`` (or a file object)
+
+        Bodies larger than ``mpu_use_threshold`` are uploaded in parts,
+        in the executor.
+        """
+        if (not self.is_native) or (not isinstance(body, bytes)) or (len(body) > MPU_THRESHOLD):
+            if isinstance(body, bytes):
+                body = BytesIO(body)
+            return await self._run('upload_object', object_name, body, acl, threads, **metadata)
+        client = await self._get_client()
+        try:
+            return await client.put_object(Bucket = self.bucket_name, Key = object_name, Body = body,
+                                           ACL = acl, Metadata = metadata)
+        finally:
+            self._invalidate(object_name)
+
+    @clean_object_name
+    async def download_object(self, object_name, threads = THREADS):
+        """Download object raw data
+
+        Returns
+        -------
+        byte_data : bytes
+        """
+        if not self.is_native:
+            return await self._run('download_object', object_name, threads)
+        response = await self._get_object(object_name)
+        async with response['Body'] as body:
+            return await body.read()
+
+    @clean_object_name
+    async def upload_json(self, object_name, ddict, acl=DEFAULT_ACL, threads = 1, **metadata):
+        """Upload a dict as a JSON using ``json.dumps``"""
+        if not self.is_native:
+            return await self._run('upload_json', object_name, ddict, acl, threads, **metadata)
+        return await self.upload_object(object_name, json.dumps(ddict).encode(), acl, threads, **metadata)
+
+    @clean_object_name
+    async def download_json(self, object_name, threads = 1):
+        """Download a JSON object as a dict"""
+        if not self.is_native:
+            return await self._run('download_json', object_name, threads)
+        return json.loads((await self.download_object(object_name, threads)).decode())
+
+    @clean_object_name
+    async def upload_pickle(self, object_name, data_object, acl=DEFAULT_ACL, threads = THREADS, **metadata):
+        """Upload an object using ``pickle.dumps``"""
+        if not self.is_native:
+            return await self._run('upload_pickle', object_name, data_object, acl, threads, **metadata)
+        return await self.upload_object(object_name, pickle.dumps(data_object), acl, threads, **metadata)
+
+    @clean_object_name
+    async def download_pickle(self, object_name, threads = THREADS):
+        """Download an object using ``pickle.loads``"""
+        if not self.is_native:
+            return await self._run('download_pickle', object_name, threads)
+        return pickle.loads(await self.download_object(object_name, threads))
+
+    @clean_object_name
+    async def upload_raw_array(self, object_name, array, compression=DO_COMPRESSION, acl=DEFAULT_ACL,
+                               threads = THREADS, workers = COMPRESSION_WORKERS, **metadata):
+        """Upload a binary representation of a np.ndarray
+
+        See ``DefaultInterface.upload_raw_array``. The array is
+        compressed in the default executor while it is uploaded.
+        """
+        if not self.is_native:
+            return await self._run('upload_raw_array', object_name, array, compression, acl, threads,
+                                   workers, **metadata)
+        filestream, meta = self.interface._raw_array_stream(array, compression, workers, **metadata)
+        return await self._upload_stream(object_name, filestream, acl, threads, **meta)
+
+    @clean_object_name
+    async def download_raw_array(self, object_name, buffersize=2**16, threads = THREADS, **kwargs):
+        """Download a binary np.ndarray and return an np.ndarray object
+
+        See ``DefaultInterface.download_raw_array``. Uncompressed arrays
+        larger than ``mpd_use_threshold`` are downloaded in parts of
+        ``mpd_chunksize`` bytes, ``threads`` at a time, straight into the
+        array. Compressed arrays are downloaded in the same parts, and
+        decoded in order in the default executor as they arrive. The
+        other options (``index``, ``out``, etc.), the array cache and
+        the object cache use the wrapped interface.
+        """
+        if (not self.is_native) or kwargs or (self.interface.array_cache is not None) or \
+           isinstance(self.interface.backend_interface, CacheClient):
+            return await self._run('download_raw_array', object_name, buffersize, threads, **kwargs)
+
+        response = await self._get_object(object_name)
+        async with response['Body'] as body:
+            metadata = sanitize_metadata(response['Metadata'])
+            shape, dtype, order, compression = parse_array_metadata(metadata)
+            array = np.empty(shape, dtype = dtype, order = order)
+            if compression != 'False':
+                await self._decode_body(object_name, body, response['ContentLength'], array, compression,
+                                        metadata.get('framesize'), buffersize, threads)
+                return array
+
+            # the first part is read from the open body
+            data = array.reshape(-1, order = 'A').view(np.uint8)
+            parts = split_byte_range(data.nbytes, MPD_CHUNKSIZE) if data.nbytes >= MPD_THRESHOLD else \
+                [(0, data.nbytes)]
+            slots = asyncio.Semaphore(max(threads, 1))
+
+            async def download_part(start, stop):
+                async with slots:
+                    part = await self._get_object(object_name, Range = 'bytes=%i-%i' % (start, stop - 1))
+                    async with part['Body'] as part_body:
+                        await self._read_into(part_body, data[start:stop])
+
+            await asyncio.gather(self._read_into(body, data[parts[0][0]:parts[0][1]]),
+                                 *[download_part(start, stop) for start, stop in parts[1:]])
+        return array
+
+    @property
+    def _indexed(self):
+        # listings are answered by the listing index of the wrapped interface
+        return self.interface._indexed_client is not None
+
+    async def _paginate(self, prefix, start_after=None, page_size=1000):
+        """Pages of ``ListObjectsV2`` under ``prefix``"""
+        client = await self._get_client()
+        kwargs = dict(Bucket = self.bucket_name, Prefix = prefix, PaginationConfig = dict(PageSize = page_size))
+        if start_after:
+            kwargs['StartAfter'] = start_after
+        async for page in client.get_paginator('list_objects_v2').paginate(**kwargs):
+            yield page
+
+    async def _list_range(self, prefix, start_after, stop, page_size, pages):
+        """List the objects in ``(start_after, stop]`` into the queue ``pages``
+
+        Like ``S3Client._list_range``. ``None`` is put last.
+        """
+        try:
+            async for page in self._paginate(prefix, start_after, page_size):
+                objects = S3Client._page_objects(page)
+                if stop is not None and objects and objects[-1][0] > stop:
+                    await pages.put([listed for listed in objects if listed[0] <= stop])
+                    break
+                await pages.put(objects)
+        except Exception as error:
+            await pages.put(error)
+        await pages.put(None)
+
+    async def _decode_body(self, object_name, body, nbytes, array, compression, framesize=None,
+                           buffersize=2**16, threads=THREADS):
+        """Decode a compressed array while it is downloaded
+
+        The first part is read from ``body`` as it streams in, while
+        the next ``threads`` parts are downloaded. The parts are
+        decoded in order, in the default executor.
+        """
+        loop = asyncio.get_running_loop()
+        parts = split_byte_range(nbytes, MPD_CHUNKSIZE) if nbytes >= MPD_THRESHOLD else [(0, nbytes)]
+        received = asyncio.Queue(maxsize = 2)
+
+        async def download_part(start, stop):
+            data = bytearray(stop - start)
+            part = await self._get_object(object_name, Range = 'bytes=%i-%i' % (start, stop - 1))
+            async with part['Body'] as part_body:
+                await self._read_into(part_body, data)
+            return data
+
+        async def download():
+            remaining = iter(parts[1:])
+            pending = deque()
+            try:
+                for start, stop in islice(remaining, max(threads, 1)):
+                    pending.append(asyncio.ensure_future(download_part(start, stop)))
+                position, first = 0, parts[0][1]
+                while position < first:
+                    data = await body.read(min(MB, first - position))
+                    if not data:
+                        raise IOError('Stream ended after %i of %i bytes' % (position, nbytes))
+                    position += len(data)
+                    await received.put(data)
+                while pending:
+                    data = await pending.popleft()
+                    for start, stop in islice(remaining, 1):
+                        pending.append(asyncio.ensure_future(download_part(start, stop)))
+                    await received.put(data)
+                await received.put(None)
+            except Exception as error:
+                await received.put(error)
+            finally:
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions = True)
+
+        def chunks():
+            # run in the executor: wait for the parts on the event loop
+            while True:
+                data = asyncio.run_coroutine_threadsafe(received.get(), loop).result()
+                if data is None:
+                    return
+                if isinstance(data, Exception):
+                    raise data
+                yield data
+
+        downloading = asyncio.ensure_future(download())
+        try:
+            await loop.run_in_executor(None, self.interface._decode_raw_array, IterStream(chunks()), array,
+                                       compression, framesize, buffersize)
+        finally:
+            downloading.cancel()
+            await asyncio.gather(downloading, return_exceptions = True)
+            # end the stream, in case the decoder is still waiting
+            while not received.empty():
+                received.get_nowait()
+            received.put_nowait(None)
+
+    async def iter_objects(self, prefix='', page_size=1000, threads=1):
+        """Lazily list the objects whose name starts with ``prefix``
+
+        With ``threads > 1``, long listings are split into ranges that
+        are listed concurrently, like ``S3Client.iter_objects``.
+
+        Yields
+        ------
+        (name, size, etag, mtime) tuples, in lexicographic order of
+        the (quoted) names
+        """
+        if (not self.is_native) or self._indexed:
+            objects = self.interface.iter_objects(prefix, page_size = page_size, threads = threads)
+            while True:
+                page = await self._run(lambda: list(islice(objects, page_size)))
+                for obj in page:
+                    yield obj
+                if len(page) < page_size:
+                    return
+
+        pages = self._paginate(prefix, page_size = page_size)
+        try:
+            page = await pages.__anext__()
+        except StopAsyncIteration:
+            return
+        objects = S3Client._page_objects(page)
+        if (threads <= 1) or (not page.get('IsTruncated', False)) or (not objects):
+            # short listings are not worth splitting
+            for listed in objects:
+                yield listed
+            async for page in pages:
+                for listed in S3Client._page_objects(page):
+                    yield listed
+            return
+        await pages.aclose()
+
+        for listed in objects:
+            yield listed
+
+        keys = [listed[0] for listed in objects]
+        boundaries = S3Client._key_boundaries(prefix, keys, 16 * threads)
+        ranges = iter(zip([keys[-1]] + boundaries, boundaries + [None]))
+        pending = deque()
+        try:
+            while True:
+                while len(pending) < 2 * threads:
+                    bounds = next(ranges, None)
+                    if bounds is None:
+                        break
+                    listed_pages = asyncio.Queue(maxsize = 2)
+                    task = asyncio.ensure_future(self._list_range(prefix, bounds[0], bounds[1], page_size,
+                                                                  listed_pages))
+                    pending.append((task, listed_pages))
+                if not pending:
+                    break
+                task, listed_pages = pending.popleft()
+                while True:
+                    objects = await listed_pages.get()
+                    if objects is None:
+                        break
+                    if isinstance(objects, Exception):
+                        raise objects
+                    for listed in objects:
+                        yield listed
+        finally:
+            for task, _ in pending:
+                task.cancel()
+            await asyncio.gather(*[task for task, _ in pending], return_exceptions = True)
+
+    async def glob(self, pattern, **kwargs):
+        """Return a list of object names that match the glob pattern
+
+        See ``DefaultInterface.glob``. With the asynchronous client,
+        all the objects under the leading part of the pattern without
+        wildcards are listed, ``threads`` ranges at a time. Patterns
+        with wildcards in their "directories", and listings answered
+        by the listing index, use the wrapped interface.
+        """
+        directory = pattern.rpartition(SEPARATOR)[0]
+        if (not self.is_native) or self._indexed or has_magic(directory):
+            return await self._run('glob', pattern, **kwargs)
+
+        limit = kwargs.get('limit', None)
+        do_unquote = kwargs.get('do_unquote', True)
+        prefix = MAGIC_CHECK.split(pattern)[0] if has_magic(pattern) else pattern
+        if prefix.startswith('/'):
+            prefix = prefix[1:]
+
+        found = []
+        num_found = 0
+        objects = []
+        listing = self.iter_objects(prefix, page_size = kwargs.get('page_size', 1000),
+                                    threads = kwargs.get('threads', THREADS))
+        while (limit is None) or (num_found < limit):
+            async for obj in listing:
+                objects.append(obj)
+                if len(objects) == CHUNK_SIZE:
+                    break
+            if not objects:
+                break
+            chunk = Listing.from_objects(objects)
+            objects = []
+            if do_unquote:
+                chunk = chunk.unquote()
+            if has_magic(pattern):
+                chunk = chunk[chunk.match(glob_regex(pattern))]
+            found.append(chunk)
+            num_found += len(chunk)
+        await listing.aclose()
+        return Listing.concatenate(found)[:limit].sorted().names
+
+    # run in the executor of the wrapped interface
+    upload_from_file = _offloaded('upload_from_file')
+    upload_from_directory = _offloaded('upload_from_directory')
+    download_to_file = _offloaded('download_to_file')
+    download_directory = _offloaded('download_directory')
+    upload_npy_array = _offloaded('upload_npy_array')
+    download_npy_array = _offloaded('download_npy_array')
+    upload_dask_array = _offloaded('upload_dask_array')
+    download_dask_array = _offloaded('download_dask_array')
+    upload_sparse_array = _offloaded('upload_sparse_array')
+    download_sparse_array = _offloaded('download_sparse_array')
+    dict2cloud = _offloaded('dict2cloud')
+    cloud2dict = _offloaded('cloud2dict')
+    ls = _offloaded('ls')
+    lsdir = _offloaded('lsdir')
+    cp = _offloaded('cp')
+    mv = _offloaded('mv')
+    rm = _offloaded('rm')
@@ -1,4 +1,7 @@
 from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+from .utils import MPD_CHUNKSIZE, MPD_THRESHOLD, ordered_map, read_into, split_byte_range
 
 
 class FileNotFoundError(RuntimeError):
@@ -11,6 +14,15 @@ class CCBackEnd:
     """
     __metaclass__ = ABCMeta
 
+    # whether ``upload_stream`` accepts streams that are not seekable
+    # and have no known size (e.g. data compressed while uploaded)
+    streaming_uploads = True
+
+    # whether ``iter_objects`` and ``split_prefix`` list the objects
+    # under a prefix, as (name, size, etag, mtime) tuples. The other
+    # backends are only listed one directory at a time
+    prefix_listing = True
+
     def __init__(self):
         pass
 
@@ -117,6 +129,219 @@ class CCBackEnd:
         """
         pass
 
+    @abstractmethod
+    def open_stream(self, cloud_name):
+        """Opens an object for sequential reading, without downloading it first
+
+        The body, metadata and size should come from a single request.
+
+        Parameters
+        ----------
+        cloud_name : str
+            name of object to open
+
+        Returns
+        -------
+        CloudStream object. Its content should be closed after reading.
+
+        Raises
+        ------
+        FileNotFoundError if the object does not exist
+        """
+        pass
+
+    @abstractmethod
+    def download_into(self, cloud_name, buffer, offset=0):
+        """Downloads part of an object directly into a writable buffer
+
+        Parameters
+        ----------
+        cloud_name : str
+            name of object to download
+        buffer : writable buffer
+            destination of the data (e.g. a contiguous np.ndarray).
+            ``len(buffer)`` bytes are downloaded.
+        offset : int
+            position of the first byte to download
+
+        Returns
+        -------
+        int, number of bytes downloaded
+        """
+        pass
+
+    def download_ranges_into(self, cloud_name, requests, threads=1):
+        """Downloads several byte ranges of an object, in parallel
+
+        Parameters
+        ----------
+        cloud_name : str
+            name of object to download
+        requests : list of (offset, buffer) tuples
+            each buffer is filled with the bytes starting at offset
+        threads : int
+            number of threads to use
+
+        Returns
+        -------
+        int, number of bytes downloaded
+        """
+        if threads <= 1 or len(requests) <= 1:
+            return sum(self.download_into(cloud_name, buffer, offset)
+                       for offset, buffer in requests)
+
+        with ThreadPoolExecutor(max_workers=min(threads, len(requests))) as executor:
+            futures = [executor.submit(self.download_into, cloud_name, buffer, offset)
+                       for offset, buffer in requests]
+            return sum(future.result() for future in futures)
+
+    def download_parts_into(self, cloud_name, buffer, threads=1, offset=0,
+                            chunksize=MPD_CHUNKSIZE, threshold=MPD_THRESHOLD, stream=None):
+        """Downloads an object into a buffer with a parallel multi-part download
+
+        Objects of at least ``threshold`` bytes are split into ranged
+        reads of ``chunksize`` bytes. Each part is written in place,
+        so the buffer is reassembled in order.
+
+        If an open ``stream`` of the object is given, the first part is
+        read from it instead of issuing a new request. Objects smaller
+        than ``threshold`` then cost no request at all.
+
+        Parameters
+        ----------
+        cloud_name : str
+            name of object to download
+        buffer : writable buffer
+            destination of the data. ``len(buffer)`` bytes are downloaded.
+        threads : int
+            number of threads to use
+        offset : int
+            position of the first byte to download
+        chunksize : int
+            part size in bytes. Defaults to ``mpd_chunksize``.
+        threshold : int
+            minimum size in bytes for a multi-part download.
+            Defaults to ``mpd_use_threshold``.
+        stream : file-like object, optional
+            stream of the object positioned at ``offset``
+            (e.g. the content of ``open_stream``)
+
+        Returns
+        -------
+        int, number of bytes downloaded
+        """
+        data = memoryview(buffer).cast('B')
+        nbytes = data.nbytes
+        parts = split_byte_range(nbytes, chunksize) if nbytes >= threshold else [(0, nbytes)]
+        requests = [(offset + start, data[start:stop]) for start, stop in parts]
+        if stream is None:
+            return self.download_ranges_into(cloud_name, requests, threads)
+
+        (_, first), requests = requests[0], requests[1:]
+        if not requests:
+            return read_into(stream, first)
+        # the remaining parts are fetched while the stream is read
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(self.download_ranges_into, cloud_name, requests, threads)
+            nbytes = read_into(stream, first)
+            return nbytes + future.result()
+
+    def iter_parts(self, cloud_name, nbytes, threads=1, chunksize=MPD_CHUNKSIZE,
+                   threshold=MPD_THRESHOLD, stream=None):
+        """Downloads the consecutive parts of an object, in parallel and in order
+
+        Like ``download_parts_into``, for data that must be read
+        sequentially (e.g. compressed). The next ``threads`` parts
+        are downloaded while a part is consumed, so at most
+        ``threads + 1`` parts are held in memory.
+
+        Parameters
+        ----------
+        cloud_name : str
+            name of object to download
+        nbytes : int
+            size of the object in bytes
+        threads : int
+            number of threads to use
+        chunksize : int
+            part size in bytes. Defaults to ``mpd_chunksize``.
+        threshold : int
+            minimum size in bytes for a multi-part download.
+            Defaults to ``mpd_use_threshold``.
+        stream : file-like object, optional
+            open stream of the object. The first part is read from it.
+
+        Returns
+        -------
+        iterator : generator object
+            Yields a bytearray for each part
+        """
+        parts = split_byte_range(nbytes, chunksize) if nbytes >= threshold else [(0, nbytes)]
+
+        def download(part):
+            start, stop = part
+            data = bytearray(stop - start)
+            if (stream is not None) and (start == 0):
+                read_into(stream, data)
+            else:
+                self.download_into(cloud_name, data, start)
+            return data
+        return ordered_map(download, parts, workers=threads)
+
+    def get_object_version(self, cloud_name):
+        """Identifies the current content of an object
+
+        Parameters
+        ----------
+        cloud_name : str
+            name of object
+
+        Returns
+        -------
+        version : str or None
+            changes whenever the object is overwritten.
+            None if the backend cannot tell.
+        size : int
+            size of the object in bytes
+        """
+        return None, self.get_object_size(cloud_name)
+
+    def get_object_info(self, cloud_name):
+        """Gets the size, version and metadata of an object
+
+        Parameters
+        ----------
+        cloud_name : str
+            name of object
+
+        Returns
+        -------
+        dict with ``size``, ``version`` and ``metadata`` keys
+        (see ``get_object_version``), and ``etag`` and ``mtime``
+        (POSIX timestamp) when the backend knows them
+
+        Raises
+        ------
+        FileNotFoundError if the object does not exist
+        """
+        version, size = self.get_object_version(cloud_name)
+        return dict(size = size, version = version, metadata = self.get_object_metadata(cloud_name))
+
+    def invalidate(self, cloud_name, recursive=False):
+        """Forgets any cached information about an object
+
+        Backends do not cache anything by default. This is called
+        after objects are changed without going through the backend.
+
+        Parameters
+        ----------
+        cloud_name : str
+            name of object
+        recursive : bool
+            also forget the objects under ``cloud_name``
+        """
+        pass
+
     ## Basic File management
 
     @abstractmethod
@@ -185,6 +410,56 @@ class CCBackEnd:
         """
         pass
 
+    def copy_prefix(self, source, destination, source_bucket=None, destination_bucket=None,
+                    overwrite=False, move=False, threads=1):
+        """Copies (or moves) all the objects under a prefix
+
+        Objects are copied one at a time with ``copy`` (or ``move``).
+        Only the current bucket can be listed, and only by backends
+        with ``prefix_listing``.
+
+        Parameters
+        ----------
+        source : str
+            prefix of the objects to copy (e.g. "data/")
+        destination : str
+            prefix of the copies
+        source_bucket : None
+        destination_bucket : str, optional
+        overwrite : bool
+            overwrite existing objects
+        move : bool
+            delete the sources once copied
+        threads : int
+            number of concurrent requests, if the backend copies on the server
+
+        Returns
+        -------
+        copied : list
+            (source, destination) names of the objects copied
+        errors : list
+            (name, message) tuples for the objects that were not copied
+        """
+        if source_bucket is not None:
+            raise NotImplementedError('Only objects in the current bucket can be listed')
+        if not self.prefix_listing:
+            raise NotImplementedError('Prefixes cannot be listed with %s: copy the objects one at a time'
+                                      % type(self).__name__)
+        copied = []
+        errors = []
+        for name, _, _, _ in list(self.iter_objects(source)):
+            new_name = destination + name[len(source):]
+            try:
+                if move:
+                    self.move(name, new_name, source_bucket, destination_bucket, overwrite)
+                else:
+                    self.copy(name, new_name, source_bucket, destination_bucket, overwrite)
+            except (RuntimeError, OSError) as error:
+                errors.append((name, str(error)))
+            else:
+                copied.append((name, new_name))
+        return copied, errors
+
     @abstractmethod
     def delete(self, file_name, recursive=False, delete=False):
         """Deletes an object
@@ -204,6 +479,29 @@ class CCBackEnd:
         """
         pass
 
+    def delete_objects(self, file_names, threads=1):
+        """Deletes several objects
+
+        Parameters
+        ----------
+        file_names : iterable of str
+            names of the objects to delete. They are consumed lazily.
+        threads : int
+            number of concurrent requests, if the backend can batch deletes
+
+        Returns
+        -------
+        errors : list
+            (name, message) tuples for the objects that were not deleted
+        """
+        errors = []
+        for file_name in file_names:
+            try:
+                self.delete(file_name)
+            except (RuntimeError, OSError) as error:
+                errors.append((file_name, str(error)))
+        return errors
+
     @property
     @abstractmethod
     def size(self):
@@ -221,9 +519,11 @@ class CloudStream:
     A simple unified representation of an object downloaded from the cloud.
      .content is a streaming object with a .read() function
      .metadata is a dictionary of the custom metadata of this object
+     .size is the size of the object in bytes, if known
 
     TODO: unified metadata
     """
-    def __init__(self, stream, metadata):
+    def __init__(self, stream, metadata, size=None):
         self.content = stream
         self.metadata = metadata
+        self.size = size
@@ -3,11 +3,11 @@
 import os
 import re
 
+from cottoncandy.backend import FileNotFoundError
 from cottoncandy.utils import (
+    MB,
     clean_object_name,
-    get_object_size,
     has_start_digit,
-    sanitize_metadata,
 )
 
 # globals
@@ -157,8 +157,7 @@ class S3Directory(S3FSLike):
             return "%s-path <bucket:%s> %s" % details
         else:
             # no children, it's gotta be an object b/c we're in S3
-            obj = self.interface.get_object(self._fullpath)
-            size = get_object_size(obj)
+            size = self.interface.backend_interface.get_object_size(self._fullpath) / MB
             details = (__package__, self.interface.bucket_name, size)
             return "%s-file <bucket:%s> [%0.01fMB]" % details
 
@@ -202,11 +201,11 @@ class S3HDF5(S3Directory):
     def __repr__(self):
         if len(self._subdirs) == 0:
             # bottom object, probably array
-            obj = self.interface.get_object(self._fullpath)
-            obmeta = sanitize_metadata(obj.metadata)
+            info = self.interface.backend_interface.get_object_info(self._fullpath)
+            obmeta = info['metadata']
             if 'shape' in obmeta:
                 shape =  obmeta['shape']
-                size = get_object_size(obj)
+                size = info['size'] / MB
                 details = (__package__, self.interface.bucket_name, size, shape)
                 return "%s-dataset <bucket:%s [%0.01fMB:shape=(%s)]>" % details
         # otherwise it's the file itself
@@ -231,6 +230,7 @@ class S3HDF5(S3Directory):
             else:
                 raise ValueError('"%s" not in %s' % (key, dataset_path))
 
-        if self.interface.exists_object(dataset_path):
+        try:
             return self.interface.download_raw_array(dataset_path)
-        print('Specify key to download:\n%s' % ','.join(sorted(self._subdirs.keys())))
+        except FileNotFoundError:
+            print('Specify key to download:\n%s' % ','.join(sorted(self._subdirs.keys())))
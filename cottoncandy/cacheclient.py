@@ -0,0 +1,573 @@
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+
+from .backend import CCBackEnd, CloudStream, FileNotFoundError
+from .utils import MPD_CHUNKSIZE, THREADS, read_into
+
+DATA_SUFFIX = '.data'
+ENTRY_SUFFIX = '.json'
+
+
+class WrapperClient(CCBackEnd):
+    """
+    Backend that forwards all calls to another backend.
+
+    Subclasses override the calls they change. The attributes that
+    are specific to the wrapped backend (e.g. ``bucket_name``) are
+    also available.
+    """
+
+    def __init__(self, client):
+        """
+        Parameters
+        ----------
+        client : CCBackEnd
+            wrapped backend
+        """
+        self.client = client
+
+    def __getattr__(self, name):
+        # e.g. bucket_name, connection, get_s3_object
+        if name == 'client':
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+    @property
+    def streaming_uploads(self):
+        return self.client.streaming_uploads
+
+    @property
+    def prefix_listing(self):
+        return self.client.prefix_listing
+
+    def _forget(self, cloud_name, recursive=False):
+        """Drop what this wrapper keeps about an object"""
+        pass
+
+    def invalidate(self, cloud_name, recursive=False):
+        self._forget(cloud_name, recursive)
+        self.client.invalidate(cloud_name, recursive)
+
+    ## Basic File IO
+
+    def check_file_exists(self, file_name, bucket_name=None):
+        return self.client.check_file_exists(file_name, bucket_name)
+
+    def upload_stream(self, stream, cloud_name, metadata, permissions, threads):
+        self._forget(cloud_name)
+        return self.client.upload_stream(stream, cloud_name, metadata, permissions, threads)
+
+    def upload_file(self, file_name, cloud_name, permissions, threads):
+        self._forget(cloud_name)
+        return self.client.upload_file(file_name, cloud_name, permissions, threads)
+
+    def download_stream(self, cloud_name, threads):
+        return self.client.download_stream(cloud_name, threads)
+
+    def download_to_file(self, cloud_name, file_name, threads):
+        return self.client.download_to_file(cloud_name, file_name, threads)
+
+    def open_stream(self, cloud_name):
+        return self.client.open_stream(cloud_name)
+
+    def download_into(self, cloud_name, buffer, offset=0):
+        return self.client.download_into(cloud_name, buffer, offset)
+
+    def download_ranges_into(self, cloud_name, requests, threads=1):
+        return self.client.download_ranges_into(cloud_name, requests, threads)
+
+    def download_parts_into(self, cloud_name, buffer, threads=1, offset=0, **kwargs):
+        return self.client.download_parts_into(cloud_name, buffer, threads = threads, offset = offset,
+                                               **kwargs)
+
+    def iter_parts(self, cloud_name, nbytes, threads=1, **kwargs):
+        return self.client.iter_parts(cloud_name, nbytes, threads = threads, **kwargs)
+
+    def get_object_version(self, cloud_name):
+        return self.client.get_object_version(cloud_name)
+
+    def get_object_info(self, cloud_name):
+        return self.client.get_object_info(cloud_name)
+
+    ## Basic File management
+
+    def list_directory(self, path, limit):
+        return self.client.list_directory(path, limit)
+
+    def list_objects(self, **kwargs):
+        return self.client.list_objects(**kwargs)
+
+    def iter_objects(self, prefix='', start_after=None, page_size=1000, threads=1):
+        return self.client.iter_objects(prefix, start_after, page_size, threads)
+
+    def split_prefix(self, prefix, page_size=1000):
+        return self.client.split_prefix(prefix, page_size)
+
+    def copy(self, source, destination, source_bucket, destination_bucket, overwrite, **kwargs):
+        self._forget(destination)
+        return self.client.copy(source, destination, source_bucket, destination_bucket, overwrite, **kwargs)
+
+    def move(self, source, destination, source_bucket, destination_bucket, overwrite):
+        self._forget(source)
+        self._forget(destination)
+        return self.client.move(source, destination, source_bucket, destination_bucket, overwrite)
+
+    def copy_prefix(self, source, destination, source_bucket=None, destination_bucket=None,
+                    overwrite=False, move=False, threads=1):
+        self._forget(destination, recursive = True)
+        if move:
+            self._forget(source, recursive = True)
+        return self.client.copy_prefix(source, destination, source_bucket, destination_bucket,
+                                       overwrite = overwrite, move = move, threads = threads)
+
+    def delete(self, file_name, recursive=False, delete=False):
+        self._forget(file_name, recursive)
+        return self.client.delete(file_name, recursive, delete)
+
+    def delete_objects(self, file_names, threads=1):
+        def forget(file_names):
+            for file_name in file_names:
+                self._forget(file_name)
+                yield file_name
+        return self.client.delete_objects(forget(file_names), threads)
+
+    @property
+    def size(self):
+        return self.client.size
+
+
+class CacheClient(WrapperClient):
+    """
+    Read-through cache of cloud objects on local disk.
+
+    Wraps another backend. Downloaded objects are stored in a local
+    directory and later reads are served from disk. Every read checks
+    the object version first (e.g. the S3 ETag) with a single metadata
+    request, so overwritten objects are downloaded again. When the
+    cache grows over its size budget, the least recently used objects
+    are evicted.
+    """
+
+    def __init__(self, client, path, max_size):
+        """
+        Parameters
+        ----------
+        client : CCBackEnd
+            backend to cache
+        path : str
+            directory where the objects are stored
+        max_size : int
+            cache budget in bytes. Larger objects are never cached.
+        """
+        super(CacheClient, self).__init__(client)
+        path = os.path.abspath(path)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.cache_path = path
+        self.max_size = max_size
+
+    def __repr__(self):
+        return '<cache of %r in %s>' % (self.client, self.cache_path)
+
+    ## Cache entries
+
+    def _entry_stem(self, cloud_name):
+        """Path of the cache files of an object, without suffix"""
+        location = (type(self.client).__name__,
+                    getattr(self.client, 'url', None),
+                    getattr(self.client, 'bucket_name', None) or getattr(self.client, 'path', None),
+                    cloud_name)
+        digest = hashlib.sha1(repr(location).encode()).hexdigest()
+        return os.path.join(self.cache_path, digest)
+
+    def _read_entry(self, stem):
+        try:
+            with open(stem + ENTRY_SUFFIX, 'r') as entry_file:
+                return json.load(entry_file)
+        except (OSError, ValueError):
+            return None
+
+    def _remove_entry(self, stem):
+        for suffix in (ENTRY_SUFFIX, DATA_SUFFIX):
+            try:
+                os.remove(stem + suffix)
+            except OSError:
+                pass
+
+    def _lookup(self, cloud_name):
+        """Find the cache entry of an object, if it is up to date
+
+        Returns
+        -------
+        stem : str
+        entry : dict or None
+            ``version``, ``size`` and ``metadata`` of the cached object
+        version : str or None
+            current version of the object
+        size : int
+            current size of the object
+        """
+        stem = self._entry_stem(cloud_name)
+        try:
+            version, nbytes = self.client.get_object_version(cloud_name)
+        except FileNotFoundError:
+            self._remove_entry(stem)
+            raise
+
+        entry = self._read_entry(stem)
+        if (entry is None) or (version is None) or (entry['version'] != version):
+            return stem, None, version, nbytes
+
+        try:
+            # mark as recently used
+            os.utime(stem + ENTRY_SUFFIX)
+        except OSError:
+            # evicted in the meantime
+            return stem, None, version, nbytes
+        return stem, entry, version, nbytes
+
+    def _fetch(self, cloud_name, threads = THREADS):
+        """Get the up to date cache entry of an object, downloading it if needed
+
+        Returns
+        -------
+        stem : str
+        entry : dict or None
+            None if the object cannot be cached
+        """
+        stem, entry, version, nbytes = self._lookup(cloud_name)
+        if (entry is not None) or (version is None) or (nbytes > self.max_size):
+            return stem, entry
+
+        # write to a temporary file, then publish it under the entry name
+        fd, temp_name = tempfile.mkstemp(dir = self.cache_path, suffix = '.tmp')
+        try:
+            with os.fdopen(fd, 'w+b') as local_file:
+                cloudstream = self.client.open_stream(cloud_name)
+                nbytes = cloudstream.size if cloudstream.size is not None else nbytes
+                with cloudstream.content:
+                    local_file.truncate(nbytes)
+                    if nbytes > 0:
+                        with mmap.mmap(local_file.fileno(), nbytes) as mapped:
+                            self.client.download_parts_into(cloud_name, mapped, threads = threads,
+                                                            stream = cloudstream.content)
+            os.replace(temp_name, stem + DATA_SUFFIX)
+
+            entry = dict(name = cloud_name, version = version, size = nbytes,
+                         metadata = cloudstream.metadata)
+            fd, temp_name = tempfile.mkstemp(dir = self.cache_path, suffix = '.tmp')
+            with os.fdopen(fd, 'w') as entry_file:
+                json.dump(entry, entry_file)
+            os.replace(temp_name, stem + ENTRY_SUFFIX)
+        finally:
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+
+        self.evict()
+        return stem, entry
+
+    def _open_cached(self, cloud_name, threads = THREADS):
+        """Open the cached copy of an object
+
+        Returns
+        -------
+        CloudStream object, or None if the object cannot be cached
+        """
+        stem, entry = self._fetch(cloud_name, threads = threads)
+        if entry is None:
+            return None
+        try:
+            local_file = open(stem + DATA_SUFFIX, 'rb')
+        except OSError:
+            # evicted by another process
+            return None
+        return CloudStream(local_file, entry['metadata'], entry['size'])
+
+    def _is_cached_stream(self, stream):
+        name = getattr(stream, 'name', None)
+        return isinstance(name, str) and os.path.dirname(name) == self.cache_path
+
+    def evict(self):
+        """Remove the least recently used objects until the cache fits its budget
+
+        Returns
+        -------
+        int, number of bytes in the cache
+        """
+        entries = []
+        for file_name in os.listdir(self.cache_path):
+            if not file_name.endswith(ENTRY_SUFFIX):
+                continue
+            stem = os.path.join(self.cache_path, file_name[:-len(ENTRY_SUFFIX)])
+            try:
+                last_used = os.stat(stem + ENTRY_SUFFIX).st_mtime
+                nbytes = os.path.getsize(stem + DATA_SUFFIX)
+            except OSError:
+                continue
+            entries.append((last_used, nbytes, stem))
+
+        total = sum(nbytes for _, nbytes, _ in entries)
+        for _, nbytes, stem in sorted(entries):
+            if total <= self.max_size:
+                break
+            self._remove_entry(stem)
+            total -= nbytes
+        return total
+
+    def clear(self):
+        """Remove all the cached objects"""
+        for file_name in os.listdir(self.cache_path):
+            if file_name.endswith(ENTRY_SUFFIX):
+                self._remove_entry(os.path.join(self.cache_path, file_name[:-len(ENTRY_SUFFIX)]))
+
+    def _forget(self, cloud_name, recursive=False):
+        self._remove_entry(self._entry_stem(cloud_name))
+        if recursive:
+            prefix = cloud_name.rstrip('/') + '/'
+            for file_name in os.listdir(self.cache_path):
+                if not file_name.endswith(ENTRY_SUFFIX):
+                    continue
+                stem = os.path.join(self.cache_path, file_name[:-len(ENTRY_SUFFIX)])
+                entry = self._read_entry(stem)
+                if (entry is not None) and entry['name'].startswith(prefix):
+                    self._remove_entry(stem)
+
+    ## Basic File IO
+
+    def download_stream(self, cloud_name, threads):
+        """Downloads an object to an in-memory stream, from the cache if up to date"""
+        cloudstream = self._open_cached(cloud_name, threads = threads)
+        if cloudstream is None:
+            return self.client.download_stream(cloud_name, threads)
+        with cloudstream.content as local_file:
+            content = BytesIO(local_file.read())
+        return CloudStream(content, cloudstream.metadata, cloudstream.size)
+
+    def download_to_file(self, cloud_name, file_name, threads):
+        """Copies an object to disk, from the cache if up to date"""
+        cloudstream = self._open_cached(cloud_name, threads = threads)
+        if cloudstream is None:
+            return self.client.download_to_file(cloud_name, file_name, threads)
+        with cloudstream.content as local_file, open(file_name, 'wb') as destination:
+            shutil.copyfileobj(local_file, destination)
+        return True
+
+    def open_stream(self, cloud_name):
+        """Opens the cached copy of an object, downloading it first if needed"""
+        cloudstream = self._open_cached(cloud_name)
+        if cloudstream is None:
+            return self.client.open_stream(cloud_name)
+        return cloudstream
+
+    def download_into(self, cloud_name, buffer, offset=0):
+        return self.download_ranges_into(cloud_name, [(offset, buffer)])
+
+    def download_ranges_into(self, cloud_name, requests, threads=1):
+        """Reads byte ranges of an object from the cache if it is up to date
+
+        Objects that are not cached are not downloaded in full;
+        the ranges are requested from the backend.
+        """
+        stem, entry, _, _ = self._lookup(cloud_name)
+        if entry is not None:
+            try:
+                with open(stem + DATA_SUFFIX, 'rb') as local_file:
+                    nbytes = 0
+                    for offset, buffer in requests:
+                        local_file.seek(offset)
+                        nbytes += read_into(local_file, buffer)
+                    return nbytes
+            except OSError:
+                pass
+        return self.client.download_ranges_into(cloud_name, requests, threads)
+
+    def download_parts_into(self, cloud_name, buffer, threads=1, offset=0, stream=None, **kwargs):
+        if (stream is not None) and self._is_cached_stream(stream):
+            return read_into(stream, buffer)
+        if stream is not None:
+            return self.client.download_parts_into(cloud_name, buffer, threads = threads, offset = offset,
+                                                   stream = stream, **kwargs)
+        # parts are read with download_ranges_into, from the cache if up to date
+        return CCBackEnd.download_parts_into(self, cloud_name, buffer, threads = threads,
+                                             offset = offset, **kwargs)
+
+    def iter_parts(self, cloud_name, nbytes, threads=1, chunksize=MPD_CHUNKSIZE, stream=None, **kwargs):
+        if (stream is not None) and self._is_cached_stream(stream):
+            return iter(lambda: stream.read(chunksize), b'')
+        return self.client.iter_parts(cloud_name, nbytes, threads = threads, chunksize = chunksize,
+                                      stream = stream, **kwargs)
+
+
+class MetadataCacheClient(WrapperClient):
+    """
+    Cache of the existence, size and metadata of objects.
+
+    Metadata requests (e.g. S3 HEAD) are answered from memory for
+    ``ttl`` seconds, including "object not found" answers. Objects
+    changed through this backend are requested again.
+    """
+
+    def __init__(self, client, ttl):
+        """
+        Parameters
+        ----------
+        client : CCBackEnd
+            backend to cache
+        ttl : float
+            how long results are kept, in seconds
+        """
+        super(MetadataCacheClient, self).__init__(client)
+        self.ttl = ttl
+        self._infos = dict()
+        self._prune_size = 1024
+        self._lock = threading.Lock()
+
+    def _key(self, cloud_name):
+        location = getattr(self.client, 'bucket_name', None) or getattr(self.client, 'path', None)
+        return (location, cloud_name)
+
+    def _forget(self, cloud_name, recursive=False):
+        with self._lock:
+            self._infos.pop(self._key(cloud_name), None)
+            if recursive:
+                prefix = cloud_name.rstrip('/') + '/'
+                for key in [key for key in self._infos if key[1].startswith(prefix)]:
+                    del self._infos[key]
+
+    def _prune(self, now):
+        """Drop expired results, once the cache has doubled in size"""
+        if len(self._infos) < self._prune_size:
+            return
+        for key in [key for key, (cached, _) in self._infos.items() if now - cached >= self.ttl]:
+            del self._infos[key]
+        self._prune_size = max(1024, 2 * len(self._infos))
+
+    def clear(self):
+        """Forget all cached results"""
+        with self._lock:
+            self._infos.clear()
+
+    def get_object_info(self, cloud_name):
+        key = self._key(cloud_name)
+        now = time.monotonic()
+        with self._lock:
+            item = self._infos.get(key)
+
+        if (item is None) or (now - item[0] >= self.ttl):
+            try:
+                info = self.client.get_object_info(cloud_name)
+            except FileNotFoundError:
+                info = None
+            item = (now, info)
+            with self._lock:
+                self._infos[key] = item
+                self._prune(now)
+
+        if item[1] is None:
+            raise FileNotFoundError('Object not found: ' + cloud_name)
+        return item[1]
+
+    def check_file_exists(self, file_name, bucket_name=None):
+        if bucket_name not in (None, getattr(self.client, 'bucket_name', None)):
+            return self.client.check_file_exists(file_name, bucket_name)
+        try:
+            self.get_object_info(file_name)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def get_object_version(self, cloud_name):
+        info = self.get_object_info(cloud_name)
+        return info['version'], info['size']
+
+    def get_object_metadata(self, cloud_name):
+        return dict(self.get_object_info(cloud_name)['metadata'])
+
+    def get_object_size(self, cloud_name):
+        return self.get_object_info(cloud_name)['size']
+
+
+class ArrayCache(object):
+    """
+    In-memory cache of downloaded arrays.
+
+    Arrays are stored with the version of the object they were
+    decoded from, and only returned while the object is unchanged.
+    The least recently used arrays are evicted when the cache grows
+    over its size budget. Cached arrays are read-only.
+    """
+
+    def __init__(self, max_size):
+        """
+        Parameters
+        ----------
+        max_size : int
+            cache budget in bytes. Larger arrays are never cached.
+        """
+        self.max_size = max_size
+        self.nbytes = 0
+        self._arrays = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._arrays)
+
+    def get(self, key, version):
+        """Get a read-only view of a cached array
+
+        Returns
+        -------
+        array : np.ndarray or None
+            None if the array is not cached, or was decoded
+            from another version of the object
+        """
+        with self._lock:
+            item = self._arrays.get(key)
+            if (item is None) or (item[0] != version):
+                return None
+            self._arrays.move_to_end(key)
+            return item[1].view()
+
+    def put(self, key, version, array):
+        """Cache an array, evicting the least recently used ones if needed
+
+        Returns
+        -------
+        array : np.ndarray
+            read-only view of the cached array, or
+            ``array`` itself if it is too large to be cached
+        """
+        if array.nbytes > self.max_size:
+            return array
+        array.flags.writeable = False
+        with self._lock:
+            self._discard(key)
+            self._arrays[key] = (version, array)
+            self.nbytes += array.nbytes
+            while self.nbytes > self.max_size:
+                self._discard(next(iter(self._arrays)))
+        return array.view()
+
+    def discard(self, key):
+        """Remove an array from the cache"""
+        with self._lock:
+            self._discard(key)
+
+    def _discard(self, key):
+        item = self._arrays.pop(key, None)
+        if item is not None:
+            self.nbytes -= item[1].nbytes
+
+    def clear(self):
+        """Remove all the cached arrays"""
+        with self._lock:
+            self._arrays.clear()
+            self.nbytes = 0
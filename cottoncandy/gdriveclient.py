@@ -7,6 +7,7 @@ from pydrive.drive import GoogleDrive
 from pydrive.files import ApiRequestError, FileNotUploadedError, GoogleDriveFile
 
 from .backend import CCBackEnd, CloudStream, FileNotFoundError
+from .utils import MPD_CHUNKSIZE, read_into
 
 # Ipython autocomplete
 try:
@@ -30,6 +31,11 @@ class GDriveClient(CCBackEnd):
     To use, you need to enable gdrive APIs and make an OAuth2 id
     """
 
+    # PyDrive seeks the stream to find its size
+    streaming_uploads = False
+    # the drive is listed one folder at a time (see ``list_directory``)
+    prefix_listing = False
+
     @staticmethod
     def Authenticate(secrets, credentials):
         """
@@ -582,6 +588,83 @@ class GDriveClient(CCBackEnd):
             f.FetchContent()
         return CloudStream(f.content, properties)
 
+    def open_stream(self, drive_file):
+        """Opens a file for sequential reading
+
+        The file is downloaded to memory first.
+        """
+        return self.download_stream(drive_file)
+
+    def download_into(self, drive_file, buffer, offset=0):
+        """Downloads part of a file directly into a writable buffer
+
+        Google drive does not serve byte ranges through pydrive,
+        so the whole file is fetched and the range is copied.
+
+        Parameters
+        ----------
+        drive_file : str
+            name of file to download
+        buffer : writable buffer
+            destination of the data. ``len(buffer)`` bytes are copied.
+        offset : int
+            position of the first byte to copy
+
+        Returns
+        -------
+        : int
+            number of bytes copied
+        """
+        content = self.download_stream(drive_file).content
+        content.seek(offset)
+        return read_into(content, buffer)
+
+    def download_ranges_into(self, drive_file, requests, threads=1):
+        """Downloads several byte ranges of a file
+
+        The file is fetched once and every range is copied from it.
+
+        Parameters
+        ----------
+        drive_file : str
+            name of file to download
+        requests : list of (offset, buffer) tuples
+            each buffer is filled with the bytes starting at offset
+        threads : int
+            unused
+
+        Returns
+        -------
+        : int
+            number of bytes copied
+        """
+        content = self.download_stream(drive_file).content
+        nbytes = 0
+        for offset, buffer in requests:
+            content.seek(offset)
+            nbytes += read_into(content, buffer)
+        return nbytes
+
+    def download_parts_into(self, drive_file, buffer, threads=1, offset=0, stream=None, **kwargs):
+        """Downloads a file into a writable buffer
+
+        Multi-part downloads are not available on Google drive,
+        so the file is downloaded once, unless it is already open.
+        """
+        if stream is not None:
+            return read_into(stream, buffer)
+        return self.download_into(drive_file, buffer, offset)
+
+    def iter_parts(self, drive_file, nbytes, threads=1, chunksize=MPD_CHUNKSIZE, stream=None, **kwargs):
+        """Downloads the consecutive parts of a file
+
+        The file is downloaded once, unless it is already open,
+        and read ``chunksize`` bytes at a time.
+        """
+        if stream is None:
+            stream = self.download_stream(drive_file).content
+        return iter(lambda: stream.read(chunksize), b'')
+
     #### Misc helper functions
 
     def check_ID_exists(self, id):
@@ -1,9 +1,11 @@
-import fnmatch
+import itertools
 import json
 import os
 import pickle
 import re
-from gzip import GzipFile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO as StringIO
 from urllib.parse import unquote
 from warnings import warn
@@ -13,34 +15,66 @@ import six
 import cottoncandy.browser
 from cottoncandy.backend import FileNotFoundError
 
+from .cacheclient import ArrayCache, CacheClient, MetadataCacheClient
+from .listindex import IndexedClient
+from .listing import Listing
 from .options import config
-from .s3client import S3Client, botocore
+from .s3client import TRANSFER_ERRORS, S3Client, botocore
 from .utils import (
+    ARRAY_CACHE_SIZE,
+    CACHE_PATH,
+    CACHE_SIZE,
+    COMPRESSION_WORKERS,
     DASK_CHUNKSIZE,
     DEFAULT_ACL,
+    LISTING_MAX_AGE,
     MAGIC_CHECK,
     MB,
+    METADATA_TTL,
+    MPD_CHUNKSIZE,
+    MPD_THRESHOLD,
+    MPU_CHUNKSIZE,
     SEPARATOR,
+    SUBMIT_WORKERS,
     THREADS,
+    USE_CACHE,
+    USE_LISTING_INDEX,
     GzipInputStream,
+    IterStream,
+    bytes2human,
+    check_output_array,
     clean_object_name,
+    contiguous_runs,
+    decode_frames,
+    encode_frames,
+    file_etag,
     generate_ndarray_chunks,
-    get_fileobject_size,
+    glob_regex,
+    gzip_chunks,
     has_magic,
     has_real_magic,
+    iter_array_windows,
     mk_aws_path,
-    objects2names,
+    normalize_row_index,
+    ordered_map,
+    parse_array_metadata,
     pathjoin,
+    print_listing,
     print_objects,
     read_buffered,
+    read_into,
+    read_npy_header,
     remove_root,
     remove_trivial_magic,
-    string2bool,
+    split_byte_range,
+    translate_glob,
 )
 
 DO_COMPRESSION = config.get('compression', 'do_compression').lower() in ('true', 't', 'y', 'yes')
 COMPRESSION_SMALL = config.get('compression', 'small_array')
 COMPRESSION_LARGE = config.get('compression', 'large_array')
+COMPRESSION_FRAME_NBYTES = int(config.get('compression', 'frame_size')) * MB
+COMPRESSION_INFLIGHT_FRAMES = int(config.get('compression', 'inflight_frames'))
 
 try:
     import numpy as np
@@ -58,6 +92,23 @@ except ImportError:
 # Cloud Interfaces
 # ------------------
 
+def _submitter(method_name):
+    """Make the ``submit_<method_name>`` method of an interface"""
+    def submit_method(self, *args, **kwargs):
+        return self.submit(method_name, *args, **kwargs)
+    submit_method.__name__ = 'submit_' + method_name
+    submit_method.__doc__ = """Like ``%s``, but runs in the interface's executor
+
+        See ``submit``.
+
+        Returns
+        -------
+        future : concurrent.futures.Future
+            Resolves to the result of ``%s``
+        """ % (method_name, method_name)
+    return submit_method
+
+
 class InterfaceObject:
     pass
 
@@ -69,7 +120,8 @@ class BasicInterface(InterfaceObject):
     def __init__(self, bucket_name,
                  ACCESS_KEY, SECRET_KEY, url=None,
                  force_bucket_creation=False,
-                 verbose=True, backend='s3', **kwargs):
+                 verbose=True, backend='s3', cache=None, metadata_ttl=None, listing_index=None,
+                 submit_workers=None, **kwargs):
         """
         Parameters
         ----------
@@ -86,6 +138,22 @@ class BasicInterface(InterfaceObject):
             print things?
         backend: 's3'|'gdrive'
             Access s3 or google drive?
+        cache : bool, optional
+            Keep a local copy of downloaded objects, and read it again
+            while the object is unchanged. Defaults to the ``[cache]``
+            configuration, which also sets the cache directory and size.
+        metadata_ttl : float, optional
+            Remember for this many seconds whether objects exist, and
+            their size and metadata (0 disables). Changes made through
+            this interface are seen immediately. Defaults to the
+            ``[cache]`` configuration.
+        listing_index : bool, optional
+            Keep a local SQLite index of the objects, used by ``glob``,
+            ``ls``, ``lsdir`` and ``get_size`` instead of listing the
+            bucket every time. Defaults to the ``[cache]`` configuration.
+        submit_workers : int, optional
+            Number of threads of the executor that runs the ``submit_*``
+            methods. Defaults to the ``[basic]`` configuration.
         kwargs : dict,
             S3 only. Passed to backend.
 
@@ -109,6 +177,25 @@ class BasicInterface(InterfaceObject):
         else:
             raise ValueError('Bad backend')
 
+        if metadata_ttl is None:
+            metadata_ttl = METADATA_TTL
+        if metadata_ttl:
+            self.backend_interface = MetadataCacheClient(self.backend_interface, metadata_ttl)
+
+        if listing_index is None:
+            listing_index = USE_LISTING_INDEX
+        self._indexed_client = None
+        if listing_index and self.backend_interface.prefix_listing:
+            self.backend_interface = IndexedClient(self.backend_interface,
+                                                   os.path.join(CACHE_PATH, 'listings'),
+                                                   LISTING_MAX_AGE)
+            self._indexed_client = self.backend_interface
+
+        if cache is None:
+            cache = USE_CACHE
+        if cache:
+            self.backend_interface = CacheClient(self.backend_interface, CACHE_PATH, CACHE_SIZE)
+
         if verbose:
             if backend == 's3' and bucket_name:
                 print('Available buckets:')
@@ -120,6 +207,9 @@ class BasicInterface(InterfaceObject):
                 print('Local backend instantiated.')
 
         self.backend = backend
+        self.submit_workers = SUBMIT_WORKERS if submit_workers is None else submit_workers
+        self._executor = None
+        self._executor_lock = threading.Lock()
 
     def __repr__(self):
         if self.backend == "s3":
@@ -131,6 +221,84 @@ class BasicInterface(InterfaceObject):
             details = (__package__, self.backend_interface.path)
             return '%s.backend_interface on local machine (%s)' % details
 
+    @property
+    def executor(self):
+        """Thread pool shared by the ``submit_*`` methods, created on first use"""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers = self.submit_workers,
+                                                    thread_name_prefix = 'cottoncandy')
+            return self._executor
+
+    def submit(self, method, *args, **kwargs):
+        """Run an interface method in the background
+
+        The calls are run by ``executor``, whose ``submit_workers``
+        threads are shared by all the ``submit_*`` methods of the
+        interface. Each call still uses its own ``threads`` for the
+        parts of large objects.
+
+        Parameters
+        ----------
+        method : str or callable
+            Name of an interface method (e.g. ``'download_raw_array'``),
+            or any function
+        args, kwargs :
+            Passed to the method
+
+        Returns
+        -------
+        future : concurrent.futures.Future
+            Resolves to the result of the method, or raises its error
+
+        Example
+        -------
+        >>> futures = [cci.submit_download_raw_array(name) for name in names]
+        >>> arrays = [future.result() for future in futures]
+        """
+        function = getattr(self, method) if isinstance(method, str) else method
+        return self.executor.submit(function, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        """Stop the executor of the ``submit_*`` methods
+
+        Parameters
+        ----------
+        wait : bool
+            Wait for the submitted calls to finish. A new executor
+            is created if more calls are submitted.
+        """
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait = wait)
+
+    @property
+    def listing_index(self):
+        """Local index of the objects in the current bucket, or None"""
+        if self._indexed_client is None:
+            return None
+        return self._indexed_client.index
+
+    def update_index(self, prefix='', incremental=False):
+        """List the objects under ``prefix`` into the local listing index
+
+        Parameters
+        ----------
+        prefix : str
+        incremental : bool
+            Only add the objects whose name comes after the last indexed
+            object under ``prefix``. Deleted objects are not detected.
+
+        Returns
+        -------
+        int, number of objects listed
+        """
+        if self.listing_index is None:
+            raise ValueError('The listing index is not enabled (see `listing_index`)')
+        return self.listing_index.update(remove_root(prefix) if prefix else prefix,
+                                         incremental = incremental)
+
     def _get_bucket_name(self, bucket_name):
         return self.backend_interface._get_bucket_name(bucket_name)
 
@@ -235,6 +403,32 @@ class BasicInterface(InterfaceObject):
         """
         return self.backend_interface.list_objects(**kwargs)
 
+    def iter_objects(self, prefix='', page_size=1000, threads=1):
+        """Lazily list the objects whose name starts with ``prefix``
+
+        The listing is requested one page at a time while it is
+        consumed, so memory use does not depend on the number of
+        objects. If the listing index is enabled, the objects are
+        read from the index instead. Not available on google drive.
+
+        Parameters
+        ----------
+        prefix : str
+        page_size : int (default: 1,000)
+            Number of objects per request
+        threads : int (default: 1)
+            Number of concurrent requests. Large listings are split
+            into key ranges that are listed in parallel (S3 only).
+
+        Yields
+        ------
+        (name, size, etag, mtime) tuples, in lexicographic order of
+        the (quoted) names
+        """
+        if self.listing_index is not None:
+            return self.listing_index.iter_objects(prefix, page_size = page_size)
+        return self.backend_interface.iter_objects(prefix, page_size = page_size, threads = threads)
+
     def get_bucket_size(self, limit=10**6, page_size=10**6):
         """Counts the size of all objects in the current bucket.
 
@@ -249,14 +443,6 @@ class BasicInterface(InterfaceObject):
         -------
         total_bytes : int
             The byte count of all objects in the bucket.
-
-        Notes
-        -----
-        Because paging does not work properly, if there are more than
-        limit,page_size number of objects in the bucket, this function will
-        underestimate the total size. Check the printed number of objects for
-        suspicious round numbers.
-        TODO(anunez): Remove this note when the bug is fixed.
         """
         warn('Deprecated, use get_size() instead', DeprecationWarning)
         return self.backend_interface.size
@@ -272,6 +458,11 @@ class BasicInterface(InterfaceObject):
         -------
 
         """
+        if self.listing_index is not None:
+            num_objects, total_bytes = self.listing_index.total_size()
+            txt = "%i bytes (%s) over %i objects"
+            print(txt % (total_bytes, bytes2human(total_bytes), num_objects))
+            return total_bytes
         return self.backend_interface.size
 
     def show_buckets(self):
@@ -353,24 +544,99 @@ class BasicInterface(InterfaceObject):
         return self.backend_interface.upload_file(flname, object_name, ExtraArgs['ACL'], threads)
 
     def upload_from_directory(self, disk_path, cloud_path=None,
-                              recursive=False, ExtraArgs=dict(ACL=DEFAULT_ACL), threads = THREADS):
-        '''Upload a directory to the cloud
+                              recursive=False, ExtraArgs=dict(ACL=DEFAULT_ACL), threads = THREADS,
+                              checksum=False):
+        '''Upload a directory to the cloud, skipping the files already uploaded
+
+        The remote objects are listed once. A file is skipped if an
+        object with the same size is newer than the file (or, with
+        ``checksum=True``, has the same ETag). The other files are
+        uploaded by ``threads`` concurrent workers, one file per
+        worker. Running it again after a partial failure only
+        uploads the files that are missing or changed. On google
+        drive, which cannot be listed this way, all the files are
+        uploaded, one at a time.
+
+        Parameters
+        ----------
+        disk_path : str
+            Directory to upload
+        cloud_path : str, None
+            Prefix of the uploaded objects. If None, use ``disk_path``
+        recursive : bool
+            Also upload the sub-directories
+        ExtraArgs : dict
+            Defaults ``dict(ACL=DEFAULT_ACL)``
+        threads : int
+            Number of files uploaded concurrently
+        checksum : bool
+            Compare the MD5 of the files to the ETag of the objects,
+            instead of their modification times (S3 only)
+
+        Returns
+        -------
+        summary : dict
+            ``transferred`` and ``skipped`` object names, and
+            ``failed`` (object name, error message) tuples
         '''
-        filenames = sorted(os.listdir(disk_path))
         if cloud_path is None:
             cloud_path = disk_path
-        for flname in filenames:
-            flpath = os.path.join(disk_path, flname)
-            obname = self.pathjoin(cloud_path, flname)
-            if os.path.isfile(flpath):
-                self.upload_from_file(flpath, obname, ExtraArgs=ExtraArgs, threads = threads)
-            elif os.path.isdir(flpath):
-                if recursive:
-                    self.upload_from_directory(flpath, obname,
-                                               recursive=recursive,
-                                               ExtraArgs=ExtraArgs,
-                                               threads = threads)
-        print('Uploaded "%s" to "%s"' % (disk_path, cloud_path))
+        cloud_path = re.sub('//+', '/', cloud_path)
+        if cloud_path not in ('', SEPARATOR):
+            cloud_path = remove_root(cloud_path)
+
+        remote = dict()
+        if self.backend_interface.prefix_listing:
+            remote = dict((name, (size, etag, mtime)) for name, size, etag, mtime
+                          in self.iter_objects(mk_aws_path(cloud_path), threads = threads))
+        else:
+            # nothing to compare the files to, and the drive is
+            # navigated by changing the current directory
+            threads = 1
+
+        def local_files():
+            for root, directories, files in os.walk(disk_path):
+                directories.sort()
+                for flname in sorted(files):
+                    flpath = os.path.join(root, flname)
+                    relative = os.path.relpath(flpath, disk_path).replace(os.sep, SEPARATOR)
+                    yield flpath, self.pathjoin(cloud_path, relative)
+                if not recursive:
+                    break
+
+        def is_uploaded(flpath, obname):
+            if obname not in remote:
+                return False
+            size, etag, mtime = remote[obname]
+            stat = os.stat(flpath)
+            if stat.st_size != size:
+                return False
+            if checksum and (etag is not None):
+                return etag.strip('"') == file_etag(flpath)
+            # object times have a resolution of one second
+            return (mtime is not None) and (mtime >= int(stat.st_mtime))
+
+        def upload(item):
+            flpath, obname = item
+            try:
+                if is_uploaded(flpath, obname):
+                    return 'skipped', obname, None
+                self.backend_interface.upload_file(flpath, obname, ExtraArgs['ACL'], 1)
+            except TRANSFER_ERRORS as error:
+                return 'failed', obname, str(error)
+            return 'transferred', obname, None
+
+        summary = dict(transferred=[], skipped=[], failed=[])
+        for status, obname, message in ordered_map(upload, local_files(), workers = threads):
+            if status == 'failed':
+                summary['failed'].append((obname, message))
+                print('cannot upload %s: %s' % (obname, message))
+            else:
+                summary[status].append(obname)
+        print('Uploaded "%s" to "%s": %i transferred, %i skipped, %i failed' %
+              (disk_path, cloud_path, len(summary['transferred']), len(summary['skipped']),
+               len(summary['failed'])))
+        return summary
 
     @clean_object_name
     def download_to_file(self, object_name, file_name, threads = THREADS):
@@ -469,12 +735,23 @@ class BasicInterface(InterfaceObject):
         obj = self.download_object(object_name, threads = threads)
         return pickle.loads(obj)
 
+    submit_upload_object = _submitter('upload_object')
+    submit_download_object = _submitter('download_object')
+    submit_upload_from_file = _submitter('upload_from_file')
+    submit_upload_from_directory = _submitter('upload_from_directory')
+    submit_download_to_file = _submitter('download_to_file')
+    submit_upload_json = _submitter('upload_json')
+    submit_download_json = _submitter('download_json')
+    submit_upload_pickle = _submitter('upload_pickle')
+    submit_download_pickle = _submitter('download_pickle')
+    submit_exists_object = _submitter('exists_object')
+
 
 class ArrayInterface(BasicInterface):
     """Provides numpy.array concepts.
     """
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, array_cache=None, **kwargs):
         """
         Parameters
         ----------
@@ -485,6 +762,9 @@ class ArrayInterface(BasicInterface):
             The URL for the S3 gateway
         force_bucket_creation : bool
             Create requested bucket if it doesn't exist
+        array_cache : int, optional
+            Size in bytes of the in-memory cache of downloaded arrays
+            (0 disables it). Defaults to the ``[cache]`` configuration.
 
         Returns
         -------
@@ -492,6 +772,14 @@ class ArrayInterface(BasicInterface):
             Cottoncandy interface object
         """
         super(ArrayInterface, self).__init__(*args, **kwargs)
+        if array_cache is None:
+            array_cache = ARRAY_CACHE_SIZE
+        self.array_cache = ArrayCache(array_cache) if array_cache else None
+
+    def _array_cache_key(self, object_name):
+        location = (getattr(self.backend_interface, 'bucket_name', None) or
+                    getattr(self.backend_interface, 'path', None))
+        return (self.backend, location, object_name)
 
     @clean_object_name
     def upload_npy_array(self, object_name, array, acl=DEFAULT_ACL, threads = THREADS, **metadata):
@@ -526,7 +814,7 @@ class ArrayInterface(BasicInterface):
         return response
 
     @clean_object_name
-    def download_npy_array(self, object_name, threads = THREADS):
+    def download_npy_array(self, object_name, threads = THREADS, out = None):
         """Download a np.ndarray uploaded using ``np.save`` with ``np.load``.
 
         Parameters
@@ -534,21 +822,38 @@ class ArrayInterface(BasicInterface):
         object_name : str
         threads: int
         	number of connection threads to use
+        out : np.ndarray or writable buffer, optional
+            Preallocated array (e.g. ``np.memmap``) of the right shape and
+            dtype, or a buffer (e.g. ``SharedMemory.buf``), filled in place.
 
         Returns
         -------
         array : np.ndarray
+            ``out`` (or a view of it) when given.
         """
-        self.exists_object(object_name, raise_err=True)
-        array = np.load(StringIO(self.download_object(object_name, threads)))
+        if out is None:
+            self.exists_object(object_name, raise_err=True)
+            array = np.load(StringIO(self.download_object(object_name, threads)))
+            return array
+
+        arraystream = self.backend_interface.open_stream(object_name)
+        try:
+            shape, fortran_order, dtype = read_npy_header(arraystream.content)
+            array = check_output_array(out, shape, dtype, 'F' if fortran_order else 'C')
+            read_into(arraystream.content, array.reshape(-1, order = 'A').view(np.uint8))
+        finally:
+            arraystream.content.close()
         return array
 
     @clean_object_name
-    def upload_raw_array(self, object_name, array, compression=DO_COMPRESSION, acl=DEFAULT_ACL, threads = THREADS, **metadata):
+    def upload_raw_array(self, object_name, array, compression=DO_COMPRESSION, acl=DEFAULT_ACL, threads = THREADS,
+                         workers = COMPRESSION_WORKERS, **metadata):
         """Upload a binary representation of a np.ndarray
 
         This method reads the array content from memory to upload.
-        It does not have any overhead.
+        It does not have any overhead. Arrays stored on disk (``np.memmap``)
+        are read sequentially, one multi-part upload part at a time,
+        without loading them into memory.
 
         Parameters
         ----------
@@ -562,12 +867,50 @@ class ArrayInterface(BasicInterface):
             ACL for the object
         threads: int
         	number of connection threads to use
+        workers : int
+            number of frames compressed in parallel with ``numcodecs``
+            compression. Defaults to the ``[compression]`` configuration.
+            At most ``workers + 1`` frames are held in memory while
+            compressing. This can be capped with ``inflight_frames``.
         **metadata : optional
 
         Notes
         -----
         This method also uploads the array ``dtype``, ``shape``, and ``gzip``
         flag as metadata
+
+        Compressed arrays are streamed: the compressed data is uploaded as it
+        is produced, and at most ``mpu_inflight_parts`` multi-part upload parts
+        are held in memory (see the ``[upload_settings]`` configuration).
+
+        With ``numcodecs`` compression, arrays larger than ``frame_size`` MB
+        (see the ``[compression]`` configuration) are compressed in frames of
+        that size. Each frame is stored after a header with its compressed
+        size, and the number of elements per frame is stored in the
+        ``framesize`` metadata. Smaller, non-empty arrays are stored as a
+        single compressed buffer, without header nor ``framesize``, which
+        older versions of cottoncandy can read.
+        """
+        filestream, meta = self._raw_array_stream(array, compression, workers, **metadata)
+        body = filestream
+        if not self.backend_interface.streaming_uploads:
+            # the backend needs a seekable body of known size
+            body = StringIO(filestream.read())
+        response = self.upload_object(object_name, body, acl=acl, threads = threads, **meta)
+        if (meta['compression'] != 'False') and array.nbytes:
+            print('Compressed to %0.2f%% the size' % (filestream.tell() / float(array.nbytes) * 100))
+        return response
+
+    def _raw_array_stream(self, array, compression=DO_COMPRESSION, workers=COMPRESSION_WORKERS, **metadata):
+        """Stream of the bytes uploaded by ``upload_raw_array``
+
+        The array is compressed while the stream is read.
+
+        Returns
+        -------
+        filestream : IterStream
+        meta : dict
+            The metadata of the object
         """
         if compression is None:
             compression = False
@@ -588,7 +931,7 @@ class ArrayInterface(BasicInterface):
                 raise ValueError("gzip does not support compression of >2GB arrays. "
                                   "Try `compression='Zstd'` instead.")
 
-        order = 'C' if array.flags.carray else 'F'
+        order = 'C' if array.flags['C_CONTIGUOUS'] else 'F'
         if ((not array.flags['%s_CONTIGUOUS' % order] and six.PY2) or
                 (not array.flags['C_CONTIGUOUS'] and six.PY3)):
             warn('Non-contiguous array. Creating copy (will use extra memory)...')
@@ -616,33 +959,39 @@ class ArrayInterface(BasicInterface):
         meta.update(metadata)
 
         if compression is False:
-            filestream = StringIO(array.data)
+            # read from the array memory while being uploaded
+            windows = iter_array_windows(array, max(MPU_CHUNKSIZE // array.itemsize, 1))
+            filestream = IterStream(windows)
         elif compression == 'gzip':
-            if six.PY3 and array.flags['F_CONTIGUOUS']:
-                # eventually, array.data below should be changed to np.getbuffer(array)
-                # (not yet working in python3 numpy)
-                # F-contiguous arrays break gzip in python 3
-                array = array.T
-            zipdata = StringIO()
-            gz = GzipFile(mode='wb', fileobj=zipdata)
-            gz.write(array.data)
-            gz.close()
-            zipdata.seek(0)
-            filestream = zipdata
+            # compressed while being uploaded
+            filestream = IterStream(gzip_chunks(array))
         elif hasattr(numcodecs, compression.lower()):
-            # If the specified compression type is in numcodecs, use numcodecs
-            orig_nbytes = array.nbytes
+            # If the specified compression type is in numcodecs, use numcodecs.
+            # The array is compressed in independently decodable frames
+            # while being uploaded.
             compressor = numcodecs.get_codec(dict(id=compression.lower()))
-            filestream = StringIO(compressor.encode(array))
-            data_nbytes = get_fileobject_size(filestream)
-            print('Compressed to %0.2f%% the size' % (data_nbytes / float(orig_nbytes) * 100))
+            frame_size = max(COMPRESSION_FRAME_NBYTES // array.itemsize, 1)
+            if 0 < array.size <= frame_size:
+                # a single frame: keep the unframed layout (empty
+                # arrays are stored as zero frames)
+                filestream = IterStream(iter([compressor.encode(array.reshape(-1, order='A'))]))
+            else:
+                meta['framesize'] = str(frame_size)
+                if COMPRESSION_INFLIGHT_FRAMES and (workers + 1 > COMPRESSION_INFLIGHT_FRAMES):
+                    # the frames compressed ahead (workers + 1) fit in the frame budget
+                    limit = max(COMPRESSION_INFLIGHT_FRAMES - 1, 1)
+                    warn('Compressing with %i workers instead of %i (inflight_frames = %i)'
+                         % (limit, workers, COMPRESSION_INFLIGHT_FRAMES))
+                    workers = limit
+                filestream = IterStream(encode_frames(compressor, array, frame_size, workers = workers))
         else:
             raise ValueError('Unknown compression scheme: %s' % compression)
-        response = self.upload_object(object_name, filestream, acl=acl, threads = threads, **meta)
-        return response
+
+        return filestream, meta
 
     @clean_object_name
-    def download_raw_array(self, object_name, buffersize=2**16, threads = THREADS, **kwargs):
+    def download_raw_array(self, object_name, buffersize=2**16, threads = THREADS, index=None, out=None,
+                           mmap_path=None, copy=False, **kwargs):
         """Download a binary np.ndarray and return an np.ndarray object
         This method downloads an array without any disk or memory overhead.
 
@@ -652,58 +1001,191 @@ class ArrayInterface(BasicInterface):
         buffersize  : optional (defaults 2^16)
         threads: int
         	number of connection threads to use
+        index : int, slice, list of int, boolean mask, or tuple, optional
+            Only download part of the array. The first element selects
+            along the first axis (e.g. ``slice(1000, 2000)`` or ``[3, 7, 8]``).
+            For uncompressed arrays, only the bytes of the selected rows
+            are requested. The remaining elements of a tuple index
+            are applied in memory.
+        out : np.ndarray or writable buffer, optional
+            Preallocated array (e.g. ``np.memmap``) of the right shape and
+            dtype, or a buffer (e.g. ``SharedMemory.buf``), filled in place.
+            Useful to avoid allocating a new array for every download.
+        mmap_path : str, optional
+            Download the array to this local file and return it as a
+            ``np.memmap``. This allows working with arrays larger than memory.
+            If the name ends with ".npy", the file is a ``.npy`` file that can
+            be opened with ``np.load(mmap_path, mmap_mode='r')``. Otherwise, it
+            contains the raw array bytes.
+        copy : bool
+            With the array cache (see ``array_cache``), return a writable
+            copy of the cached array instead of a read-only view.
 
         Returns
         -------
         array : np.ndarray
+            ``out`` (or a view of it) when given. A ``np.memmap``
+            when ``mmap_path`` is given. A read-only view of the cached
+            array when the array cache is enabled, unless ``copy=True``.
 
         Notes
         -----
         The object must have metadata containing: shape, dtype and a gzip
         boolean flag. This is all automatically handled by ``upload_raw_array``.
-        """
-        self.exists_object(object_name, raise_err=True)
-
-        arraystream = self.download_stream(object_name, threads = threads)
 
-        shape = arraystream.metadata['shape']
-        shape = tuple(map(int, shape.split(',')) if shape else ())
-        dtype = np.dtype(arraystream.metadata['dtype'])
-        order = arraystream.metadata.get('order', 'C')
-        array = np.empty(tuple(shape), dtype = dtype, order = order)
-
-        body = arraystream.content
+        Examples
+        --------
+        >>> arr = cci.download_raw_array('fmri/sub01', index=slice(1000, 2000))
+        >>> arr = cci.download_raw_array('fmri/sub01', index=([3, 7, 8], slice(0, 10)))
+        """
+        cache_key = None
+        if (self.array_cache is not None) and (out is None) and (mmap_path is None):
+            # the cached array is used while the object is unchanged
+            version, _ = self.backend_interface.get_object_version(object_name)
+            if version is not None:
+                cache_key = self._array_cache_key(object_name)
+                array = self.array_cache.get(cache_key, version)
+                if array is not None:
+                    if index is not None:
+                        array = array[index]
+                    return array.copy() if (copy and not array.flags.writeable) else array
+
+        if index is not None:
+            if (out is not None) or (mmap_path is not None):
+                raise ValueError('`out` and `mmap_path` cannot be used together with `index`')
+            return self._download_raw_array_selection(object_name, index, threads = threads)
+
+        if mmap_path is not None:
+            if out is not None:
+                raise ValueError('`out` cannot be used together with `mmap_path`')
+            metadata = self.backend_interface.get_object_metadata(object_name)
+            shape, dtype, order, compression = parse_array_metadata(metadata)
+            if mmap_path.endswith('.npy'):
+                out = np.lib.format.open_memmap(mmap_path, mode = 'w+', dtype = dtype, shape = shape,
+                                                fortran_order = (order == 'F'))
+            elif compression == 'False':
+                # the object already has the layout of the file
+                self.download_to_file(object_name, mmap_path, threads = threads)
+                return np.memmap(mmap_path, mode = 'r+', dtype = dtype, shape = shape, order = order)
+            else:
+                out = np.memmap(mmap_path, mode = 'w+', dtype = dtype, shape = shape, order = order)
+            array = self.download_raw_array(object_name, buffersize = buffersize, threads = threads, out = out)
+            array.flush()
+            return array
 
+        # a single GET returns both the metadata and the body
+        arraystream = self.backend_interface.open_stream(object_name)
+        with arraystream.content as body:
+            metadata = arraystream.metadata
+            shape, dtype, order, compression = parse_array_metadata(metadata)
+            if out is None:
+                array = np.empty(shape, dtype = dtype, order = order)
+            else:
+                array = check_output_array(out, shape, dtype, order)
 
-        if 'gzip' in arraystream.metadata:
-            # Backward compatibility, over-write "compression" value
-            isgzipped = string2bool(arraystream.metadata['gzip'])
-            if isgzipped:
-                arraystream.metadata['compression'] = 'gzip'
+            if compression == 'False':
+                # uncompressed data: parts are written straight into the array
+                self._download_into_array(object_name, array, threads = threads, stream = body)
             else:
-                arraystream.metadata['compression'] = 'False'
+                stream = body
+                if arraystream.size is not None:
+                    # compressed parts are downloaded in parallel and decoded in order
+                    stream = IterStream(self.backend_interface.iter_parts(object_name, arraystream.size,
+                                                                          threads = threads, stream = body))
+                self._decode_raw_array(stream, array, compression, metadata.get('framesize'), buffersize)
+
+        if cache_key is not None:
+            array = self.array_cache.put(cache_key, version, array)
+            if copy and not array.flags.writeable:
+                return array.copy()
+        return array
 
-        assert 'compression' in arraystream.metadata
+    @staticmethod
+    def _decode_raw_array(stream, array, compression, framesize=None, buffersize=2**16):
+        """Decode a compressed raw array from a stream into ``array``
 
-        if arraystream.metadata['compression'] == 'gzip':
+        ``compression`` and ``framesize`` come from the object metadata
+        (see ``parse_array_metadata``).
+        """
+        if framesize is not None:
+            # numcodecs frames: decode each one as soon as it arrives
+            decompressor = numcodecs.get_codec(dict(id=compression.lower()))
+            decode_frames(stream, decompressor, array, int(framesize))
+        elif compression == 'gzip':
             # gzipped!
-            datastream = GzipInputStream(body)
-        elif arraystream.metadata['compression'] in ['False', 'None']:
-            # uncompressed data
-            datastream = body
+            read_buffered(GzipInputStream(stream), array, buffersize=buffersize)
         else:
-            # numcodecs compression
-            compression = arraystream.metadata['compression']
+            # numcodecs compression, single frame (older objects)
             decompressor = numcodecs.get_codec(dict(id=compression.lower()))
             # Can't decode stream; must read in file. Memory hungry?
-            bits_compr = arraystream.content.read()
-            bits = decompressor.decode(bits_compr)
-            array = np.frombuffer(bits, dtype=dtype)
-            array = array.reshape(shape)
-            return array
+            decompressor.decode(stream.read(), out=array)
 
-        read_buffered(datastream, array, buffersize=buffersize)
-        return array
+    def _download_into_array(self, object_name, array, threads = THREADS, offset = 0, stream = None):
+        """Fill a contiguous array with the raw bytes of an object
+
+        Large objects are split into ``mpd_chunksize`` parts that are
+        downloaded in parallel, each one written directly into the
+        memory of ``array``. If the object is already open, the first
+        part is read from ``stream``.
+        No intermediate buffer is allocated.
+        """
+        data = array.reshape(-1, order = 'A').view(np.uint8)
+        self.backend_interface.download_parts_into(object_name, data, threads = threads, offset = offset,
+                                                   stream = stream)
+
+    def _download_raw_array_selection(self, object_name, index, threads = THREADS):
+        """Download the rows of a raw array selected by ``index``
+
+        Only the byte ranges covering the selected rows are downloaded.
+        Adjacent rows are coalesced into a single ranged request, long
+        runs are split into ``mpd_chunksize`` parts, and the requests
+        are issued in parallel. Compressed arrays are
+        downloaded in full and indexed in memory.
+        """
+        metadata = self.backend_interface.get_object_metadata(object_name)
+        shape, dtype, order, compression = parse_array_metadata(metadata)
+
+        row_index, extra_index = index, ()
+        if isinstance(index, tuple):
+            row_index, extra_index = (index[0], index[1:]) if len(index) else (slice(None), ())
+
+        contiguous_rows = (order == 'C') or (len(shape) <= 1)
+        if (compression != 'False') or (not contiguous_rows) or (len(shape) == 0) or \
+           (row_index is Ellipsis) or (row_index is None):
+            # byte ranges do not map onto rows
+            array = self.download_raw_array(object_name, threads = threads)
+            return array[index]
+
+        rows, squeeze = normalize_row_index(row_index, shape[0])
+        unique_rows, inverse = np.unique(rows, return_inverse=True)
+
+        row_nbytes = int(np.prod(shape[1:], dtype=np.int64)) * dtype.itemsize
+        array = np.empty((len(unique_rows),) + shape[1:], dtype = dtype)
+
+        # long runs are split into parts, like a multi-part download
+        requests = []
+        position = 0
+        for start, stop in contiguous_runs(unique_rows):
+            nrows = stop - start
+            data = array[position:position + nrows].reshape(-1).view(np.uint8)
+            parts = [(0, data.nbytes)]
+            if data.nbytes >= MPD_THRESHOLD:
+                parts = split_byte_range(data.nbytes, MPD_CHUNKSIZE)
+            requests.extend((start * row_nbytes + first, data[first:last]) for first, last in parts)
+            position += nrows
+        self.backend_interface.download_ranges_into(object_name, requests, threads = threads)
+
+        # remap the row index onto the downloaded rows and apply the
+        # whole index at once, so that advanced indices broadcast together
+        if squeeze:
+            block_index = 0
+        elif isinstance(row_index, slice):
+            block_index = slice(None, None, -1 if row_index.indices(shape[0])[2] < 0 else None)
+        elif (not extra_index) and np.array_equal(unique_rows, rows):
+            block_index = slice(None)
+        else:
+            block_index = inverse.ravel()
+        return array[(block_index,) + extra_index]
 
     @clean_object_name
     def dict2cloud(self, object_name, array_dict, acl=DEFAULT_ACL,
@@ -990,6 +1472,17 @@ class ArrayInterface(BasicInterface):
 
         return arr
 
+    submit_upload_npy_array = _submitter('upload_npy_array')
+    submit_download_npy_array = _submitter('download_npy_array')
+    submit_upload_raw_array = _submitter('upload_raw_array')
+    submit_download_raw_array = _submitter('download_raw_array')
+    submit_upload_dask_array = _submitter('upload_dask_array')
+    submit_download_dask_array = _submitter('download_dask_array')
+    submit_upload_sparse_array = _submitter('upload_sparse_array')
+    submit_download_sparse_array = _submitter('download_sparse_array')
+    submit_dict2cloud = _submitter('dict2cloud')
+    submit_cloud2dict = _submitter('cloud2dict')
+
 
 class FileSystemInterface(BasicInterface):
     """Emulate some file system functionality.
@@ -1014,22 +1507,94 @@ class FileSystemInterface(BasicInterface):
         """
         super(FileSystemInterface, self).__init__(*args, **kwargs)
 
-    def lsdir(self, path='/', limit=10**3):
+    def _split_prefix(self, prefix, page_size=1000):
+        """Objects directly under ``prefix``, and its sub-prefixes"""
+        if self.listing_index is not None:
+            return self.listing_index.split_prefix(prefix)
+        if not self.backend_interface.prefix_listing:
+            # the children of a directory may be files or directories:
+            # return them as both, listing a file gives nothing
+            directory, sep, head = prefix.rpartition(SEPARATOR)
+            names = [directory + sep + name for name in self.lsdir(directory) or []
+                     if name.startswith(head)]
+            return [(name, None, None, None) for name in names], [name + SEPARATOR for name in names]
+        return self.backend_interface.split_prefix(prefix, page_size = page_size)
+
+    def _match_directories(self, pattern, page_size=1000, threads=1, do_unquote=True):
+        """Find the "directories" matching the directory components of a pattern
+
+        The pattern is walked one component at a time. Only the
+        directories matching a component are listed (concurrently)
+        to match the next one, so the number of requests depends on
+        the number of matches, not on the size of the tree.
+
+        Returns
+        -------
+        prefixes : list
+            The matching directories, ending with "/"
+        """
+        prefixes = ['']
+        with ThreadPoolExecutor(max_workers = threads) as executor:
+            for component in pattern.split(SEPARATOR)[:-1]:
+                if not has_magic(component):
+                    prefixes = [prefix + component + SEPARATOR for prefix in prefixes]
+                    continue
+                head = MAGIC_CHECK.split(component)[0]
+                matcher = re.compile(translate_glob(component) + r'\Z', re.DOTALL)
+                listings = executor.map(lambda prefix: self._split_prefix(prefix + head, page_size), prefixes)
+                matches = []
+                for prefix, (_, subprefixes) in zip(prefixes, listings):
+                    for subprefix in subprefixes:
+                        name = subprefix[len(prefix):-1]
+                        if matcher.match(unquote(name) if do_unquote else name):
+                            matches.append(subprefix)
+                prefixes = matches
+        return prefixes
+
+    def _iter_prefixes(self, prefixes, page_size=1000, threads=1):
+        """List disjoint prefixes concurrently, and yield the objects in order
+
+        At most ``2 * threads`` prefixes are listed ahead of the consumer.
+        """
+        def list_prefix(prefix):
+            return list(self.iter_objects(prefix, page_size = page_size))
+
+        executor = ThreadPoolExecutor(max_workers = threads)
+        prefixes = iter(prefixes)
+        pending = deque()
+        try:
+            while True:
+                for prefix in itertools.islice(prefixes, 2 * threads - len(pending)):
+                    pending.append(executor.submit(list_prefix, prefix))
+                if not pending:
+                    break
+                for listed in pending.popleft().result():
+                    yield listed
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait = False)
+
+    def lsdir(self, path='/', limit=None):
         """List the contents of a directory
 
         Parameters
         ----------
         path : str (default: "/")
+        limit : int, optional
+            Maximum number of children to return. Defaults to all of them.
 
         Returns
         -------
         matches : list
             The children of the path.
         """
+        if self.listing_index is not None:
+            return self.listing_index.list_directory(path, limit)
         return self.backend_interface.list_directory(path, limit)
 
     @clean_object_name
-    def ls(self, pattern, page_size=10**3, limit=10**3, verbose=False):
+    def ls(self, pattern, page_size=10**3, limit=None, verbose=False, threads=THREADS):
         """File-system like search for S3 objects
 
         Parameters
@@ -1038,7 +1603,11 @@ class FileSystemInterface(BasicInterface):
             A ls-style command line like query
 
         page_size : int (default: 1,000)
-        limit : int (default: 1,000)
+            The page size for pagination
+        limit : int, optional
+            Maximum number of names to return. Defaults to all of them.
+        threads : int
+            Number of concurrent listing requests
 
         Returns
         -------
@@ -1047,36 +1616,38 @@ class FileSystemInterface(BasicInterface):
 
         Notes
         -----
-        Increase ``page_size`` and ``limit`` if you have a lot of objects
-        otherwise, the search might not return all matching objects in store.
+        Wildcards match within one path component. Only the
+        "directories" that match the pattern are listed, one
+        level at a time.
         """
         pattern = remove_trivial_magic(pattern)
         pattern = os.path.normpath(pattern)
+        if not self.backend_interface.prefix_listing:
+            # the drive is listed by changing the current directory
+            threads = 1
 
-        if has_real_magic(pattern):
-            magic_check = re.compile('[*?[]')
-            prefix = magic_check.split(pattern)[0]
-        else:
-            prefix = pattern
-
-        # get objects that match common prefix
         if not has_real_magic(pattern):
-            object_names = self.lsdir(prefix, limit = limit)
+            object_names = self.lsdir(pattern, limit = limit)
         else:
-            object_list = self.get_objects(filter = dict(Prefix = prefix),
-                                           page_size = page_size,
-                                           limit = limit)
-            object_names = objects2names(object_list)
-
-        # remove trailing '/'
-        object_names = map(os.path.normpath, object_names)
-
-        if has_real_magic(pattern):
-            # get the unique sub-directories
-            depth = len(pattern.split(SEPARATOR))
-            object_names = {SEPARATOR.join(t.split(SEPARATOR)[:depth]): 1 for t in object_names}.keys()
-            # filter the list with glob pattern
-            object_names = fnmatch.filter(object_names, pattern)
+            directories = self._match_directories(pattern, page_size, threads)
+            basename = pattern.split(SEPARATOR)[-1]
+            head = MAGIC_CHECK.split(basename)[0]
+            regex = translate_glob(basename)
+            object_names = []
+            with ThreadPoolExecutor(max_workers = threads) as executor:
+                listings = executor.map(lambda directory: self._split_prefix(directory + head, page_size),
+                                        directories)
+                for directory, (objects, prefixes) in zip(directories, listings):
+                    # objects and sub-directories, without trailing '/'
+                    names = [unquote(row[0][len(directory):]) for row in objects]
+                    names += [prefix[len(directory):-1] for prefix in prefixes]
+                    names = Listing.from_names(sorted(set(names)))
+                    for name in names[names.match(regex)].names:
+                        object_names.append(os.path.normpath(directory + name))
+                        if len(object_names) == limit:
+                            break
+                    if len(object_names) == limit:
+                        break
         if verbose:
             print('\n'.join(sorted(object_names)))
         return list(object_names)
@@ -1114,20 +1685,21 @@ class FileSystemInterface(BasicInterface):
 
         Extended Summary
         ----------------
-        Some gotchas
-
         limit: None, int, optional
             The maximum number of objects to return
         page_size: int, optional
-            This is important for buckets with loads of objects.
-            By default, ``glob`` will download a maximum of 10^6
-            object names and perform the search. If more objects exist,
-            the search might not find them and the page_size should
-            be increased.
+            The number of objects listed per request (default: 1,000).
+        threads: int, optional
+            The number of concurrent listing requests for large prefixes.
 
         Notes
         -----
-        If more than 10^6 objects, provide ``page_size=10**7`` kwarg.
+        Wildcards in the "directories" of the pattern match within one
+        path component, and only the matching directories are listed.
+        Wildcards in the last component also match "/": ``path/*``
+        matches all the objects under ``path/``. The objects are listed
+        lazily, page by page, and only the matching names are kept in
+        memory.
         """
         # determine if we're globbing
 
@@ -1183,51 +1755,71 @@ class FileSystemInterface(BasicInterface):
         """
         prefix = MAGIC_CHECK.split(pattern)[0] if has_magic(pattern) else pattern
 
-        page_size = kwargs.get('page_size', 1000000)
+        page_size = kwargs.get('page_size', 1000)
+        threads = kwargs.get('threads', THREADS)
         limit = kwargs.get('limit', None)
         do_unquote = kwargs.get('do_unquote', True)
-
-        object_list = self.get_objects(filter = dict(Prefix = prefix),
-                                       page_size = page_size,
-                                       limit = limit)
-
-        if self.backend == 's3':
-            mapper = {obj.key: obj for obj in object_list}
+        directory, _, basename = pattern.rpartition(SEPARATOR)
+        if has_magic(directory):
+            # only list under the "directories" that match
+            head = MAGIC_CHECK.split(basename)[0]
+            directories = self._match_directories(pattern, page_size, threads, do_unquote)
+            listing = self._iter_prefixes([directory + head for directory in directories], page_size, threads)
         else:
-            mapper = {obj: obj for obj in object_list}
-        if do_unquote:
-            mapper = {unquote(key): val for key, val in mapper.items()}
-        object_names = mapper.keys()
-
-        matches = fnmatch.filter(object_names, pattern) \
-            if has_magic(pattern) else object_names
-        matches = sorted(matches)
+            listing = self.iter_objects(prefix, page_size = page_size, threads = threads)
+
+        # filter the listing by chunks, and only keep the matches
+        found = []
+        num_found = 0
+        for chunk in Listing.chunks(listing):
+            if do_unquote:
+                chunk = chunk.unquote()
+            if has_magic(pattern):
+                chunk = chunk[chunk.match(glob_regex(pattern))]
+            found.append(chunk)
+            num_found += len(chunk)
+            if (limit is not None) and (num_found >= limit):
+                break
+        found = Listing.concatenate(found)[:limit].sorted()
 
         if kwargs.get('verbose', False):
             # print objects found
-            objects_found = [mapper[match] for match in matches]
-            if len(objects_found):
-                print_objects(objects_found)
-            print('Found %i objects matching "%s"' % (len(objects_found), pattern))
-        return matches
+            print_listing(found, do_unquote = not do_unquote)
+            print('Found %i objects matching "%s"' % (len(found), pattern))
+        return found.names
 
     @clean_object_name
-    def download_directory(self, directory, disk_name):
+    def download_directory(self, directory, disk_name, threads = THREADS, checksum=False):
         """
-        Download an entire directory
-        NOTE: currently only tested on s3
+        Download an entire directory, skipping the files already downloaded
+
+        The objects are listed while they are downloaded by ``threads``
+        concurrent workers, one object per worker. Each object is
+        written to a temporary file next to its destination, which is
+        renamed when the download is complete, so interrupted
+        downloads never leave partial files behind. The downloaded
+        files get the modification time of their object, and a file
+        is skipped if it has the size and modification time of its
+        object (or, with ``checksum=True``, its ETag). Running it
+        again after an interruption resumes where it stopped.
 
         Parameters
         ----------
-        self
         directory : str
-            directory on s3 to download
-        disk_name :
+            directory in the cloud to download
+        disk_name : str
             name of directory on disk to download to
+        threads : int
+            number of concurrent requests to list and download the objects
+        checksum : bool
+            Compare the MD5 of the files to the ETag of the objects,
+            instead of their modification times (S3 only)
 
         Returns
         -------
-
+        summary : dict
+            ``transferred`` and ``skipped`` object names, and
+            ``failed`` (object name, error message) tuples
         """
         if has_real_magic(directory):
             raise NotImplementedError('Wildcards not implemented')
@@ -1237,19 +1829,59 @@ class FileSystemInterface(BasicInterface):
         directory = remove_trivial_magic(directory)
         directory = mk_aws_path(directory)
 
-        if not os.path.exists(disk_name):
-            os.mkdir(disk_name)
-
-        files = self.glob(directory + '*')
-        for f in files:
-            if f[-1] == '/':
-                continue
-            subpath = re.sub(directory, '', f)
-            path = os.path.join(disk_name, subpath)
-            subfolder = re.match('.*\/', path).group(0)
-            if not os.path.exists(subfolder):
-                os.makedirs(subfolder)
-            self.download_to_file(f, path)
+        def is_downloaded(path, size, etag, mtime):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return False
+            if stat.st_size != size:
+                return False
+            if checksum and (etag is not None):
+                return etag.strip('"') == file_etag(path)
+            return (mtime is not None) and (int(stat.st_mtime) == int(mtime))
+
+        def download(item):
+            name, size, etag, mtime = item
+            object_name = unquote(name)
+            path = os.path.join(disk_name, *unquote(name[len(directory):]).split(SEPARATOR))
+            temporary = os.path.join(os.path.dirname(path), '.%s.part' % os.path.basename(path))
+            try:
+                if is_downloaded(path, size, etag, mtime):
+                    return 'skipped', object_name, None
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                try:
+                    self.download_to_file(object_name, temporary, threads = 1)
+                    if mtime is not None:
+                        os.utime(temporary, (mtime, mtime))
+                    os.replace(temporary, path)
+                finally:
+                    if os.path.exists(temporary):
+                        os.remove(temporary)
+            except TRANSFER_ERRORS as error:
+                return 'failed', object_name, str(error)
+            return 'transferred', object_name, None
+
+        if self.backend_interface.prefix_listing:
+            objects = (obj for obj in self.iter_objects(directory, threads = threads)
+                       if not obj[0].endswith(SEPARATOR))
+        else:
+            # no sizes nor times to compare: download everything, and
+            # one at a time as the drive changes its current directory
+            threads = 1
+            objects = ((name, None, None, None) for name in self.glob(directory + '*') or []
+                       if not name.endswith(SEPARATOR))
+        summary = dict(transferred=[], skipped=[], failed=[])
+        os.makedirs(disk_name, exist_ok=True)
+        for status, object_name, message in ordered_map(download, objects, workers = threads):
+            if status == 'failed':
+                summary['failed'].append((object_name, message))
+                print('cannot download %s: %s' % (object_name, message))
+            else:
+                summary[status].append(object_name)
+        print('Downloaded "%s" to "%s": %i transferred, %i skipped, %i failed' %
+              (directory, disk_name, len(summary['transferred']), len(summary['skipped']),
+               len(summary['failed'])))
+        return summary
 
     @clean_object_name
     def search(self, pattern, **kwargs):
@@ -1268,8 +1900,8 @@ class FileSystemInterface(BasicInterface):
         return cottoncandy.browser.S3Directory('', interface = self)
 
     def cp(self, source_name, dest_name,
-           source_bucket=None, dest_bucket=None, overwrite=False):
-        """Copy an object
+           source_bucket=None, dest_bucket=None, overwrite=False, recursive=False, threads=THREADS):
+        """Copy an object, or all the objects under a prefix
 
         Parameters
         ----------
@@ -1285,13 +1917,27 @@ class FileSystemInterface(BasicInterface):
             Defaults to ``source_bucket``
         overwrite : bool (defaults to False)
             Whether to overwrite the `dest_name` object if it already exists
+        recursive : bool (defaults to False)
+            Copy all the objects under ``source_name/`` to ``dest_name/``.
+            On S3, the objects are copied on the server, concurrently.
+            Not available on google drive.
+        threads : int
+            Number of concurrent copies
+
+        Returns
+        -------
+        errors : list
+            With ``recursive``, the (name, message) tuples of the objects
+            that could not be copied
         """
-        # TODO: support directories
+        if recursive:
+            return self._copy_prefix(source_name, dest_name, source_bucket, dest_bucket, overwrite,
+                                     move = False, threads = threads)
         return self.backend_interface.copy(source_name, dest_name, source_bucket, dest_bucket, overwrite)
 
     def mv(self, source_name, dest_name,
-           source_bucket=None, dest_bucket=None, overwrite=False):
-        """Move an object (make copy and delete old object)
+           source_bucket=None, dest_bucket=None, overwrite=False, recursive=False, threads=THREADS):
+        """Move an object (make copy and delete old object), or all the objects under a prefix
 
         Parameters
         ----------
@@ -1307,23 +1953,65 @@ class FileSystemInterface(BasicInterface):
             Defaults to ``source_bucket``
         overwrite : bool (defaults to False)
             Whether to overwrite the `dest_name` object if it already exists.
+        recursive : bool (defaults to False)
+            Move all the objects under ``source_name/`` to ``dest_name/``.
+            On S3, the sources are deleted in batches once their copy
+            has been checked. Not available on google drive.
+        threads : int
+            Number of concurrent copies
+
+        Returns
+        -------
+        errors : list
+            With ``recursive``, the (name, message) tuples of the objects
+            that could not be moved
         """
-        # TODO: Support directories
+        if recursive:
+            return self._copy_prefix(source_name, dest_name, source_bucket, dest_bucket, overwrite,
+                                     move = True, threads = threads)
         return self.backend_interface.move(source_name, dest_name, source_bucket, dest_bucket, overwrite)
 
-    def rm(self, object_name, recursive=False, delete=True):
-        """Delete an object, or a subtree ('path/to/stuff').
+    def _copy_prefix(self, source_name, dest_name, source_bucket=None, dest_bucket=None, overwrite=False,
+                     move=False, threads=THREADS):
+        """Copy or move a prefix, and report the objects that failed"""
+        source = mk_aws_path(remove_root(source_name))
+        destination = mk_aws_path(remove_root(dest_name))
+        copied, errors = self.backend_interface.copy_prefix(source, destination, source_bucket, dest_bucket,
+                                                            overwrite = overwrite, move = move,
+                                                            threads = threads)
+        failed = set(object_name for object_name, _ in errors)
+        num_objects = len([name for name, _ in copied if name not in failed])
+        print('%s %i objects' % ('moved' if move else 'copied', num_objects))
+        for object_name, message in errors:
+            print('cannot %s %s: %s' % ('move' if move else 'copy', object_name, message))
+        return errors
+
+    def rm(self, object_name, recursive=False, delete=True, threads=THREADS):
+        """Delete an object, a subtree ('path/to/stuff'), or the objects matching a glob pattern.
+
+        Subtrees and patterns are deleted in batches (``DeleteObjects``
+        on S3, 1000 keys per request), while they are listed.
 
         Parameters
         ----------
         object_name : str
             The name of the object to delete. It can also
-            be a subtree
+            be a subtree, or a glob pattern (see ``glob``)
         recursive : bool
             When deleting a subtree, set ``recursive=True``. This is
             similar in behavior to 'rm -r /path/to/directory'.
+            Without it, a pattern only deletes the objects in the
+            "directory" of its last component.
         delete : bool
             When in google drive, actually delete the file or only trash it?
+        threads : int
+            Number of concurrent delete requests
+
+        Returns
+        -------
+        errors : list
+            For subtrees and patterns, the (name, message) tuples of the
+            objects that could not be deleted
 
         Example
         -------
@@ -1333,32 +2021,93 @@ class FileSystemInterface(BasicInterface):
         >>> cci.rm('data/experiment')
         cannot remove 'data/experiment': use `recursive` to remove branch
         >>> cci.rm('data/experiment', recursive=True)
-        deleting 15 objects...
+        deleted 15 objects
+        >>> cci.rm('data/*/file01.txt')
+        deleted 3 objects
+        >>> cci.rm('data/*', recursive=True)
+        deleted 12 objects
         """
+        if has_magic(object_name) and (self.backend != "gdrive"):
+            if recursive:
+                names = self.glob(object_name, threads = threads)
+            else:
+                names, subdirectories = self._match_directory_objects(remove_root(object_name), threads = threads)
+                if subdirectories:
+                    print("cannot remove %i directories matching '%s': use `recursive` to remove branches"
+                          % (len(subdirectories), object_name))
+            return self._delete_objects(names, threads)
 
         # not moving this to the basic S3Client because it depends on glob
         if self.backend == "s3":
             if self.exists_object(object_name):
-                return self.backend_interface.get_s3_object(object_name).delete()
+                response = self.backend_interface.get_s3_object(object_name).delete()
+                self.backend_interface.invalidate(object_name)
+                return response
         elif self.backend == "gdrive":
             return self.backend_interface.delete(object_name, recursive, delete)
         else:
             return self.backend_interface.delete(object_name, recursive, delete)
 
-        has_objects = len(self.ls(object_name)) > 0
+        listing = self.iter_objects(mk_aws_path(remove_root(object_name)), threads = threads)
+        first = next(listing, None)
+        has_objects = first is not None
         if has_objects:
             if recursive:
-                all_objects = self.glob(object_name)
-                print('deleting %i objects...' % len(all_objects))
-                for obname in self.glob(object_name):
-                    _ = self.get_object(obname).delete()
-                return
+                names = (obname for obname, _, _, _ in itertools.chain([first], listing))
+                return self._delete_objects(names, threads)
 
         msg = "cannot remove '%s': use `recursive` to remove branch" \
             if has_objects else \
             "nothing found under '%s"
         print(msg % object_name)
 
+    def _match_directory_objects(self, pattern, page_size=1000, threads=1):
+        """Find the objects and sub-directories matching a pattern, one level deep
+
+        Unlike ``glob``, wildcards in the last component do not match
+        "/": only the "directories" of the pattern are listed, with a
+        delimiter.
+
+        Returns
+        -------
+        names : list
+            The matching objects
+        subdirectories : list
+            The matching sub-directories, ending with "/"
+        """
+        directory, _, basename = pattern.rpartition(SEPARATOR)
+        if has_magic(directory):
+            directories = self._match_directories(pattern, page_size, threads)
+        else:
+            directories = [directory + SEPARATOR if directory else '']
+        head = MAGIC_CHECK.split(basename)[0]
+        matcher = re.compile(translate_glob(basename) + r'\Z', re.DOTALL)
+
+        names = []
+        subdirectories = []
+        with ThreadPoolExecutor(max_workers = threads) as executor:
+            listings = executor.map(lambda directory: self._split_prefix(directory + head, page_size),
+                                    directories)
+            for directory, (objects, prefixes) in zip(directories, listings):
+                names += [row[0] for row in objects if matcher.match(unquote(row[0][len(directory):]))]
+                subdirectories += [prefix for prefix in prefixes
+                                   if matcher.match(unquote(prefix[len(directory):-1]))]
+        return names, subdirectories
+
+    def _delete_objects(self, object_names, threads=THREADS):
+        """Delete objects in batches, and report the ones that failed"""
+        deleted = []
+
+        def count(object_names):
+            for object_name in object_names:
+                deleted.append(None)
+                yield object_name
+        errors = self.backend_interface.delete_objects(count(object_names), threads = threads)
+        print('deleted %i objects' % (len(deleted) - len(errors)))
+        for object_name, message in errors:
+            print('cannot remove %s: %s' % (object_name, message))
+        return errors
+
     def get_object_owner(self, object_name):
         self.exists_object(object_name, raise_err=True)
         ob = self.get_object(object_name)
@@ -1373,6 +2122,11 @@ class FileSystemInterface(BasicInterface):
                 raise e
         print(info)
 
+    submit_download_directory = _submitter('download_directory')
+    submit_cp = _submitter('cp')
+    submit_mv = _submitter('mv')
+    submit_rm = _submitter('rm')
+
 
 class DefaultInterface(FileSystemInterface,
                        ArrayInterface,
@@ -0,0 +1,391 @@
+import hashlib
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import unquote
+
+from .backend import FileNotFoundError
+from .cacheclient import WrapperClient
+from .utils import SEPARATOR, mk_aws_path, remove_root, remove_trivial_magic
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS objects (name TEXT PRIMARY KEY, size INTEGER, etag TEXT, mtime REAL)
+    WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS prefixes (prefix TEXT PRIMARY KEY, listed REAL);
+CREATE TABLE IF NOT EXISTS changed (name TEXT PRIMARY KEY);
+'''
+
+
+def prefix_range(prefix):
+    """Bounds of the names starting with ``prefix``
+
+    Returns
+    -------
+    lower, upper : str
+        ``lower <= name < upper`` for all the names starting with
+        ``prefix``. ``upper`` is None for the empty prefix.
+    """
+    if prefix == '':
+        return '', None
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class ListingIndex(object):
+    """
+    Local index of the objects of a bucket, stored in SQLite.
+
+    The index keeps the name, size, ETag and modification time of the
+    objects, and the time at which each prefix was listed. Queries
+    under a prefix listed less than ``max_age`` seconds ago are
+    answered locally. Otherwise, only that prefix is listed again.
+    Objects changed through cottoncandy are checked one by one on
+    the next query.
+    """
+
+    def __init__(self, client, path, max_age):
+        """
+        Parameters
+        ----------
+        client : CCBackEnd
+            backend that lists the objects
+        path : str
+            SQLite database file
+        max_age : float
+            how long a listing is used, in seconds
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.client = client
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        # changes recorded during each listing in progress
+        self._touched = []
+        self._listing = dict()
+        self._staged = 0
+        self._db = sqlite3.connect(path, check_same_thread = False)
+        with self._lock, self._db:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.executescript(SCHEMA)
+
+    def __repr__(self):
+        return '<listing index in %s>' % self.path
+
+    def _range_clause(self, prefix, column = 'name'):
+        lower, upper = prefix_range(prefix)
+        if upper is None:
+            return '%s >= ?' % column, (lower,)
+        return '%s >= ? AND %s < ?' % (column, column), (lower, upper)
+
+    def _listed(self, prefix):
+        """Time at which ``prefix`` or one of its parents was last listed"""
+        candidates = [prefix[:i] for i in range(len(prefix) + 1)]
+        query = 'SELECT MAX(listed) FROM prefixes WHERE prefix IN (%s)' % ','.join('?' * len(candidates))
+        listed = self._db.execute(query, candidates).fetchone()[0]
+        return listed or 0
+
+    def update(self, prefix = '', incremental = False, batch_size = 10000):
+        """List the objects under ``prefix`` and store them in the index
+
+        The objects are listed without holding the index, into a
+        temporary table, ``batch_size`` at a time. They replace the
+        indexed objects in one short transaction at the end.
+
+        Parameters
+        ----------
+        prefix : str
+        incremental : bool
+            Only list the objects whose name comes after the last
+            indexed object (``StartAfter``). This is fast for buckets
+            that grow by appending names, but deleted and overwritten
+            objects are not detected.
+        batch_size : int
+            number of objects written to the temporary table at a time
+
+        Returns
+        -------
+        int, number of objects listed
+        """
+        clause, bounds = self._range_clause(prefix)
+        started = time.time()
+        touched = []
+        with self._lock:
+            start_after = None
+            if incremental:
+                start_after = self._db.execute('SELECT MAX(name) FROM objects WHERE ' + clause,
+                                               bounds).fetchone()[0]
+            self._staged += 1
+            staging = 'temp.listed_%i' % self._staged
+            self._db.execute('CREATE TABLE %s (name TEXT PRIMARY KEY, size INTEGER, etag TEXT, mtime REAL)'
+                             % staging)
+            self._touched.append(touched)
+
+        try:
+            nobjects = 0
+            objects = self.client.iter_objects(prefix, start_after = start_after)
+            while True:
+                batch = list(itertools.islice(objects, batch_size))
+                if not batch:
+                    break
+                nobjects += len(batch)
+                with self._lock, self._db:
+                    self._db.executemany('INSERT OR REPLACE INTO %s VALUES (?, ?, ?, ?)' % staging, batch)
+
+            with self._lock, self._db:
+                if not incremental:
+                    self._db.execute('DELETE FROM objects WHERE ' + clause, bounds)
+                    self._db.execute('DELETE FROM changed WHERE ' + clause, bounds)
+                self._db.execute('INSERT OR REPLACE INTO objects SELECT * FROM ' + staging)
+                self._db.execute('DELETE FROM prefixes WHERE ' + self._range_clause(prefix, 'prefix')[0],
+                                 bounds)
+                self._db.execute('INSERT INTO prefixes VALUES (?, ?)', (prefix, started))
+                # objects changed while listing may be missing from the listing
+                for name, recursive in touched:
+                    self._mark(name, recursive)
+        finally:
+            with self._lock:
+                self._touched.remove(touched)
+                self._db.execute('DROP TABLE ' + staging)
+        return nobjects
+
+    def _mark(self, name, recursive = False):
+        self._db.execute('INSERT OR IGNORE INTO changed VALUES (?)', (name,))
+        if recursive:
+            clause, bounds = self._range_clause(mk_aws_path(name))
+            self._db.execute('INSERT OR IGNORE INTO changed SELECT name FROM objects WHERE ' + clause,
+                             bounds)
+
+    def _record(self, name, recursive = False):
+        """Check the object again after the listings in progress"""
+        for touched in self._touched:
+            touched.append((name, recursive))
+
+    def mark_changed(self, name, recursive = False):
+        """Check the object again on the next query
+
+        Parameters
+        ----------
+        name : str
+        recursive : bool
+            also check all the indexed objects under ``name``
+        """
+        with self._lock, self._db:
+            self._mark(name, recursive)
+            self._record(name, recursive)
+
+    def remove(self, name, recursive = False):
+        """Remove deleted objects from the index"""
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM objects WHERE name = ?', (name,))
+            self._db.execute('DELETE FROM changed WHERE name = ?', (name,))
+            if recursive:
+                clause, bounds = self._range_clause(mk_aws_path(name))
+                self._db.execute('DELETE FROM objects WHERE ' + clause, bounds)
+                self._db.execute('DELETE FROM changed WHERE ' + clause, bounds)
+            self._record(name, recursive)
+
+    def discard(self, names):
+        """Remove several deleted objects from the index"""
+        rows = [(name,) for name in names]
+        with self._lock, self._db:
+            self._db.executemany('DELETE FROM objects WHERE name = ?', rows)
+            self._db.executemany('DELETE FROM changed WHERE name = ?', rows)
+            for name, in rows:
+                self._record(name)
+
+    def clear(self):
+        """Remove everything from the index"""
+        with self._lock, self._db:
+            for table in ('objects', 'prefixes', 'changed'):
+                self._db.execute('DELETE FROM %s' % table)
+
+    def refresh(self, prefix = ''):
+        """Make sure the objects under ``prefix`` are up to date
+
+        The prefix is listed again if its listing is older than
+        ``max_age``, and the objects changed since are checked.
+        A prefix being listed by another thread is not listed twice.
+        """
+        with self._lock:
+            stale = time.time() - self._listed(prefix) >= self.max_age
+            listing = self._listing.get(prefix)
+            owner = stale and (listing is None)
+            if owner:
+                listing = self._listing[prefix] = threading.Event()
+        if owner:
+            try:
+                self.update(prefix)
+            finally:
+                with self._lock:
+                    del self._listing[prefix]
+                listing.set()
+            return
+        if stale:
+            listing.wait()
+            return self.refresh(prefix)
+
+        clause, bounds = self._range_clause(prefix)
+        with self._lock:
+            changed = [row[0] for row in self._db.execute('SELECT name FROM changed WHERE ' + clause, bounds)]
+        for name in changed:
+            try:
+                info = self.client.get_object_info(name)
+            except FileNotFoundError:
+                self.remove(name)
+                continue
+            # NULL ETag and mtime when unknown: never taken as unchanged
+            with self._lock, self._db:
+                self._db.execute('INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?)',
+                                 (name, info['size'], info.get('etag'), info.get('mtime')))
+                self._db.execute('DELETE FROM changed WHERE name = ?', (name,))
+
+    def iter_objects(self, prefix = '', page_size = 1000):
+        """List the objects under ``prefix``, in lexicographic order
+
+        The rows are read ``page_size`` at a time.
+
+        Yields
+        ------
+        (name, size, etag, mtime) tuples
+        """
+        self.refresh(prefix)
+        clause, bounds = self._range_clause(prefix)
+        query = 'SELECT * FROM objects WHERE %s AND name > ? ORDER BY name LIMIT ?' % clause
+        last = ''
+        while True:
+            with self._lock:
+                rows = self._db.execute(query, bounds + (last, page_size)).fetchall()
+            for row in rows:
+                yield row
+            if len(rows) < page_size:
+                break
+            last = rows[-1][0]
+
+    def total_size(self, prefix = ''):
+        """Number of objects and total size in bytes under ``prefix``"""
+        self.refresh(prefix)
+        clause, bounds = self._range_clause(prefix)
+        with self._lock:
+            count, total = self._db.execute('SELECT COUNT(*), SUM(size) FROM objects WHERE ' + clause,
+                                            bounds).fetchone()
+        return count, total or 0
+
+    def split_prefix(self, prefix = '', limit = None):
+        """Objects directly under ``prefix``, and its sub-prefixes
+
+        Like a listing with a delimiter. Sub-prefixes are skipped
+        over in the index, so the cost depends on the number of
+        entries returned only.
+
+        Returns
+        -------
+        objects : list
+            (name, size, etag, mtime) tuples
+        prefixes : list
+            the sub-prefixes, ending with "/"
+        """
+        self.refresh(prefix)
+        objects = []
+        prefixes = []
+        lower, upper = prefix_range(prefix)
+        with self._lock:
+            while (limit is None) or (len(objects) + len(prefixes) < limit):
+                if upper is None:
+                    row = self._db.execute('SELECT * FROM objects WHERE name >= ? ORDER BY name LIMIT 1',
+                                           (lower,)).fetchone()
+                else:
+                    row = self._db.execute('SELECT * FROM objects WHERE name >= ? AND name < ? '
+                                           'ORDER BY name LIMIT 1', (lower, upper)).fetchone()
+                if row is None:
+                    break
+                name = row[0]
+                position = name.find(SEPARATOR, len(prefix))
+                if position < 0:
+                    objects.append(tuple(row))
+                    lower = name + '\0'
+                else:
+                    # skip the whole sub-directory
+                    subdirectory = name[:position + 1]
+                    prefixes.append(subdirectory)
+                    lower = prefix_range(subdirectory)[1]
+        return objects, prefixes
+
+    def list_directory(self, path, limit = None):
+        """List the contents of a "directory", like ``CCBackEnd.list_directory``"""
+        if (path != '') and (path != SEPARATOR):
+            path = remove_root(path)
+        path = mk_aws_path(remove_trivial_magic(path))
+        objects, prefixes = self.split_prefix(path, limit)
+        children = [unquote(row[0]) for row in objects] + prefixes
+        return [os.path.normpath(child) for child in children]
+
+
+class IndexedClient(WrapperClient):
+    """
+    Keeps a ``ListingIndex`` of the current bucket.
+
+    The changes made through this backend are recorded in the index.
+    """
+
+    def __init__(self, client, path, max_age):
+        """
+        Parameters
+        ----------
+        client : CCBackEnd
+            backend to index
+        path : str
+            directory of the SQLite databases (one per bucket)
+        max_age : float
+            how long a listing is used, in seconds
+        """
+        super(IndexedClient, self).__init__(client)
+        self.index_path = path
+        self.max_age = max_age
+        self._indexes = dict()
+
+    @property
+    def index(self):
+        """Listing index of the current bucket"""
+        location = (type(self.client).__name__,
+                    getattr(self.client, 'url', None),
+                    getattr(self.client, 'bucket_name', None) or getattr(self.client, 'path', None))
+        if location not in self._indexes:
+            digest = hashlib.sha1(repr(location).encode()).hexdigest()
+            path = os.path.join(self.index_path, digest + '.sqlite')
+            self._indexes[location] = ListingIndex(self.client, path, self.max_age)
+        return self._indexes[location]
+
+    def _forget(self, cloud_name, recursive=False):
+        self.index.mark_changed(cloud_name, recursive)
+
+    def delete(self, file_name, recursive=False, delete=False):
+        response = self.client.delete(file_name, recursive, delete)
+        self.index.remove(file_name, recursive)
+        return response
+
+    def copy_prefix(self, source, destination, source_bucket=None, destination_bucket=None,
+                    overwrite=False, move=False, threads=1):
+        copied, errors = self.client.copy_prefix(source, destination, source_bucket, destination_bucket,
+                                                 overwrite = overwrite, move = move, threads = threads)
+        # list the copies (and the moved sources) again
+        current = (None, getattr(self.client, 'bucket_name', None))
+        if destination_bucket in current:
+            self.index.update(destination)
+        if move and (source_bucket in current):
+            self.index.update(source)
+        return copied, errors
+
+    def delete_objects(self, file_names, threads=1):
+        requested = []
+
+        def record(file_names):
+            for file_name in file_names:
+                requested.append(file_name)
+                yield file_name
+        errors = self.client.delete_objects(record(file_names), threads)
+        failed = set(name for name, _ in errors)
+        self.index.discard(name for name in requested if name not in failed)
+        return errors
@@ -0,0 +1,248 @@
+import itertools
+import re
+from urllib.parse import unquote
+
+import numpy as np
+
+NEWLINE = ord('\n')
+CHUNK_SIZE = 10**4
+
+
+class Listing(object):
+    """
+    Compact, columnar list of objects.
+
+    The names are stored as UTF-8 in one array of bytes, each one
+    followed by a newline, with an array of offsets. Sizes and
+    modification times are stored in numpy arrays. A million objects
+    take tens of megabytes, instead of gigabytes of Python objects.
+
+    Iterating yields ``(name, size, etag, mtime)`` tuples, like
+    ``CCBackEnd.iter_objects``. ETags are not kept (always None).
+
+    Example
+    -------
+    >>> listing = Listing.from_objects(cci.iter_objects('data/'))
+    >>> listing = listing[listing.match(glob_regex('data/*/*.npy'))]
+    >>> listing.sizes.sum()
+    """
+
+    def __init__(self, data=None, offsets=None, sizes=None, mtimes=None):
+        """
+        Parameters
+        ----------
+        data : np.ndarray (uint8)
+            The names, encoded with UTF-8, each followed by a newline
+        offsets : np.ndarray (int64)
+            Start of each name in ``data``, and the total length
+        sizes : np.ndarray (int64), optional
+        mtimes : np.ndarray (float64), optional
+            Modification times, as POSIX timestamps
+        """
+        self.data = np.zeros(0, np.uint8) if data is None else data
+        self.offsets = np.zeros(1, np.int64) if offsets is None else offsets
+        nobjects = len(self.offsets) - 1
+        self.sizes = np.zeros(nobjects, np.int64) if sizes is None else sizes
+        self.mtimes = np.zeros(nobjects) if mtimes is None else mtimes
+
+    @classmethod
+    def from_names(cls, names):
+        """Make a listing from object names"""
+        encoded = [name.encode('utf-8') + b'\n' for name in names]
+        offsets = np.zeros(len(encoded) + 1, np.int64)
+        np.cumsum(np.fromiter(map(len, encoded), np.int64, len(encoded)), out = offsets[1:])
+        return cls(np.frombuffer(b''.join(encoded), np.uint8), offsets)
+
+    @classmethod
+    def from_objects(cls, objects):
+        """Make a listing from ``(name, size, etag, mtime)`` tuples"""
+        objects = list(objects)
+        listing = cls.from_names([obj[0] for obj in objects])
+        listing.sizes = np.fromiter((obj[1] for obj in objects), np.int64, len(objects))
+        listing.mtimes = np.fromiter((obj[3] or 0 for obj in objects), np.float64, len(objects))
+        return listing
+
+    @classmethod
+    def chunks(cls, objects, chunk_size=CHUNK_SIZE):
+        """Consume ``(name, size, etag, mtime)`` tuples into listings of ``chunk_size`` objects"""
+        objects = iter(objects)
+        while True:
+            chunk = cls.from_objects(itertools.islice(objects, chunk_size))
+            if not len(chunk):
+                break
+            yield chunk
+
+    @classmethod
+    def concatenate(cls, listings):
+        """Join listings, in order"""
+        listings = list(listings)
+        if not listings:
+            return cls()
+        starts = np.cumsum([0] + [len(listing.data) for listing in listings[:-1]])
+        offsets = [np.zeros(1, np.int64)] + [listing.offsets[1:] + start
+                                              for listing, start in zip(listings, starts)]
+        return cls(np.concatenate([listing.data for listing in listings]),
+                   np.concatenate(offsets),
+                   np.concatenate([listing.sizes for listing in listings]),
+                   np.concatenate([listing.mtimes for listing in listings]))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __repr__(self):
+        return '<listing of %i objects (%i bytes)>' % (len(self), self.nbytes)
+
+    @property
+    def nbytes(self):
+        """Memory used by the listing"""
+        return self.data.nbytes + self.offsets.nbytes + self.sizes.nbytes + self.mtimes.nbytes
+
+    @property
+    def lengths(self):
+        """Length of the names in bytes"""
+        return np.diff(self.offsets) - 1
+
+    def name(self, index):
+        """Name of one object"""
+        return bytes(self.data[self.offsets[index]:self.offsets[index + 1] - 1]).decode('utf-8')
+
+    @property
+    def names(self):
+        """Names of all the objects, as a list"""
+        if np.count_nonzero(self.data == NEWLINE) != len(self):
+            # some names have newlines
+            return [self.name(index) for index in range(len(self))]
+        return bytes(self.data).decode('utf-8').split('\n')[:-1]
+
+    def __iter__(self):
+        for name, size, mtime in zip(self.names, self.sizes.tolist(), self.mtimes.tolist()):
+            yield (name, size, None, mtime)
+
+    def __getitem__(self, index):
+        """One object as a tuple, or a listing of the selected objects
+
+        Parameters
+        ----------
+        index : int, slice, array of indices or boolean mask
+        """
+        if isinstance(index, (int, np.integer)):
+            index = range(len(self))[index]
+            return (self.name(index), int(self.sizes[index]), None, float(self.mtimes[index]))
+
+        indices = np.arange(len(self))[index]
+        lengths = np.diff(self.offsets)[indices]
+        offsets = np.zeros(len(indices) + 1, np.int64)
+        np.cumsum(lengths, out = offsets[1:])
+        # position of each byte of the selected names in ``data``
+        positions = np.arange(offsets[-1]) + np.repeat(self.offsets[indices] - offsets[:-1], lengths)
+        return Listing(self.data[positions], offsets, self.sizes[indices], self.mtimes[indices])
+
+    def startswith(self, prefix):
+        """Mask of the names starting with ``prefix``"""
+        prefix = np.frombuffer(prefix.encode('utf-8'), np.uint8)
+        mask = self.lengths >= len(prefix)
+        if len(prefix) and mask.any():
+            candidates = np.flatnonzero(mask)
+            heads = self.data[self.offsets[candidates][:, None] + np.arange(len(prefix))]
+            mask[candidates] = (heads == prefix).all(1)
+        return mask
+
+    def match(self, regex):
+        """Mask of the names matching a regular expression entirely
+
+        The expression is run once over all the names (separated by
+        newlines) instead of once per name.
+
+        Parameters
+        ----------
+        regex : str
+            Unanchored regular expression, e.g. from ``translate_glob``
+        """
+        full = re.compile('(?:%s)\\Z' % regex, re.DOTALL)
+        if np.count_nonzero(self.data == NEWLINE) != len(self):
+            # some names have newlines
+            return np.array([full.match(name) is not None for name in self.names], bool)
+
+        text = bytes(self.data).decode('utf-8')
+        starts = self.offsets
+        if len(text) != len(self.data):
+            # offsets in characters
+            is_start = (self.data & 0xC0) != 0x80
+            starts = np.concatenate([[0], np.cumsum(is_start)])[self.offsets]
+
+        mask = np.zeros(len(self), bool)
+        for found in re.finditer('^(?:%s)$' % regex, text, re.MULTILINE):
+            first, last = np.searchsorted(starts, found.span(), side = 'right') - 1
+            if first == len(self):
+                # empty match after the last newline
+                break
+            if first == last:
+                mask[first] = True
+                continue
+            # the match spans several names: check each one
+            for index in range(first, min(last + 1, len(self))):
+                mask[index] = full.match(self.name(index)) is not None
+        return mask
+
+    def argsort(self):
+        """Indices that sort the names (in the order of their UTF-8 bytes)
+
+        The names are compared 8 bytes at a time, and only the names
+        still tied are compared again, so memory use does not depend on
+        the longest name. Names already in order (e.g. listed from S3)
+        are not sorted. The sort is stable.
+        """
+        columns = np.arange(8)
+        lengths = self.lengths
+        starts = self.offsets[:-1]
+        last = max(len(self.data) - 1, 0)
+        order = np.arange(len(self))
+        # the names tied so far form groups of consecutive positions in
+        # ``order``, identified by the position of their first name
+        groups = np.zeros(len(self), np.int64)
+        active = np.arange(len(self))
+        depth = 0
+        while len(active) > 1:
+            indices = order[active]
+            remaining = lengths[indices] - depth
+            positions = np.minimum(starts[indices][:, None] + depth + columns, last)
+            words = np.where(columns < remaining[:, None], self.data[positions], 0).astype(np.uint8)
+            words = words.view('>u8').ravel()
+            # "a" sorts before "a\0": compare the number of bytes left too
+            counts = np.minimum(remaining, 8)
+            group = groups[active]
+            same = group[1:] == group[:-1]
+            ordered = (~same | (words[1:] > words[:-1]) |
+                       ((words[1:] == words[:-1]) & (counts[1:] >= counts[:-1])))
+            if not ordered.all():
+                permutation = np.lexsort((counts, words, group))
+                words, counts = words[permutation], counts[permutation]
+                order[active] = indices[permutation]
+
+            # names with the same bytes so far, and more bytes to compare
+            tied = same & (words[1:] == words[:-1]) & (counts[1:] == 8) & (counts[:-1] == 8)
+            first = np.ones(len(active), bool)
+            first[1:] = ~tied
+            groups[active] = np.maximum.accumulate(np.where(first, active, 0))
+            keep = np.zeros(len(active), bool)
+            keep[1:] |= tied
+            keep[:-1] |= tied
+            active = active[keep]
+            depth += 8
+        return order
+
+    def sorted(self):
+        """Listing sorted by name (the listing itself if already sorted)"""
+        order = self.argsort()
+        if np.array_equal(order, np.arange(len(self))):
+            return self
+        return self[order]
+
+    def unquote(self):
+        """Listing with URL-quoted names decoded"""
+        if not np.any(self.data == ord('%')):
+            return self
+        listing = Listing.from_names([unquote(name) for name in self.names])
+        listing.sizes = self.sizes
+        listing.mtimes = self.mtimes
+        return listing
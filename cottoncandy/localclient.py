@@ -5,8 +5,8 @@ import shutil
 from io import BytesIO as StringIO
 from typing import Optional
 
-from .backend import CCBackEnd, CloudStream
-from .utils import SEPARATOR, remove_root, remove_trivial_magic, sanitize_metadata
+from .backend import CCBackEnd, CloudStream, FileNotFoundError
+from .utils import SEPARATOR, read_into, remove_root, remove_trivial_magic, sanitize_metadata
 
 METADATA_SUFFIX = ".meta.json"
 
@@ -63,7 +63,7 @@ class LocalClient(CCBackEnd):
         file_name = os.path.join(self.path, cloud_name)
         auto_makedirs(file_name)
         with open(file_name, 'wb') as local_file:
-            local_file.write(stream.read())
+            shutil.copyfileobj(stream, local_file)
 
         metadata_file_name = file_name + METADATA_SUFFIX
         with open(metadata_file_name, 'w') as local_file:
@@ -122,6 +122,43 @@ class LocalClient(CCBackEnd):
 
         return CloudStream(content, sanitize_metadata(metadata))
 
+    def open_stream(self, cloud_name):
+        """Opens a file for sequential reading
+
+        Parameters
+        ----------
+        cloud_name : str
+            name of object to open
+
+        Returns
+        -------
+        CloudStream object, with an open file as content
+        """
+        metadata = self.get_object_metadata(cloud_name)
+        file_name = os.path.join(self.path, cloud_name)
+        return CloudStream(open(file_name, 'rb'), metadata, os.path.getsize(file_name))
+
+    def download_into(self, cloud_name, buffer, offset=0):
+        """Reads part of a file directly into a writable buffer
+
+        Parameters
+        ----------
+        cloud_name : str
+            name of object to read
+        buffer : writable buffer
+            destination of the data. ``len(buffer)`` bytes are read.
+        offset : int
+            position of the first byte to read
+
+        Returns
+        -------
+        int, number of bytes read
+        """
+        file_name = os.path.join(self.path, cloud_name)
+        with open(file_name, 'rb') as local_file:
+            local_file.seek(offset)
+            return read_into(local_file, buffer)
+
     def download_to_file(self, cloud_name, file_name, threads = 1):
         """Downloads an object directly to disk
 
@@ -142,6 +179,7 @@ class LocalClient(CCBackEnd):
             source_bucket=None,
             destination_bucket=None,
             overwrite=True,
+            copy_metadata=False,
         )
 
     def list_directory(self, path, limit):
@@ -189,6 +227,80 @@ class LocalClient(CCBackEnd):
         results = self._remove_path_and_metadata(results)
         return results
 
+    def iter_objects(self, prefix='', start_after=None, page_size=None, threads=1):
+        """Lists the files under a prefix, in lexicographic order
+
+        Parameters
+        ----------
+        prefix : str
+            only list the files whose name starts with ``prefix``
+        start_after : str, optional
+            only list the files whose name comes after ``start_after``
+        page_size : ignored
+        threads : ignored
+
+        Yields
+        ------
+        (name, size, None, mtime) tuples
+        """
+        # walk the deepest directory containing all the matches
+        directory = os.path.join(self.path, os.path.dirname(prefix))
+        names = []
+        for root, _, files in os.walk(directory):
+            names += [os.path.join(root, fl) for fl in files]
+        names = [name for name in self._remove_path_and_metadata(names)
+                 if name.startswith(prefix)]
+
+        for name in sorted(names):
+            if (start_after is not None) and (name <= start_after):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except OSError:
+                # deleted in the meantime
+                continue
+            yield (name, stat.st_size, None, stat.st_mtime)
+
+    def split_prefix(self, prefix, page_size=None):
+        """Lists the files and directories in the directory of a prefix
+
+        Parameters
+        ----------
+        prefix : str
+            only list the entries whose name starts with ``prefix``
+        page_size : ignored
+
+        Returns
+        -------
+        objects : list
+            (name, size, None, mtime) tuples of the files
+        prefixes : list
+            the directories, ending with "/"
+        """
+        directory = os.path.join(self.path, os.path.dirname(prefix))
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return [], []
+
+        objects = []
+        prefixes = []
+        for entry in entries:
+            name = self._remove_path_and_metadata([entry.path])
+            if not name or not name[0].startswith(prefix):
+                continue
+            name = name[0]
+            try:
+                if entry.is_dir():
+                    prefixes.append(name + SEPARATOR)
+                else:
+                    stat = entry.stat()
+                    objects.append((name, stat.st_size, None, stat.st_mtime))
+            except OSError:
+                # deleted in the meantime
+                continue
+        return sorted(objects), sorted(prefixes)
+
     def copy(self, source, destination, source_bucket, destination_bucket,
              overwrite, copy_metadata=True):
         """Copies an object
@@ -219,12 +331,12 @@ class LocalClient(CCBackEnd):
             destination_bucket = source_bucket
         source = os.path.join(source_bucket, source)
         destination = os.path.join(destination_bucket, destination)
+        auto_makedirs(destination)
         if copy_metadata:
             source_metadata = os.path.join(source_bucket, source + METADATA_SUFFIX)
             destination_metadata = os.path.join(destination_bucket, destination + METADATA_SUFFIX)
             shutil.copy(source_metadata, destination_metadata)
 
-        auto_makedirs(destination)
         return shutil.copy(source, destination)
 
     def move(self, source, destination, source_bucket, destination_bucket,
@@ -334,6 +446,8 @@ class LocalClient(CCBackEnd):
     def get_object_metadata(self, object_name):
         """Get metadata associated with an object"""
         file_name = os.path.join(self.path, object_name)
+        if not os.path.isfile(file_name):
+            raise FileNotFoundError('Object not found: ' + object_name)
 
         metadata_file_name = file_name + METADATA_SUFFIX
         if os.path.isfile(metadata_file_name):
@@ -349,6 +463,15 @@ class LocalClient(CCBackEnd):
 
         return metadata
 
+    def get_object_version(self, object_name):
+        """Get the modification time and size of a file"""
+        file_name = os.path.join(self.path, object_name)
+        try:
+            stat = os.stat(file_name)
+        except OSError:
+            raise FileNotFoundError('Object not found: ' + object_name)
+        return '%i-%i' % (stat.st_size, stat.st_mtime_ns), stat.st_size
+
     def get_object_size(self, object_name):
         """Get the size in bytes of an object"""
         file_name = os.path.join(self.path, object_name)
@@ -399,5 +522,5 @@ class LocalClient(CCBackEnd):
 
 def auto_makedirs(destination: str) -> None:
     """Create directory tree if destination does not exist."""
-    if not os.path.exists(os.path.dirname(destination)):
-        os.makedirs(os.path.dirname(destination))
+    # exist_ok: another thread may create it in the meantime
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
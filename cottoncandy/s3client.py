@@ -2,24 +2,34 @@
 # vi: set ft=python sts=4 ts=4 sw=4 et:
 
 import logging
+import mmap
 import os
-from functools import reduce
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
+from itertools import islice
 from urllib.parse import unquote
 
 import boto3
 import botocore
 from boto3.s3.transfer import TransferConfig
+from botocore.client import Config
 from botocore.utils import fix_s3_host
 from dateutil.tz import tzlocal
 
-from .backend import CCBackEnd, CloudStream
+from .backend import CCBackEnd, CloudStream, FileNotFoundError
 
 from .utils import (
     DEFAULT_ACL,
     ISBOTO_VERBOSE,
     MANDATORY_BUCKET_PREFIX,
+    MAX_MPU_PARTS,
+    MAX_POOL_CONNECTIONS,
+    MAX_PUT_SIZE,
     MPU_CHUNKSIZE,
+    MPU_INFLIGHT_PARTS,
     MPU_THRESHOLD,
     SEPARATOR,
     THREADS,
@@ -27,14 +37,22 @@ from .utils import (
     clean_object_name,
     has_real_magic,
     mk_aws_path,
-    pathjoin,
+    read_into,
     remove_root,
     remove_trivial_magic,
     sanitize_metadata,
+    split_byte_range,
     string2bool,
     unquote_names,
 )
 
+# maximum number of keys in a ``DeleteObjects`` request
+DELETE_BATCH_SIZE = 1000
+
+# errors of a single transfer, reported without stopping a batch of transfers
+TRANSFER_ERRORS = (botocore.exceptions.BotoCoreError, botocore.exceptions.ClientError,
+                   boto3.exceptions.Boto3Error, RuntimeError, OSError)
+
 
 class S3Client(CCBackEnd):
     """
@@ -43,7 +61,7 @@ class S3Client(CCBackEnd):
     """
 
     @staticmethod
-    def connect(ACCESS_KEY, SECRET_KEY, url, **kwargs):
+    def connect(ACCESS_KEY, SECRET_KEY, url, max_pool_connections=MAX_POOL_CONNECTIONS, **kwargs):
         """Connect to S3 using boto
 
         Parameters
@@ -51,6 +69,8 @@ class S3Client(CCBackEnd):
         ACCESS_KEY
         SECRET_KEY
         url
+        max_pool_connections : int
+            Size of the pool of connections, unless set by ``config``
         kwargs : dict
             Extra keyword arguments to `boto3.resource`
 
@@ -58,6 +78,10 @@ class S3Client(CCBackEnd):
         -------
 
         """
+        config = Config(max_pool_connections = max_pool_connections)
+        if kwargs.get('config') is not None:
+            config = config.merge(kwargs['config'])
+        kwargs['config'] = config
         s3 = boto3.resource('s3',
                             endpoint_url=url,
                             aws_access_key_id=ACCESS_KEY,
@@ -79,8 +103,13 @@ class S3Client(CCBackEnd):
         """
         super(S3Client, self).__init__()
 
-        self.connection = S3Client.connect(access_key, secret_key, s3url, **kwargs)
+        # boto3 resources are not thread-safe: each thread gets its own
+        # resource (see ``connection``), on top of the same client
+        self._resource = S3Client.connect(access_key, secret_key, s3url, **kwargs)
+        self._local = threading.local()
         self.url = s3url
+        # to open other connections (e.g. asynchronous clients)
+        self._connect_kwargs = dict(kwargs, aws_access_key_id = access_key, aws_secret_access_key = secret_key)
         self.bucket_name = None
 
         if bucket:
@@ -102,6 +131,18 @@ class S3Client(CCBackEnd):
             logging.getLogger('boto3').setLevel(logging.WARNING)
             logging.getLogger('botocore').setLevel(logging.WARNING)
 
+    @property
+    def connection(self):
+        """boto3 S3 resource of the current thread
+
+        All the resources share the same low-level client, which is
+        thread-safe, and its pool of ``max_pool_connections``.
+        """
+        resource = getattr(self._local, 'resource', None)
+        if resource is None:
+            resource = self._local.resource = type(self._resource)(client = self._resource.meta.client)
+        return resource
+
     def get_bucket_name(self, bucket_name):
         """
 
@@ -258,39 +299,207 @@ class S3Client(CCBackEnd):
         response = request.all()
         return response
 
+    def _paginate(self, prefix, start_after=None, page_size=1000, delimiter=None, bucket_name=None):
+        """Pages of ``ListObjectsV2`` under ``prefix``"""
+        paginator = self.connection.meta.client.get_paginator('list_objects_v2')
+        kwargs = dict(Bucket = bucket_name or self.bucket_name, Prefix = prefix,
+                      PaginationConfig = dict(PageSize = page_size))
+        if start_after:
+            kwargs['StartAfter'] = start_after
+        if delimiter:
+            kwargs['Delimiter'] = delimiter
+        return paginator.paginate(**kwargs)
+
+    @staticmethod
+    def _page_objects(page):
+        """(name, size, etag, mtime) tuples of a ``ListObjectsV2`` page"""
+        return [(item['Key'], item['Size'], item['ETag'], item['LastModified'].timestamp())
+                for item in page.get('Contents', ())]
+
+    def split_prefix(self, prefix, page_size=1000, start_after=None):
+        """List the objects directly under ``prefix`` and its sub-prefixes
+
+        Returns
+        -------
+        objects : list
+            (name, size, etag, mtime) tuples
+        prefixes : list
+            the sub-prefixes, ending with "/"
+        """
+        objects = []
+        prefixes = []
+        for page in self._paginate(prefix, start_after, page_size, delimiter = SEPARATOR):
+            objects += self._page_objects(page)
+            prefixes += [t['Prefix'] for t in page.get('CommonPrefixes', ())]
+        return objects, prefixes
+
+    @staticmethod
+    def _key_boundaries(prefix, keys, nranges):
+        """Split the names after ``keys[-1]`` into ranges of the key space
+
+        The boundaries are the names that share a beginning with the
+        last key and continue with a larger character, from the deepest
+        to the shallowest position after ``prefix``. Only the characters
+        found in ``keys`` are used, so that most ranges hold some objects.
+
+        Parameters
+        ----------
+        prefix : str
+        keys : list of str
+            sorted names already listed (e.g. the first page)
+        nranges : int
+            maximum number of ranges
+
+        Returns
+        -------
+        boundaries : list of str
+            increasing names, all larger than the last key. The ranges are
+            ``(keys[-1], boundaries[0]]``, ..., ``(boundaries[-1], ...)``.
+        """
+        last = keys[-1]
+        alphabet = sorted(set(''.join(key[len(prefix):] for key in keys)))
+        depth = len(os.path.commonprefix([keys[0], last]))
+        boundaries = []
+        for position in range(min(depth, len(last) - 1), len(prefix) - 1, -1):
+            boundaries += [last[:position] + char for char in alphabet if char > last[position]]
+        if len(boundaries) >= nranges:
+            # keep evenly spaced boundaries
+            step = len(boundaries) / float(nranges)
+            boundaries = [boundaries[int(i * step)] for i in range(1, nranges)]
+        return boundaries
+
+    def _list_range(self, prefix, start_after, stop, page_size, pages, stopped):
+        """List the objects in ``(start_after, stop]`` into the queue ``pages``
+
+        Each page is put in the queue as soon as it is listed. The
+        queue holds a few pages, so this blocks until they are consumed,
+        or until the event ``stopped`` is set. ``None`` is put last.
+        """
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    pages.put(item, timeout = 0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        try:
+            for page in self._paginate(prefix, start_after, page_size):
+                objects = self._page_objects(page)
+                if stop is not None and objects and objects[-1][0] > stop:
+                    objects = [listed for listed in objects if listed[0] <= stop]
+                    put(objects)
+                    break
+                if not put(objects):
+                    return
+        except Exception as error:
+            put(error)
+        put(None)
+
+    def iter_objects(self, prefix='', start_after=None, page_size=1000, threads=1):
+        """List the objects under a prefix, in lexicographic order
+
+        All the pages of ``ListObjectsV2`` are requested, one at a time,
+        while the objects are consumed.
+
+        With ``threads > 1``, listings longer than one page are split
+        into ranges of the key space after the first page (see
+        ``_key_boundaries``). Each range is listed with ``StartAfter``,
+        page by page, on a thread pool. The ranges are consumed in
+        order, and only a few pages of the ``2 * threads`` next ranges
+        are listed ahead, so memory use does not depend on the size
+        of the listing.
+
+        Parameters
+        ----------
+        prefix : str
+        start_after : str, optional
+            Only list the objects after this name
+        page_size : int (default: 1000)
+            Number of objects per request. S3 returns at most 1000.
+        threads : int (default: 1)
+            Number of concurrent listings
+
+        Yields
+        ------
+        (name, size, etag, mtime) tuples, with ``mtime`` a POSIX timestamp
+        """
+        pages = iter(self._paginate(prefix, start_after, page_size))
+        page = next(pages, None)
+        if page is None:
+            return
+        objects = self._page_objects(page)
+        if (threads <= 1) or (not page.get('IsTruncated', False)) or (not objects):
+            # short listings are not worth splitting
+            while page is not None:
+                for listed in self._page_objects(page):
+                    yield listed
+                page = next(pages, None)
+            return
+
+        for listed in objects:
+            yield listed
+
+        keys = [listed[0] for listed in objects]
+        boundaries = self._key_boundaries(prefix, keys, 16 * threads)
+        ranges = iter(zip([keys[-1]] + boundaries, boundaries + [None]))
+        executor = ThreadPoolExecutor(max_workers = threads)
+        stopped = threading.Event()
+        pending = deque()
+        try:
+            while True:
+                while len(pending) < 2 * threads:
+                    bounds = next(ranges, None)
+                    if bounds is None:
+                        break
+                    listed_pages = queue.Queue(maxsize = 2)
+                    executor.submit(self._list_range, prefix, bounds[0], bounds[1], page_size,
+                                    listed_pages, stopped)
+                    pending.append(listed_pages)
+                if not pending:
+                    break
+                listed_pages = pending.popleft()
+                for objects in iter(listed_pages.get, None):
+                    if isinstance(objects, Exception):
+                        raise objects
+                    for listed in objects:
+                        yield listed
+        finally:
+            stopped.set()
+            executor.shutdown(wait = False)
+
     @property
     def size(self):
         return self.get_current_bucket_size()
 
-    def get_current_bucket_size(self, limit=10 ** 6, page_size=10 ** 6):
+    def get_current_bucket_size(self, limit=None, page_size=1000, threads=THREADS):
         """Counts the size of all objects in the current bucket.
 
+        The objects are listed page by page, so memory use does not
+        depend on the number of objects. Large buckets are listed
+        in parallel (see ``iter_objects``).
+
         Parameters
         ----------
-        limit : int, 1000
-            Maximum number of items to return
+        limit : int, optional
+            Maximum number of objects to count. Defaults to all of them.
         page_size : int, 1000
             The page size for pagination
+        threads : int
+            Number of concurrent listings
 
         Returns
         -------
         total_bytes : int
             The byte count of all objects in the bucket.
-
-        Notes
-        -----
-        Because paging does not work properly, if there are more than
-        limit,page_size number of objects in the bucket, this function will
-        underestimate the total size. Check the printed number of objects for
-        suspicious round numbers.
-        TODO(anunez): Remove this note when the bug is fixed.
         """
         assert self.check_bucket_exists(self.bucket_name)
-        obs = self.list_objects(limit = limit, page_size = page_size)
-        object_sizes = [t.size for t in obs]
-        total_bytes = sum(object_sizes)
-        num_objects = len(object_sizes)
-        del object_sizes
+        num_objects = 0
+        total_bytes = 0
+        for _, size, _, _ in islice(self.iter_objects(page_size = page_size, threads = threads), limit):
+            num_objects += 1
+            total_bytes += size
 
         txt = "%i bytes (%s) over %i objects"
         print(txt % (total_bytes, bytes2human(total_bytes), num_objects))
@@ -330,6 +539,9 @@ class S3Client(CCBackEnd):
     def upload_stream(self, stream, cloud_name, metadata, permissions, threads):
         """Uploads a stream
 
+        Streams that are not seekable are uploaded as they are read,
+        holding at most ``mpu_inflight_parts`` parts in memory.
+
         Parameters
         ----------
         threads
@@ -344,12 +556,40 @@ class S3Client(CCBackEnd):
         config = TransferConfig(max_concurrency = threads,
                                 multipart_chunksize = MPU_CHUNKSIZE,
                                 multipart_threshold = MPU_THRESHOLD)
+        # bounds the memory used by streams that are not seekable
+        config.max_in_memory_upload_chunks = MPU_INFLIGHT_PARTS
         return obj.upload_fileobj(stream, ExtraArgs = {'ACL': permissions, 'Metadata': metadata},
                                                 Config = config)
 
+    @clean_object_name
+    def head_object(self, object_name, bucket_name=None):
+        """Get the size and metadata of an object with a single HEAD request
+
+        Parameters
+        ----------
+        object_name : str
+        bucket_name : str, optional
+
+        Returns
+        -------
+        response : dict or None
+            The ``head_object`` response (``ContentLength``, ``Metadata``, etc.)
+            or None if the object does not exist.
+        """
+        bucket_name = self.get_bucket_name(bucket_name)
+        try:
+            return self.connection.meta.client.head_object(Bucket = bucket_name,
+                                                           Key = object_name)
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] == "404":
+                return None
+            raise e
+
     def download_stream(self, object_name, threads):
         """Download object raw data.
-        This simply calls the object body ``read()`` method.
+        Objects larger than ``mpd_use_threshold`` are downloaded
+        with a parallel multi-part download. Smaller objects
+        cost a single GET request.
 
         Parameters
         ---------
@@ -360,16 +600,78 @@ class S3Client(CCBackEnd):
         stream
             file-like stream of object data
         """
-        if not self.check_file_exists(object_name):
+        try:
+            cloudstream = self.open_stream(object_name)
+        except FileNotFoundError:
             raise IOError('Object "%s" does not exist' % object_name)
-        s3_object = self.get_s3_object(object_name)
-        config = TransferConfig(max_concurrency = threads,
-                                multipart_chunksize = MPU_CHUNKSIZE,
-                                multipart_threshold = MPU_THRESHOLD)
+        nbytes = cloudstream.size
+
         byteStream = BytesIO()
-        s3_object.download_fileobj(byteStream, Config = config)
+        with cloudstream.content:
+            if nbytes > 0:
+                # allocate the stream once and fill it in place
+                byteStream.seek(nbytes - 1)
+                byteStream.write(b'\0')
+                view = byteStream.getbuffer()
+                self.download_parts_into(object_name, view, threads = threads,
+                                         stream = cloudstream.content)
+                view.release()
         byteStream.seek(0)
-        return CloudStream(byteStream, sanitize_metadata(s3_object.metadata))
+        return CloudStream(byteStream, cloudstream.metadata, nbytes)
+
+    @clean_object_name
+    def open_stream(self, object_name):
+        """Open an S3 object for sequential reading.
+        The body and metadata come from a single GET request.
+
+        Parameters
+        ----------
+        object_name : str
+
+        Returns
+        -------
+        stream : CloudStream
+            The content is the streaming body of the response
+
+        Raises
+        ------
+        FileNotFoundError
+            If the object does not exist
+        """
+        try:
+            response = self.connection.meta.client.get_object(Bucket = self.bucket_name,
+                                                              Key = object_name)
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ("404", "NoSuchKey"):
+                raise FileNotFoundError('Object not found: ' + object_name)
+            raise e
+        return CloudStream(response['Body'], sanitize_metadata(response['Metadata']),
+                           response['ContentLength'])
+
+    @clean_object_name
+    def download_into(self, object_name, buffer, offset=0):
+        """Download a byte range of an S3 object directly into a buffer.
+
+        Parameters
+        ----------
+        object_name : str
+        buffer : writable buffer
+            ``len(buffer)`` bytes starting at ``offset`` are
+            requested with a ranged GET.
+        offset : int
+
+        Returns
+        -------
+        nbytes : int
+        """
+        nbytes = memoryview(buffer).nbytes
+        if nbytes == 0:
+            return 0
+        byte_range = 'bytes=%i-%i' % (offset, offset + nbytes - 1)
+        response = self.connection.meta.client.get_object(Bucket = self.bucket_name,
+                                                          Key = object_name,
+                                                          Range = byte_range)
+        return read_into(response['Body'], buffer)
 
     def upload_file(self, file_name, cloud_name=None, permissions=DEFAULT_ACL, threads = THREADS):
         """Upload a file to S3.
@@ -398,7 +700,13 @@ class S3Client(CCBackEnd):
         return s3_object.upload_file(file_name, ExtraArgs={'ACL': permissions}, Config = config)
 
     def download_to_file(self, object_name, local_name, threads):
-        """Download S3 object to a file
+        """Download S3 object to a file.
+        Objects larger than ``mpd_use_threshold`` are downloaded
+        with a parallel multi-part download.
+
+        The data is written to a temporary file next to ``local_name``,
+        which is renamed when the download is complete: a failed
+        download leaves ``local_name`` as it was.
 
         Parameters
         ----------
@@ -406,40 +714,205 @@ class S3Client(CCBackEnd):
         local_name : str
             Absolute path where the data will be downloaded on disk
         """
-        assert self.check_file_exists(object_name)  # make sure object exists
-        s3_object = self.get_s3_object(object_name)
-        config = TransferConfig(max_concurrency = threads,
-                                multipart_chunksize = MPU_CHUNKSIZE,
-                                multipart_threshold = MPU_THRESHOLD)
-        return s3_object.download_file(local_name, Config = config)
+        cloudstream = self.open_stream(object_name)
+        nbytes = cloudstream.size
 
-    def copy(self, source, destination, source_bucket, destination_bucket, overwrite):
+        # unique to this process and thread
+        temporary = os.path.join(os.path.dirname(os.path.abspath(local_name)), '.%s.%i.%i.part' %
+                                 (os.path.basename(local_name), os.getpid(), threading.get_ident()))
+        try:
+            with cloudstream.content, open(temporary, 'w+b') as local_file:
+                local_file.truncate(nbytes)
+                if nbytes > 0:
+                    # parts are written in place through a memory map of the file
+                    with mmap.mmap(local_file.fileno(), nbytes) as mapped:
+                        self.download_parts_into(object_name, mapped, threads = threads,
+                                                 stream = cloudstream.content)
+            os.replace(temporary, local_name)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return True
+
+    def copy(self, source, destination, source_bucket, destination_bucket, overwrite, threads=THREADS):
+        """Copy an object on the server
+
+        Objects larger than ``max_put_size`` (5GB) are copied with a
+        multi-part upload, whose parts are copied concurrently
+        (``UploadPartCopy``).
+        """
         source_bucket = self.get_bucket_name(source_bucket)
         dest_bucket = source_bucket if (destination_bucket is None) else destination_bucket
         dest_bucket = self.get_bucket_name(dest_bucket)
 
-        assert self.check_file_exists(source, bucket_name = source_bucket)
+        source_info = self.head_object(source, bucket_name = source_bucket)
+        assert source_info is not None
         ob_new = self.get_s3_object(destination, bucket_name = dest_bucket)
 
         if self.check_file_exists(ob_new.key, bucket_name = dest_bucket):
             assert overwrite is True
 
-        fpath = pathjoin(source_bucket, source)
-        ob_new.copy_from(CopySource = fpath)
+        self._copy_object(source, ob_new.key, source_info['ContentLength'], source_bucket, dest_bucket,
+                          threads = threads)
         return ob_new
 
-    def move(self, source, destination, source_bucket, destination_bucket, overwrite):
-        new_ob = self.copy(source, destination, source_bucket, destination_bucket, overwrite)
+    def _copy_object(self, source, destination, size, source_bucket, destination_bucket, threads=1):
+        """Copy an object on the server, and check the copy
+
+        The size of the copy is checked, not its ETag: ETags are not
+        MD5s with SSE-KMS or SSE-C, and depend on the part sizes of
+        multi-part uploads.
+
+        Raises
+        ------
+        IOError
+            if the copy does not have the size of the source
+        """
+        client = self.connection.meta.client
+        if size <= MAX_PUT_SIZE:
+            client.copy_object(Bucket = destination_bucket, Key = destination,
+                               CopySource = dict(Bucket = source_bucket, Key = source))
+        else:
+            self._multipart_copy(source, destination, size, source_bucket, destination_bucket,
+                                 threads = threads)
+
+        copy_info = client.head_object(Bucket = destination_bucket, Key = destination)
+        if copy_info['ContentLength'] != size:
+            raise IOError('Copy of %s has %i bytes instead of %i' % (source, copy_info['ContentLength'], size))
+
+    def _multipart_copy(self, source, destination, size, source_bucket, destination_bucket, threads=1):
+        """Copy a large object with ``UploadPartCopy``, part by part
+
+        Returns
+        -------
+        etag : str
+            ETag of the copy
+        """
+        client = self.connection.meta.client
+        source_info = client.head_object(Bucket = source_bucket, Key = source)
+        upload = client.create_multipart_upload(Bucket = destination_bucket, Key = destination,
+                                                Metadata = source_info['Metadata'],
+                                                ContentType = source_info.get('ContentType',
+                                                                              'binary/octet-stream'))
+        chunksize = max(MPU_CHUNKSIZE, -(-size // MAX_MPU_PARTS))
+
+        def copy_part(part):
+            number, (start, stop) = part
+            response = client.upload_part_copy(Bucket = destination_bucket, Key = destination,
+                                               UploadId = upload['UploadId'], PartNumber = number,
+                                               CopySource = dict(Bucket = source_bucket, Key = source),
+                                               CopySourceRange = 'bytes=%i-%i' % (start, stop - 1))
+            return dict(PartNumber = number, ETag = response['CopyPartResult']['ETag'])
+
+        try:
+            with ThreadPoolExecutor(max_workers = threads) as executor:
+                parts = list(executor.map(copy_part, enumerate(split_byte_range(size, chunksize), 1)))
+            response = client.complete_multipart_upload(Bucket = destination_bucket, Key = destination,
+                                                        UploadId = upload['UploadId'],
+                                                        MultipartUpload = dict(Parts = parts))
+        except Exception:
+            client.abort_multipart_upload(Bucket = destination_bucket, Key = destination,
+                                          UploadId = upload['UploadId'])
+            raise
+        return response['ETag']
+
+    def move(self, source, destination, source_bucket, destination_bucket, overwrite, threads=THREADS):
+        new_ob = self.copy(source, destination, source_bucket, destination_bucket, overwrite, threads = threads)
         old_ob = self.get_s3_object(source, bucket_name = source_bucket)
         old_ob.delete()
         return new_ob
 
-    def list_directory(self, path, limit):
+    def copy_prefix(self, source, destination, source_bucket=None, destination_bucket=None,
+                    overwrite=False, move=False, threads=THREADS):
+        """Copy (or move) all the objects under a prefix, on the server
+
+        The objects are copied concurrently while the source is listed.
+        Objects larger than ``max_put_size`` are copied afterwards, one
+        at a time, with their parts copied concurrently. When moving,
+        the sources are deleted in batches once their copy is checked.
+
+        Parameters
+        ----------
+        source : str
+            prefix of the objects to copy (e.g. "data/")
+        destination : str
+            prefix of the copies
+        source_bucket : str, optional
+        destination_bucket : str, optional
+            defaults to ``source_bucket``
+        overwrite : bool
+            overwrite existing objects
+        move : bool
+            delete the sources once copied
+        threads : int
+            number of concurrent requests
+
+        Returns
+        -------
+        copied : list
+            (source, destination) names of the objects copied
+        errors : list
+            (name, message) tuples for the objects that were not copied
+            (or not deleted, when moving)
+        """
+        source_bucket = self.get_bucket_name(source_bucket)
+        dest_bucket = source_bucket if (destination_bucket is None) else destination_bucket
+        dest_bucket = self.get_bucket_name(dest_bucket)
+
+        existing = set()
+        if not overwrite:
+            for page in self._paginate(destination, bucket_name = dest_bucket):
+                existing.update(listed[0] for listed in self._page_objects(page))
+
+        listing = (listed for page in self._paginate(source, bucket_name = source_bucket)
+                   for listed in self._page_objects(page))
+        if (source_bucket == dest_bucket) and destination.startswith(source):
+            # the copies would be listed too
+            listing = list(listing)
+
+        copied = []
+        errors = []
+        large = []
+
+        def copy_object(name, new_name, size, threads=1):
+            try:
+                self._copy_object(name, new_name, size, source_bucket, dest_bucket, threads = threads)
+            except TRANSFER_ERRORS as error:
+                errors.append((name, str(error)))
+            else:
+                copied.append((name, new_name))
+
+        with ThreadPoolExecutor(max_workers = threads) as executor:
+            pending = deque()
+            for name, size, _, _ in listing:
+                new_name = destination + name[len(source):]
+                if new_name in existing:
+                    errors.append((name, 'Destination exists: ' + new_name))
+                elif size > MAX_PUT_SIZE:
+                    large.append((name, new_name, size))
+                else:
+                    pending.append(executor.submit(copy_object, name, new_name, size))
+                while len(pending) > 2 * threads:
+                    pending.popleft().result()
+            for future in pending:
+                future.result()
+        for name, new_name, size in large:
+            copy_object(name, new_name, size, threads = threads)
+
+        if move:
+            errors += self.delete_objects([name for name, _ in copied], threads = threads,
+                                          bucket_name = source_bucket)
+        return copied, errors
+
+    def list_directory(self, path, limit=None):
         """List the contents of a "directory"
 
         Parameters
         ----------
         path : str (default: "/")
+        limit : int, optional
+            Maximum number of children to return. Defaults to all of them.
 
         Returns
         -------
@@ -454,28 +927,92 @@ class S3Client(CCBackEnd):
         path = remove_trivial_magic(path)
         path = mk_aws_path(path)
 
-        response = self.get_bucket().meta.client.list_objects(Bucket = self.bucket_name,
-                                                              Delimiter = SEPARATOR,
-                                                              Prefix = path,
-                                                              MaxKeys = limit)
+        paginator = self.connection.meta.client.get_paginator('list_objects_v2')
+        pages = paginator.paginate(Bucket = self.bucket_name,
+                                   Delimiter = SEPARATOR,
+                                   Prefix = path)
+        directories = []
         object_names = []
-        if 'CommonPrefixes' in response:
-            # we got common paths
-            object_list = [list(t.values()) for t in response['CommonPrefixes']]
-            object_names += reduce(lambda x, y: x + y, object_list)
-        if 'Contents' in response:
-            # we got objects on the leaf nodes
-            object_names += unquote_names([t['Key'] for t in response['Contents']])
+        for page in pages:
+            # common paths, and objects on the leaf nodes
+            directories += [t['Prefix'] for t in page.get('CommonPrefixes', ())]
+            object_names += unquote_names([t['Key'] for t in page.get('Contents', ())])
+            if (limit is not None) and (len(directories) + len(object_names) >= limit):
+                break
+        object_names = (directories + object_names)[:limit]
         return [os.path.normpath(n) for n in object_names]
 
     def delete(self, object_name, recursive=False, delete=False):
         raise RuntimeError('Deleting on S3 backend is implemented by cottoncandy interface object')
 
+    def delete_objects(self, object_names, threads=THREADS, bucket_name=None):
+        """Delete objects with ``DeleteObjects``, 1000 keys per request
+
+        The names are consumed lazily (e.g. from a listing), and up to
+        ``threads`` requests are in flight at a time.
+
+        Parameters
+        ----------
+        object_names : iterable of str
+        threads : int
+        bucket_name : str, optional
+            defaults to the current bucket
+
+        Returns
+        -------
+        errors : list
+            (name, message) tuples for the objects that were not deleted
+        """
+        client = self.connection.meta.client
+        bucket_name = self.get_bucket_name(bucket_name)
+
+        def delete_batch(batch):
+            response = client.delete_objects(Bucket = bucket_name,
+                                             Delete = dict(Objects = [dict(Key = name) for name in batch],
+                                                           Quiet = True))
+            return [(error['Key'], '%s: %s' % (error.get('Code'), error.get('Message')))
+                    for error in response.get('Errors', ())]
+
+        errors = []
+        object_names = iter(object_names)
+        with ThreadPoolExecutor(max_workers = threads) as executor:
+            pending = deque()
+            while True:
+                batch = list(islice(object_names, DELETE_BATCH_SIZE))
+                if batch:
+                    pending.append((batch, executor.submit(delete_batch, batch)))
+                while pending and (len(pending) >= threads or not batch):
+                    requested, future = pending.popleft()
+                    try:
+                        errors += future.result()
+                    except TRANSFER_ERRORS as error:
+                        errors += [(name, str(error)) for name in requested]
+                if not batch:
+                    break
+        return errors
+
     def get_object_metadata(self, object_name):
         """Get metadata associated with an object"""
-        s3_object = self.get_s3_object(object_name)
-        metadata = sanitize_metadata(s3_object.metadata)
-        return metadata
+        response = self.head_object(object_name)
+        if response is None:
+            raise FileNotFoundError('Object not found: ' + object_name)
+        return sanitize_metadata(response['Metadata'])
+
+    def get_object_version(self, object_name):
+        """Get the ETag and modification date, and the size of an object"""
+        info = self.get_object_info(object_name)
+        return info['version'], info['size']
+
+    def get_object_info(self, object_name):
+        """Get the size, version and metadata of an object with a single HEAD request"""
+        response = self.head_object(object_name)
+        if response is None:
+            raise FileNotFoundError('Object not found: ' + object_name)
+        return dict(size = response['ContentLength'],
+                    version = '%s %s' % (response['ETag'], response['LastModified'].isoformat()),
+                    metadata = sanitize_metadata(response['Metadata']),
+                    etag = response['ETag'],
+                    mtime = response['LastModified'].timestamp())
 
     def get_object_size(self, object_name):
         """Get the size in bytes of an object"""
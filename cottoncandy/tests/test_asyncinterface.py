@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+from cottoncandy.asyncinterface import AsyncInterface
+from cottoncandy.backend import FileNotFoundError
+from cottoncandy.cacheclient import CacheClient
+
+
+def test_async_interface(cci, object_name):
+    names = [cci.pathjoin(object_name, 'dir%i' % (i % 2), 'file%i' % i) for i in range(6)]
+    data = np.random.randn(10, 3)
+
+    async def roundtrip():
+        async with AsyncInterface(cci) as acci:
+            await asyncio.gather(*[acci.upload_json(name, dict(index=i)) for i, name in enumerate(names)])
+            await acci.upload_raw_array(cci.pathjoin(object_name, 'array'), data)
+            await asyncio.sleep(cci.wait_time)
+
+            contents = await asyncio.gather(*[acci.download_json(name) for name in names])
+            assert contents == [dict(index=i) for i in range(len(names))]
+            assert np.allclose(await acci.download_raw_array(cci.pathjoin(object_name, 'array')), data)
+
+            assert await acci.exists_object(names[0])
+            assert not await acci.exists_object(cci.pathjoin(object_name, 'missing'))
+            with pytest.raises(FileNotFoundError):
+                await acci.download_json(cci.pathjoin(object_name, 'missing'))
+
+            assert await acci.glob(object_name + '/dir1/*') == sorted(names[1::2])
+            assert await acci.glob(object_name + '/dir*/file[0-2]') == sorted(names[:3])
+            listed = [obj[0] async for obj in acci.iter_objects(cci.pathjoin(object_name, 'dir0/'), page_size=2)]
+            assert listed == sorted(names[::2])
+            # listed in concurrent ranges
+            listed = [obj[0] async for obj in acci.iter_objects(object_name + '/', page_size=2, threads=3)]
+            assert listed == sorted(names + [cci.pathjoin(object_name, 'array')])
+            assert await acci.glob(object_name + '/*/file*', page_size=2, threads=3) == sorted(names)
+            assert await acci.glob(object_name + '/dir*', page_size=2, threads=3) == sorted(names)
+
+            await acci.rm(object_name, recursive=True)
+
+    asyncio.run(roundtrip())
+    time.sleep(cci.wait_time)
+    assert cci.glob(object_name + '/*') == []
+
+
+def test_async_raw_arrays(cci, object_name, monkeypatch, tmp_path):
+    from cottoncandy import asyncinterface
+    # transfer the arrays in several parts
+    monkeypatch.setattr(asyncinterface, 'MPU_CHUNKSIZE', 5 * 2**20)
+    monkeypatch.setattr(asyncinterface, 'MPD_THRESHOLD', 2**20)
+    monkeypatch.setattr(asyncinterface, 'MPD_CHUNKSIZE', 2**20)
+    data = np.random.randn(1000, 1500)
+    name = cci.pathjoin(object_name, 'array')
+
+    async def roundtrip():
+        async with AsyncInterface(cci) as acci:
+            for compression in [False, 'gzip', 'Zstd']:
+                await acci.upload_raw_array(name, data, compression=compression, threads=3)
+                await asyncio.sleep(cci.wait_time)
+                assert np.array_equal(cci.download_raw_array(name), data)
+                assert np.array_equal(await acci.download_raw_array(name, threads=3), data)
+            assert np.array_equal(await acci.download_raw_array(name, index=slice(10, 20)), data[10:20])
+            with pytest.raises(FileNotFoundError):
+                await acci.download_raw_array(cci.pathjoin(object_name, 'missing'))
+
+            # cancelling a compressed download does not leave it hanging
+            task = asyncio.ensure_future(acci.download_raw_array(name, threads=3))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+            # the object cache is used
+            cci.backend_interface = cached = CacheClient(cci.backend_interface, str(tmp_path), 2**30)
+            try:
+                assert np.array_equal(await acci.download_raw_array(name, threads=3), data)
+                assert cached._lookup(name)[1] is not None
+            finally:
+                cci.backend_interface = cached.client
+
+            if acci.is_native:
+                # cancelling an upload aborts it
+                task = asyncio.ensure_future(acci.upload_raw_array(cci.pathjoin(object_name, 'cancelled'),
+                                                                   data, compression=False))
+                await asyncio.sleep(0.05)
+                task.cancel()
+                with pytest.raises(asyncio.CancelledError):
+                    await task
+                client = await acci._get_client()
+                uploads = await client.list_multipart_uploads(Bucket=acci.bucket_name,
+                                                              Prefix=cci.pathjoin(object_name, 'cancelled'))
+                assert not uploads.get('Uploads')
+            await acci.rm(object_name, recursive=True)
+
+    asyncio.run(roundtrip())
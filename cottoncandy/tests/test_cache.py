@@ -0,0 +1,149 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from cottoncandy.cacheclient import DATA_SUFFIX, ArrayCache, CacheClient, MetadataCacheClient
+
+
+@pytest.fixture()
+def cached_cci(cci, tmp_path):
+    client = cci.backend_interface
+    cci.backend_interface = CacheClient(client, str(tmp_path), 2**20)
+    try:
+        yield cci
+    finally:
+        cci.backend_interface = client
+
+
+def cached_files(cci):
+    return [fl for fl in os.listdir(cci.backend_interface.cache_path) if fl.endswith(DATA_SUFFIX)]
+
+
+def test_cache_roundtrip(cached_cci, object_name):
+    cci = cached_cci
+    data = np.random.randn(100, 10)
+    cci.upload_raw_array(object_name, data, compression=False)
+    time.sleep(cci.wait_time)
+    assert np.allclose(cci.download_raw_array(object_name), data)
+    assert len(cached_files(cci)) == 1
+
+    # served from the cache
+    assert np.allclose(cci.download_raw_array(object_name), data)
+    assert np.allclose(cci.download_raw_array(object_name, index=[3, 1]), data[[3, 1]])
+    assert len(cached_files(cci)) == 1
+
+    # overwritten objects are downloaded again
+    time.sleep(max(cci.wait_time, 1))
+    data = np.random.randn(100, 10)
+    cci.upload_raw_array(object_name, data, compression='gzip')
+    time.sleep(cci.wait_time)
+    assert np.allclose(cci.download_raw_array(object_name), data)
+
+    content = dict(hello=0, bye='bye!')
+    cci.upload_json(object_name, content)
+    time.sleep(cci.wait_time)
+    assert cci.download_json(object_name) == content
+    assert cci.download_json(object_name) == content
+    cci.rm(object_name)
+
+
+def test_cache_eviction(cached_cci, object_name):
+    cci = cached_cci
+    names = [object_name + '_%i' % i for i in range(3)]
+    for name in names:
+        cci.upload_raw_array(name, np.random.randn(2**16 // 8), compression=False)
+    time.sleep(cci.wait_time)
+
+    # the budget holds 2 objects
+    cci.backend_interface.max_size = 2**17 + 1000
+    for name in names:
+        cci.download_raw_array(name)
+        time.sleep(0.01)
+    assert len(cached_files(cci)) == 2
+
+    # least recently used object was evicted
+    stem = cci.backend_interface._entry_stem(names[0])
+    assert not os.path.exists(stem + DATA_SUFFIX)
+
+    # larger than the budget: not cached
+    cci.backend_interface.clear()
+    cci.backend_interface.max_size = 1000
+    cci.download_raw_array(names[0])
+    assert len(cached_files(cci)) == 0
+    for name in names:
+        cci.rm(name)
+
+
+def test_array_cache(cci, object_name):
+    cci.array_cache = ArrayCache(2**20)
+    try:
+        data = np.random.randn(100, 10)
+        cci.upload_raw_array(object_name, data)
+        time.sleep(cci.wait_time)
+
+        array = cci.download_raw_array(object_name)
+        assert np.allclose(array, data)
+        assert not array.flags.writeable
+        assert len(cci.array_cache) == 1
+
+        # hits share the cached memory
+        cached = cci.download_raw_array(object_name)
+        assert np.shares_memory(array, cached)
+        assert np.allclose(cci.download_raw_array(object_name, index=slice(2, 5)), data[2:5])
+        copy = cci.download_raw_array(object_name, copy=True)
+        assert copy.flags.writeable and not np.shares_memory(copy, cached)
+
+        # new version of the object
+        time.sleep(max(cci.wait_time, 1))
+        data = np.random.randn(100, 10)
+        cci.upload_raw_array(object_name, data)
+        time.sleep(cci.wait_time)
+        assert np.allclose(cci.download_raw_array(object_name), data)
+        assert len(cci.array_cache) == 1
+        assert cci.array_cache.nbytes == data.nbytes
+
+        # evicted when over budget
+        cci.array_cache.put('other', 'version', np.zeros(2**20 // 8 - 10))
+        assert len(cci.array_cache) == 1
+        cci.rm(object_name)
+    finally:
+        cci.array_cache = None
+
+
+def test_metadata_cache(cci, object_name, monkeypatch):
+    client = cci.backend_interface
+    requests = []
+    get_object_info = client.get_object_info
+    monkeypatch.setattr(client, 'get_object_info', lambda name: requests.append(name) or get_object_info(name))
+
+    cci.backend_interface = MetadataCacheClient(client, 60)
+    try:
+        # "not found" is remembered
+        assert not cci.exists_object(object_name)
+        assert not cci.exists_object(object_name)
+        assert len(requests) == 1
+
+        # uploads invalidate
+        data = np.arange(10)
+        cci.upload_raw_array(object_name, data, compression=False)
+        time.sleep(cci.wait_time)
+        for _ in range(3):
+            assert cci.exists_object(object_name)
+            assert cci.backend_interface.get_object_size(object_name) == data.nbytes
+            assert cci.backend_interface.get_object_metadata(object_name)['shape'] == '10'
+        assert len(requests) == 2
+
+        # deletes invalidate
+        cci.rm(object_name)
+        time.sleep(cci.wait_time)
+        assert not cci.exists_object(object_name)
+        assert len(requests) == 3
+
+        # results expire
+        cci.backend_interface.ttl = 0
+        assert not cci.exists_object(object_name)
+        assert len(requests) == 4
+    finally:
+        cci.backend_interface = client
@@ -1,6 +1,7 @@
 import time
 
 import numpy as np
+import pytest
 
 
 def content_generator():
@@ -35,3 +36,175 @@ def test_upload_raw_array(cci, object_name):
         dat = cci.download_raw_array(object_name)
         assert np.allclose(dat, content)
         cci.rm(object_name, recursive=True)
+
+
+def test_compression_frames(cci, object_name, monkeypatch):
+    from .. import interfaces
+    monkeypatch.setattr(interfaces, 'COMPRESSION_FRAME_NBYTES', 1000)
+
+    content = np.random.randn(100, 30)
+    for compression in ['Zstd', 'LZ4', 'Zlib', 'BZ2']:
+        for workers in [1, 3]:
+            cci.upload_raw_array(object_name, content, compression=compression, workers=workers)
+            time.sleep(cci.wait_time)
+            assert cci.backend_interface.get_object_metadata(object_name)['framesize'] == '125'
+            dat = cci.download_raw_array(object_name)
+            assert np.array_equal(dat, content)
+            cci.rm(object_name, recursive=True)
+
+
+def test_compression_frames_budget(cci, object_name, monkeypatch):
+    # all the workers are used, unless the frames in memory are capped
+    from .. import interfaces
+    monkeypatch.setattr(interfaces, 'COMPRESSION_FRAME_NBYTES', 1000)
+
+    encode_frames = interfaces.encode_frames
+    workers = []
+
+    def recording_encode_frames(*args, **kwargs):
+        workers.append(kwargs['workers'])
+        return encode_frames(*args, **kwargs)
+    monkeypatch.setattr(interfaces, 'encode_frames', recording_encode_frames)
+
+    content = np.random.randn(100, 30)
+    cci.upload_raw_array(object_name, content, compression='Zstd', workers=8)
+    time.sleep(cci.wait_time)
+    assert workers == [8]
+
+    monkeypatch.setattr(interfaces, 'COMPRESSION_INFLIGHT_FRAMES', 3)
+    with pytest.warns(UserWarning, match='2 workers instead of 8'):
+        cci.upload_raw_array(object_name, content, compression='Zstd', workers=8)
+    time.sleep(cci.wait_time)
+    assert workers == [8, 2]
+    assert np.array_equal(cci.download_raw_array(object_name), content)
+    cci.rm(object_name, recursive=True)
+
+
+def test_compression_single_frame(cci, object_name):
+    # objects uploaded before arrays were compressed in frames
+    import numcodecs
+    from io import BytesIO
+
+    content = np.random.randn(100, 30)
+    compressor = numcodecs.get_codec(dict(id='zstd'))
+    cci.upload_object(object_name, BytesIO(compressor.encode(content)),
+                      dtype=content.dtype.str, shape='100,30',
+                      compression='Zstd', order='C')
+    time.sleep(cci.wait_time)
+    dat = cci.download_raw_array(object_name)
+    assert np.array_equal(dat, content)
+    cci.rm(object_name, recursive=True)
+
+
+def test_compression_unframed(cci, object_name):
+    # arrays that fit in one frame are readable without framing
+    import numcodecs
+
+    compressor = numcodecs.get_codec(dict(id='zstd'))
+    content = np.random.randn(100, 30)
+    cci.upload_raw_array(object_name, content, compression='Zstd')
+    time.sleep(cci.wait_time)
+    assert 'framesize' not in cci.backend_interface.get_object_metadata(object_name)
+    assert compressor.decode(cci.download_object(object_name)) == content.tobytes()
+    assert np.array_equal(cci.download_raw_array(object_name), content)
+    cci.rm(object_name, recursive=True)
+
+
+def test_upload_raw_array_seekable(cci, object_name, monkeypatch):
+    from cottoncandy.cacheclient import WrapperClient
+
+    class SizedUploadClient(WrapperClient):
+        # like GDriveClient
+        streaming_uploads = False
+
+        def upload_stream(self, stream, cloud_name, metadata, permissions, threads):
+            stream.seek(0, 2)
+            assert stream.tell() > 0
+            stream.seek(0)
+            return self.client.upload_stream(stream, cloud_name, metadata, permissions, threads)
+
+    client = cci.backend_interface
+    monkeypatch.setattr(cci, 'backend_interface', SizedUploadClient(client))
+    content = np.random.randn(100, 30)
+    for compression in [False, 'gzip', 'Zstd']:
+        cci.upload_raw_array(object_name, content, compression=compression)
+        time.sleep(cci.wait_time)
+        assert np.array_equal(cci.download_raw_array(object_name), content)
+    cci.rm(object_name)
+
+
+def test_encode_frames_release(monkeypatch):
+    import numcodecs
+    from cottoncandy import utils
+
+    events = []
+
+    def advisor(array):
+        def advise(view, advice):
+            if advice == 'MADV_DONTNEED':
+                events.append(('release', view[0]))
+        return advise
+    monkeypatch.setattr(utils, '_memmap_advisor', advisor)
+
+    array = np.arange(100, dtype=np.float64)
+    codec = numcodecs.get_codec(dict(id='zstd'))
+    chunks = utils.encode_frames(codec, array, 10, workers=4)
+    for start in range(0, 100, 10):
+        next(chunks)
+        frame = np.frombuffer(codec.decode(next(chunks)), np.float64)
+        events.append(('consumed', frame[0]))
+    assert list(chunks) == []
+    # each frame is released after it was consumed, and not before
+    assert events == [(event, start) for start in range(0, 100, 10) for event in ['consumed', 'release']]
+
+
+def test_encode_frames_processes(monkeypatch):
+    # codecs that hold the GIL are pickled to a process pool
+    import numcodecs
+    from io import BytesIO
+    from cottoncandy import utils
+
+    pools = []
+
+    class RecordingPool(utils.ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            pools.append(self)
+            super(RecordingPool, self).__init__(*args, **kwargs)
+    monkeypatch.setattr(utils, 'ProcessPoolExecutor', RecordingPool)
+
+    array = np.random.randn(100, 3)
+    codec = numcodecs.get_codec(dict(id='shuffle', elementsize=8))
+    assert codec.codec_id not in utils.NOGIL_CODECS
+    stream = BytesIO(b''.join(utils.encode_frames(codec, array, 40, workers=2)))
+    assert len(pools) == 1
+
+    out = np.empty_like(array)
+    utils.decode_frames(stream, codec, out, 40)
+    assert np.array_equal(out, array)
+
+
+def test_compression_parts(cci, object_name, monkeypatch):
+    # compressed objects are downloaded in parallel parts, decoded in order
+    from .. import interfaces
+    monkeypatch.setattr(interfaces, 'COMPRESSION_FRAME_NBYTES', 1000)
+
+    backend = cci.backend_interface
+    iter_parts = backend.iter_parts
+    parts = []
+
+    def small_parts(*args, **kwargs):
+        for part in iter_parts(*args, chunksize=500, threshold=500, **kwargs):
+            parts.append(len(part))
+            yield part
+    monkeypatch.setattr(backend, 'iter_parts', small_parts)
+
+    content = np.random.randn(100, 30)
+    for compression in ['Zstd', 'gzip']:
+        del parts[:]
+        cci.upload_raw_array(object_name, content, compression=compression)
+        time.sleep(cci.wait_time)
+        dat = cci.download_raw_array(object_name, threads=3)
+        assert np.array_equal(dat, content)
+        assert len(parts) > 1
+        assert sum(parts) == backend.get_object_info(object_name)['size']
+        cci.rm(object_name, recursive=True)
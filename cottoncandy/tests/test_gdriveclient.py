@@ -0,0 +1,38 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+
+from ..backend import CloudStream
+
+gdriveclient = pytest.importorskip('cottoncandy.gdriveclient')
+
+
+def test_download_ranges_into_fetches_once(monkeypatch):
+    '''Test that several ranges of a file are copied from a single download'''
+    data = np.random.bytes(1000)
+    calls = []
+
+    def download_stream(drive_file, threads=1):
+        calls.append(drive_file)
+        return CloudStream(BytesIO(data), {})
+
+    client = gdriveclient.GDriveClient.__new__(gdriveclient.GDriveClient)
+    monkeypatch.setattr(client, 'download_stream', download_stream)
+
+    buffers = [bytearray(100), bytearray(300), bytearray(50)]
+    offsets = [0, 400, 950]
+    nbytes = client.download_ranges_into('file', list(zip(offsets, buffers)), threads=4)
+    assert calls == ['file']
+    assert nbytes == 450
+    for offset, buffer in zip(offsets, buffers):
+        assert bytes(buffer) == data[offset:offset + len(buffer)]
+
+
+def test_copy_prefix_not_supported():
+    '''Test that recursive copies fail clearly, as folders cannot be listed by prefix'''
+    client = gdriveclient.GDriveClient.__new__(gdriveclient.GDriveClient)
+    with pytest.raises(NotImplementedError):
+        client.copy_prefix('data/', 'copy/')
+    with pytest.raises(NotImplementedError):
+        client.copy_prefix('data/', 'copy/', move=True)
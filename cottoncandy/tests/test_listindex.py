@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+
+from cottoncandy.listindex import IndexedClient
+
+
+@pytest.fixture()
+def indexed_cci(cci, tmp_path):
+    client = cci.backend_interface
+    cci.backend_interface = cci._indexed_client = IndexedClient(client, str(tmp_path), 3600)
+    try:
+        yield cci
+    finally:
+        cci.backend_interface = client
+        cci._indexed_client = None
+
+
+def test_listing_index(indexed_cci, object_name, monkeypatch):
+    cci = indexed_cci
+    client = cci.backend_interface.client
+    names = ['a/b/x', 'a/c', 'a/d/e', 'a/d/f', 'b']
+    for name in names:
+        cci.upload_json(cci.pathjoin(object_name, name), dict(name=name))
+    time.sleep(cci.wait_time)
+
+    listings = []
+    iter_objects = client.iter_objects
+    monkeypatch.setattr(client, 'iter_objects', lambda *args, **kwargs: listings.append(args) or
+                        iter_objects(*args, **kwargs))
+
+    expected = sorted(cci.pathjoin(object_name, name) for name in names)
+    assert cci.glob(object_name + '/*') == expected
+    assert cci.glob(object_name + '/a/d/*') == expected[2:4]
+    assert sorted(cci.lsdir(cci.pathjoin(object_name, 'a'))) == \
+        [cci.pathjoin(object_name, name) for name in ['a/b', 'a/c', 'a/d']]
+    assert sorted(cci.ls(object_name + '/a/*/e')) == [cci.pathjoin(object_name, 'a/d/e')]
+    assert len(listings) == 1
+
+    # changes made through the interface are seen without listing again
+    cci.upload_json(cci.pathjoin(object_name, 'a/g'), dict())
+    cci.rm(cci.pathjoin(object_name, 'a/c'))
+    time.sleep(cci.wait_time)
+    expected = sorted(cci.pathjoin(object_name, name) for name in ['a/b/x', 'a/d/e', 'a/d/f', 'a/g', 'b'])
+    assert cci.glob(object_name + '/*') == expected
+    count, nbytes = cci.listing_index.total_size(object_name + '/')
+    assert count == 5 and nbytes > 0
+
+    # checked objects keep their real ETag and modification time, or NULL
+    info = client.get_object_info(cci.pathjoin(object_name, 'a/g'))
+    row, = [obj for obj in cci.iter_objects(object_name + '/') if obj[0] == cci.pathjoin(object_name, 'a/g')]
+    assert row[2:] == (info.get('etag'), info.get('mtime'))
+    assert len(listings) == 1
+
+    # incremental updates only list new names
+    assert cci.update_index(object_name + '/', incremental=True) == 0
+    assert listings[-1][0] == object_name + '/'
+
+    cci.rm(object_name, recursive=True)
+    time.sleep(cci.wait_time)
+    assert cci.glob(object_name + '/*') == []
+
+
+def test_listing_index_unlocked(indexed_cci, object_name, monkeypatch):
+    # the index can be changed while a prefix is listed
+    cci = indexed_cci
+    client = cci.backend_interface.client
+    names = [cci.pathjoin(object_name, name) for name in ['a/x', 'a/y']]
+    for name in names:
+        cci.upload_json(name, dict())
+    time.sleep(cci.wait_time)
+
+    listed = threading.Event()
+    release = threading.Event()
+    iter_objects = client.iter_objects
+
+    def slow_iter_objects(*args, **kwargs):
+        for obj in iter_objects(*args, **kwargs):
+            yield obj
+        listed.set()
+        release.wait(10)
+    monkeypatch.setattr(client, 'iter_objects', slow_iter_objects)
+
+    index = cci.listing_index
+    updating = threading.Thread(target=index.update, args=(object_name + '/',))
+    updating.start()
+    assert listed.wait(10)
+    # deleted after being listed
+    removing = threading.Thread(target=cci.rm, args=(names[1],))
+    removing.start()
+    removing.join(10)
+    assert not removing.is_alive()
+    release.set()
+    updating.join(10)
+    assert not updating.is_alive()
+
+    time.sleep(cci.wait_time)
+    assert cci.glob(object_name + '/*') == names[:1]
+    cci.rm(object_name, recursive=True)
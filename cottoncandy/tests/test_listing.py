@@ -0,0 +1,56 @@
+import re
+
+import numpy as np
+
+from cottoncandy.listing import Listing
+from cottoncandy.s3client import S3Client
+from cottoncandy.utils import glob_regex
+
+
+def test_listing():
+    names = ['a/b/c', 'a/b/d.npy', 'a/bé/q.npy', 'a/x', 'é/x.npy', 'zz', 'a/[x]/y']
+    objects = [(name, i, None, float(i)) for i, name in enumerate(names)]
+    listing = Listing.from_objects(objects)
+    assert len(listing) == len(names)
+    assert listing.names == names
+    assert list(listing) == objects
+    assert listing[-1] == objects[-1]
+    assert listing[[1, 4]].names == [names[1], names[4]]
+
+    assert listing[listing.startswith('a/b')].names == names[:3]
+    for pattern in ['a/*/*.npy', '*.npy', 'a/b*/*', '[!a]*', '?/*', 'a/[[]x]/y', '*']:
+        expected = [name for name in names if re.fullmatch(glob_regex(pattern), name, re.DOTALL)]
+        assert listing[listing.match(glob_regex(pattern))].names == expected
+    assert listing[listing.match(glob_regex('a/*/*.npy'))].names == ['a/b/d.npy', 'a/bé/q.npy']
+    # a negated class can span names in the joined text
+    assert list(Listing.from_names(['ab', 'c', 'ad']).match('a[^x]')) == [True, False, True]
+
+    ordered = listing.sorted()
+    assert ordered.names == sorted(names, key=lambda name: name.encode())
+    assert np.all(ordered.sizes == [names.index(name) for name in ordered.names])
+
+    assert ordered.sorted() is ordered
+
+    # prefixes, NUL bytes, duplicates and one long name
+    tricky = ['ab', 'a', 'a\0', 'a\0', 'abcdefghij', 'abcdefgh', 'x' * 1024, '', 'abcdefgh\0', 'a']
+    expected = sorted(range(len(tricky)), key=lambda i: tricky[i].encode())
+    assert list(Listing.from_names(tricky).argsort()) == expected
+
+    joined = Listing.concatenate(Listing.chunks(objects, 3))
+    assert joined.names == names and np.all(joined.sizes == listing.sizes)
+    assert Listing.from_names(['a%2Fb', 'c']).unquote().names == ['a/b', 'c']
+
+
+def test_key_boundaries():
+    keys = ['d/img_%05i.png' % i for i in range(1, 1001)]
+    boundaries = S3Client._key_boundaries('d/', keys, 1000)
+    assert boundaries[:3] == ['d/img_02', 'd/img_03', 'd/img_04']
+    assert 'd/img_1' in boundaries
+    assert boundaries[-1] == 'd/p'
+    assert boundaries == sorted(set(boundaries))
+    assert all(boundary > keys[-1] for boundary in boundaries)
+
+    thinned = S3Client._key_boundaries('d/', keys, 8)
+    assert len(thinned) == 7
+    assert set(thinned) <= set(boundaries)
+    assert S3Client._key_boundaries('d/', ['d/'], 8) == []
@@ -1,8 +1,12 @@
 import os
 import tempfile
+import threading
 import time
 
 import numpy as np
+import pytest
+
+from cottoncandy.backend import FileNotFoundError
 
 
 def content_generator():
@@ -173,3 +177,531 @@ def test_move(cci, object_name):
         dat = cci.download_raw_array(dest_object_name)
         assert np.allclose(dat, content)
         cci.rm(dest_object_name)
+
+
+def test_download_raw_array_missing(cci, object_name):
+    with pytest.raises(FileNotFoundError):
+        cci.download_raw_array(object_name + '_missing')
+    with pytest.raises(FileNotFoundError):
+        cci.download_raw_array(object_name + '_missing', index=slice(0, 2))
+
+
+def test_download_raw_array_index(cci, object_name):
+    content = np.random.randn(50, 4, 3)
+    indices = [
+        slice(10, 20),
+        slice(None, None, -3),
+        slice(45, 100),
+        7,
+        -1,
+        [3, 4, 5, 20, 21, 49],
+        [21, 3, 3, 49, 0],
+        np.arange(50) % 7 == 0,
+        [],
+        (slice(2, 9), 1),
+        (4, slice(None), 2),
+        ([1, 2], [0, 1]),
+        (np.arange(50) % 7 == 0, [0, 1, 2, 3, 0, 1, 2, 3]),
+        ([3, 1], slice(None), [0, 2]),
+        (slice(None, None, -5), [0, 3], 1),
+        (4, slice(None), [0, 2]),
+    ]
+    for compression in [False, 'gzip']:
+        cci.upload_raw_array(object_name, content, compression=compression)
+        time.sleep(cci.wait_time)
+        for index in indices:
+            dat = cci.download_raw_array(object_name, index=index)
+            expected = content[index]
+            assert dat.shape == expected.shape
+            assert np.allclose(dat, expected)
+        cci.rm(object_name, recursive=True)
+
+
+def test_download_raw_array_index_parts(cci, object_name, monkeypatch):
+    from .. import interfaces
+    monkeypatch.setattr(interfaces, 'MPD_THRESHOLD', 1000)
+    monkeypatch.setattr(interfaces, 'MPD_CHUNKSIZE', 1000)
+
+    content = np.random.randn(50, 4, 3)
+    cci.upload_raw_array(object_name, content, compression=False)
+    time.sleep(cci.wait_time)
+
+    backend = cci.backend_interface
+    download_ranges_into = backend.download_ranges_into
+    sizes = []
+
+    def record_ranges(cloud_name, requests, threads=1):
+        sizes.extend(len(buffer) for _, buffer in requests)
+        return download_ranges_into(cloud_name, requests, threads=threads)
+    monkeypatch.setattr(backend, 'download_ranges_into', record_ranges)
+
+    # 40 rows of 96 bytes are fetched in parts of at most 1000 bytes
+    dat = cci.download_raw_array(object_name, index=slice(5, 45))
+    assert np.array_equal(dat, content[5:45])
+    assert sizes == [1000, 1000, 1000, 840]
+    cci.rm(object_name, recursive=True)
+
+
+def test_download_array_out(cci, object_name):
+    from multiprocessing import shared_memory
+
+    for compression in [False, 'gzip', 'Zstd']:
+        for content in content_generator():
+            cci.upload_raw_array(object_name, content, compression=compression)
+            time.sleep(cci.wait_time)
+            out = np.empty(content.shape, dtype=content.dtype)
+            dat = cci.download_raw_array(object_name, out=out)
+            assert dat is out
+            assert np.allclose(out, content)
+            cci.rm(object_name, recursive=True)
+
+    content = np.random.randn(20, 10)
+    cci.upload_npy_array(object_name, content)
+    time.sleep(cci.wait_time)
+    out = np.empty_like(content)
+    assert cci.download_npy_array(object_name, out=out) is out
+    assert np.allclose(out, content)
+
+    # shared memory buffer
+    shm = shared_memory.SharedMemory(create=True, size=content.nbytes)
+    try:
+        dat = cci.download_npy_array(object_name, out=shm.buf)
+        assert np.allclose(np.ndarray(content.shape, dtype=content.dtype, buffer=shm.buf), content)
+        del dat
+    finally:
+        shm.close()
+        shm.unlink()
+
+    # wrong shape
+    with pytest.raises(ValueError):
+        cci.download_npy_array(object_name, out=np.empty((10, 20)))
+    cci.rm(object_name, recursive=True)
+
+
+def test_download_raw_array_mmap(cci, object_name, tmp_path):
+    content = np.random.randn(30, 20)
+    for compression in [False, 'gzip', 'Zstd']:
+        cci.upload_raw_array(object_name, content, compression=compression)
+        time.sleep(cci.wait_time)
+        for fname in ['array.npy', 'array.raw']:
+            path = str(tmp_path / fname)
+            dat = cci.download_raw_array(object_name, mmap_path=path)
+            assert isinstance(dat, np.memmap)
+            assert np.allclose(dat, content)
+            del dat
+            if fname.endswith('.npy'):
+                assert np.allclose(np.load(path, mmap_mode='r'), content)
+            else:
+                assert np.allclose(np.fromfile(path).reshape(content.shape), content)
+            os.unlink(path)
+        cci.rm(object_name, recursive=True)
+
+
+def test_upload_raw_array_memmap(cci, object_name, tmp_path):
+    content = np.random.randn(40, 25)
+    path = str(tmp_path / 'array.npy')
+    np.save(path, content)
+    for mmap_mode in ['r', 'r+', 'c']:
+        source = np.load(path, mmap_mode=mmap_mode)
+        for compression in [False, 'gzip', 'Zstd']:
+            cci.upload_raw_array(object_name, source, compression=compression)
+            time.sleep(cci.wait_time)
+            dat = cci.download_raw_array(object_name)
+            assert np.array_equal(dat, content)
+            cci.rm(object_name, recursive=True)
+        del source
+
+
+def test_listing_pages(cci, object_name):
+    # listings span several pages and are not truncated
+    names = [cci.pathjoin(object_name, 'dir%i' % (i % 2), 'file%02i' % i) for i in range(7)]
+    for name in names:
+        cci.upload_json(name, dict())
+    time.sleep(cci.wait_time)
+
+    assert cci.glob(object_name + '/*', page_size=2) == sorted(names)
+    assert cci.glob(object_name + '/dir1/*', page_size=2) == sorted(names[1::2])
+    assert cci.glob(object_name + '/*', page_size=2, limit=3) == sorted(names)[:3]
+    assert sorted(cci.ls(object_name + '/dir*', page_size=2)) == \
+        [cci.pathjoin(object_name, 'dir0'), cci.pathjoin(object_name, 'dir1')]
+    assert sorted(cci.lsdir(cci.pathjoin(object_name, 'dir0'))) == sorted(names[::2])
+    assert len(list(cci.iter_objects(object_name + '/', page_size=2))) == len(names)
+
+    # parallel listings are split by key ranges, and merged in order
+    others = [cci.pathjoin(object_name, name) for name in ['a.txt', 'dir0.json', 'dir0a/file', 'dir1/x/y']]
+    for name in others:
+        cci.upload_json(name, dict())
+    time.sleep(cci.wait_time)
+    listing = list(cci.iter_objects(object_name + '/', page_size=2))
+    assert [t[0] for t in listing] == sorted(names + others)
+    assert list(cci.iter_objects(object_name + '/', page_size=2, threads=3)) == listing
+    assert cci.glob(object_name + '/dir*/*', page_size=2, threads=3) == \
+        sorted(names + others[2:])
+
+    # flat prefixes are split too
+    flat = [cci.pathjoin(object_name, 'flat', 'img_%03i.png' % i) for i in range(0, 200, 7)]
+    for name in flat:
+        cci.upload_json(name, dict())
+    time.sleep(cci.wait_time)
+    listing = list(cci.iter_objects(object_name + '/flat/', page_size=3, threads=3))
+    assert [t[0] for t in listing] == flat
+    assert list(cci.iter_objects(object_name + '/flat/', page_size=3)) == listing
+    assert [t[0] for t in cci.iter_objects(object_name + '/flat/img_1', page_size=3, threads=2)] == \
+        [name for name in flat if '/img_1' in name]
+
+    cci.rm(object_name, recursive=True)
+    time.sleep(cci.wait_time)
+    assert cci.glob(object_name + '/*') == []
+
+
+def test_glob_pattern_walk(cci, object_name, monkeypatch):
+    names = ['sub%i/session%02i/run%i.arr' % (i, j, k) for i in range(3) for j in range(2) for k in range(2)]
+    names = [cci.pathjoin(object_name, name) for name in names + ['sub0/session01/deep/run0.arr']]
+    for name in names:
+        cci.upload_json(name, dict())
+    time.sleep(cci.wait_time)
+
+    listed = []
+    client = cci.backend_interface
+    iter_objects = client.iter_objects
+    monkeypatch.setattr(client, 'iter_objects', lambda prefix, *args, **kwargs: listed.append(prefix) or
+                        iter_objects(prefix, *args, **kwargs))
+
+    # wildcards in directories match one component, and the last one matches the rest
+    expected = sorted(name for name in names if '/session01/' in name and name.endswith('.arr'))
+    assert cci.glob(object_name + '/sub*/session01/*.arr') == expected
+    assert len(expected) == 7
+    # only the matching "directories" were listed
+    assert sorted(listed) == [cci.pathjoin(object_name, 'sub%i/session01/' % i) for i in range(3)]
+
+    assert cci.glob(object_name + '/sub[12]/session0?/run1.arr') == \
+        sorted(name for name in names if name.endswith('run1.arr') and '/sub0/' not in name)
+    assert cci.ls(object_name + '/sub*/session00') == \
+        [cci.pathjoin(object_name, 'sub%i/session00' % i) for i in range(3)]
+    assert cci.ls(object_name + '/sub0/*/d*') == [cci.pathjoin(object_name, 'sub0/session01/deep')]
+
+    # directories are listed a few at a time, ahead of the consumer
+    del listed[:]
+    prefixes = [cci.pathjoin(object_name, 'sub%i/session%02i/' % (i, j)) for i in range(3) for j in range(2)]
+    objects = cci._iter_prefixes(prefixes, threads=1)
+    assert next(objects)[0] == names[0]
+    assert len(listed) <= 2
+    assert [names[0]] + [row[0] for row in objects] == sorted(names)
+    assert sorted(listed) == prefixes
+    cci.rm(object_name, recursive=True)
+
+
+def test_rm_batches(cci, object_name, monkeypatch):
+    import cottoncandy.s3client
+    monkeypatch.setattr(cottoncandy.s3client, 'DELETE_BATCH_SIZE', 2)
+    names = [cci.pathjoin(object_name, 'dir%i' % (i % 2), 'file%02i' % i) for i in range(9)]
+    for name in names:
+        cci.upload_json(name, dict())
+    time.sleep(cci.wait_time)
+
+    # glob patterns
+    assert cci.rm(object_name + '/dir1/file0[135]', threads=2) == []
+    time.sleep(cci.wait_time)
+    assert cci.glob(object_name + '/*') == sorted(set(names) - set(names[1:6:2]))
+
+    # without recursive, patterns do not delete subtrees
+    subtree = cci.pathjoin(object_name, 'dir0', 'sub', 'x')
+    cci.upload_json(subtree, dict())
+    time.sleep(cci.wait_time)
+    listed = []
+    client = cci.backend_interface
+    iter_objects = client.iter_objects
+    monkeypatch.setattr(client, 'iter_objects', lambda prefix, *args, **kwargs: listed.append(prefix) or
+                        iter_objects(prefix, *args, **kwargs))
+    assert cci.rm(object_name + '/dir0/*') == []
+    time.sleep(cci.wait_time)
+    # only one level was listed
+    assert listed == []
+    assert cci.rm('/' + object_name + '/d*/sub') == []
+    monkeypatch.setattr(client, 'iter_objects', iter_objects)
+    assert cci.glob(object_name + '/dir0/*') == [subtree]
+
+    if cci.backend == 's3':
+        # connection errors are reported per batch, and the other batches are deleted
+        import botocore
+        for i in range(10, 13):
+            cci.upload_json(cci.pathjoin(object_name, 'dir1', 'file%02i' % i), dict())
+        time.sleep(cci.wait_time)
+        s3 = client.connection.meta.client
+        delete_objects = s3.delete_objects
+
+        def flaky_delete(**kwargs):
+            if any(key['Key'].endswith('file07') for key in kwargs['Delete']['Objects']):
+                raise botocore.exceptions.EndpointConnectionError(endpoint_url=client.url)
+            return delete_objects(**kwargs)
+        monkeypatch.setattr(s3, 'delete_objects', flaky_delete)
+        errors = cci.rm(object_name + '/dir1/*', threads=2)
+        failed = [cci.pathjoin(object_name, 'dir1', name) for name in ['file07', 'file10']]
+        assert [name for name, _ in errors] == failed
+        monkeypatch.setattr(s3, 'delete_objects', delete_objects)
+        time.sleep(cci.wait_time)
+        assert cci.glob(object_name + '/dir1/*') == failed
+
+    cci.rm(object_name + '/*', recursive=True, threads=2)
+    time.sleep(cci.wait_time)
+    assert cci.glob(object_name + '/*') == []
+
+
+def test_copy_move_prefix(cci, object_name, monkeypatch):
+    import cottoncandy.s3client
+    # copy the large objects part by part
+    monkeypatch.setattr(cottoncandy.s3client, 'MAX_PUT_SIZE', 2**20)
+    monkeypatch.setattr(cottoncandy.s3client, 'MPU_CHUNKSIZE', 5 * 2**20)
+
+    source = cci.pathjoin(object_name, 'source')
+    contents = {'a': np.arange(10), 'b/c': np.arange(3), 'b/large': np.random.randn(12 * 2**20 // 8)}
+    for name, content in contents.items():
+        cci.upload_raw_array(cci.pathjoin(source, name), content, compression=False)
+    time.sleep(cci.wait_time)
+
+    copy = cci.pathjoin(object_name, 'copy')
+    assert cci.cp(source, copy, recursive=True, overwrite=True, threads=2) == []
+    time.sleep(cci.wait_time)
+    for name, content in contents.items():
+        assert np.allclose(cci.download_raw_array(cci.pathjoin(copy, name)), content)
+
+    moved = cci.pathjoin(object_name, 'moved')
+    assert cci.mv(copy, moved, recursive=True, overwrite=True, threads=2) == []
+    time.sleep(cci.wait_time)
+    assert cci.glob(copy + '/*') == []
+    assert cci.glob(moved + '/*') == sorted(cci.pathjoin(moved, name) for name in contents)
+    assert np.allclose(cci.download_raw_array(cci.pathjoin(moved, 'b/large')), contents['b/large'])
+    cci.rm(object_name, recursive=True)
+
+
+def test_move_prefix_across_buckets(cci, object_name):
+    if cci.backend != 's3':
+        pytest.skip('prefixes are only listed in other buckets on s3')
+    import uuid
+    from io import BytesIO
+    import botocore
+    client = cci.backend_interface.connection.meta.client
+    other = '%s-%s' % (cci.bucket_name, str(uuid.uuid4())[:8])
+    try:
+        client.create_bucket(Bucket=other)
+    except botocore.exceptions.ClientError as error:
+        pytest.skip('cannot create a second bucket: %s' % error)
+
+    try:
+        source = cci.pathjoin(object_name, 'src')
+        for name in ['a', 'b/c']:
+            client.put_object(Bucket=other, Key=cci.pathjoin(source, name), Body=b'other')
+        # same names in the current bucket, which must be left alone
+        cci.upload_object(cci.pathjoin(source, 'a'), BytesIO(b'current'))
+        time.sleep(cci.wait_time)
+
+        moved = cci.pathjoin(object_name, 'dst')
+        assert cci.mv(source, moved, source_bucket=other, dest_bucket=cci.bucket_name,
+                      recursive=True, threads=2) == []
+        time.sleep(cci.wait_time)
+        assert client.list_objects_v2(Bucket=other).get('Contents', []) == []
+        assert cci.download_object(cci.pathjoin(source, 'a')) == b'current'
+        assert cci.download_object(cci.pathjoin(moved, 'b/c')) == b'other'
+    finally:
+        for listed in client.list_objects_v2(Bucket=other).get('Contents', []):
+            client.delete_object(Bucket=other, Key=listed['Key'])
+        client.delete_bucket(Bucket=other)
+        cci.rm(object_name, recursive=True)
+
+
+def test_upload_from_directory(cci, object_name, tmp_path):
+    for name in ['a.txt', 'b.txt', 'sub/c.txt']:
+        path = tmp_path / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(name)
+
+    summary = cci.upload_from_directory(str(tmp_path), object_name, threads=2)
+    assert summary['transferred'] == [cci.pathjoin(object_name, name) for name in ['a.txt', 'b.txt']]
+    time.sleep(cci.wait_time)
+
+    # only the missing and changed files are uploaded again
+    summary = cci.upload_from_directory(str(tmp_path), object_name, recursive=True, threads=2)
+    assert summary['transferred'] == [cci.pathjoin(object_name, 'sub/c.txt')]
+    assert len(summary['skipped']) == 2
+    time.sleep(cci.wait_time)
+
+    (tmp_path / 'b.txt').write_text('changed')
+    summary = cci.upload_from_directory(str(tmp_path), object_name, recursive=True, threads=2)
+    assert summary['transferred'] == [cci.pathjoin(object_name, 'b.txt')]
+    assert summary['failed'] == []
+    time.sleep(cci.wait_time)
+    assert cci.download_object(cci.pathjoin(object_name, 'b.txt')) == b'changed'
+
+    summary = cci.upload_from_directory(str(tmp_path), object_name, recursive=True, checksum=True)
+    assert len(summary['skipped']) == 3
+    cci.rm(object_name, recursive=True)
+
+
+def test_directory_listing_backend(cci, object_name, tmp_path, monkeypatch):
+    from cottoncandy.cacheclient import WrapperClient
+
+    class DirectoryClient(WrapperClient):
+        # like GDriveClient: only the children of a directory are listed, by name
+        prefix_listing = False
+
+        def list_directory(self, path, limit):
+            return [name.rstrip('/').rpartition('/')[2] for name in self.client.list_directory(path, limit)]
+
+        def iter_objects(self, *args, **kwargs):
+            raise AssertionError('iter_objects')
+
+        def split_prefix(self, *args, **kwargs):
+            raise AssertionError('split_prefix')
+
+    names = ['sub0/a.txt', 'sub0/b.txt', 'sub1/a.txt', 'other/a.txt']
+    for name in names:
+        path = tmp_path / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(name)
+    cci.upload_from_directory(str(tmp_path), object_name, recursive=True)
+    time.sleep(cci.wait_time)
+    expected = cci.ls(object_name + '/sub*/a*')
+    assert expected == [cci.pathjoin(object_name, name) for name in ['sub0/a.txt', 'sub1/a.txt']]
+
+    monkeypatch.setattr(cci, 'backend_interface', DirectoryClient(cci.backend_interface))
+    assert sorted(cci.ls(object_name + '/sub*/a*', threads=2)) == expected
+    # the files cannot be compared to the objects: all of them are uploaded
+    summary = cci.upload_from_directory(str(tmp_path), object_name, recursive=True, threads=2)
+    assert summary['transferred'] == [cci.pathjoin(object_name, name) for name in sorted(names)]
+    monkeypatch.undo()
+    cci.rm(object_name, recursive=True)
+
+
+def test_download_directory(cci, object_name, tmp_path):
+    names = ['a', 'b/c', 'b/d/e']
+    for name in names:
+        cci.upload_json(cci.pathjoin(object_name, name), dict(name=name))
+    time.sleep(cci.wait_time)
+
+    disk_name = str(tmp_path / 'download')
+    summary = cci.download_directory(object_name, disk_name, threads=2)
+    assert sorted(summary['transferred']) == [cci.pathjoin(object_name, name) for name in names]
+    downloaded = sorted(os.path.relpath(os.path.join(root, fl), disk_name)
+                        for root, _, files in os.walk(disk_name) for fl in files)
+    assert downloaded == [os.path.join(*name.split('/')) for name in names]
+
+    # interrupted downloads are resumed
+    os.remove(os.path.join(disk_name, 'b', 'c'))
+    summary = cci.download_directory(object_name, disk_name, threads=2)
+    assert summary['transferred'] == [cci.pathjoin(object_name, 'b/c')]
+    assert len(summary['skipped']) == 2
+    with open(os.path.join(disk_name, 'b', 'c')) as fl:
+        assert fl.read() == cci.download_object(cci.pathjoin(object_name, 'b/c')).decode()
+
+    summary = cci.download_directory(object_name, disk_name, checksum=True)
+    assert len(summary['skipped']) == 3
+    cci.rm(object_name, recursive=True)
+
+
+def test_submit(cci, object_name):
+    arrays = [np.random.randn(10, i + 1) for i in range(8)]
+    names = [cci.pathjoin(object_name, 'array%i' % i) for i in range(len(arrays))]
+    futures = [cci.submit_upload_raw_array(name, array) for name, array in zip(names, arrays)]
+    futures.append(cci.submit_upload_json(cci.pathjoin(object_name, 'info'), dict(count=len(arrays))))
+    for future in futures:
+        future.result()
+    time.sleep(cci.wait_time)
+
+    futures = [cci.submit_download_raw_array(name) for name in names]
+    for future, array in zip(futures, arrays):
+        assert np.allclose(future.result(), array)
+    assert cci.submit_download_json(cci.pathjoin(object_name, 'info')).result() == dict(count=len(arrays))
+
+    # errors are raised by the futures
+    with pytest.raises(FileNotFoundError):
+        cci.submit('download_json', cci.pathjoin(object_name, 'missing')).result()
+
+    cci.shutdown()
+    assert cci.submit_exists_object(names[0]).result()
+    cci.rm(object_name, recursive=True)
+
+
+def test_concurrent_transfers(cci, object_name):
+    from concurrent.futures import ThreadPoolExecutor
+
+    if cci.backend == 's3':
+        # one resource per thread, on top of the same client
+        backend = cci.backend_interface
+        barrier = threading.Barrier(2)
+
+        def get_resource(_):
+            # both threads run at the same time
+            barrier.wait()
+            return backend.connection
+        with ThreadPoolExecutor(2) as executor:
+            resources = list(executor.map(get_resource, range(2)))
+        assert resources[0] is not resources[1]
+        assert resources[0].meta.client is backend.connection.meta.client
+
+    arrays = [np.random.randn(100, 10) for _ in range(32)]
+    names = [cci.pathjoin(object_name, 'array%02i' % i) for i in range(len(arrays))]
+    with ThreadPoolExecutor(16) as executor:
+        list(executor.map(lambda args: cci.upload_raw_array(*args, threads=4), zip(names, arrays)))
+        time.sleep(cci.wait_time)
+        downloaded = list(executor.map(lambda name: cci.download_raw_array(name, threads=4), names))
+    for array, content in zip(downloaded, arrays):
+        assert np.allclose(array, content)
+    cci.rm(object_name, recursive=True)
+
+
+def test_copy_errors(cci, object_name, monkeypatch):
+    if cci.backend != 's3':
+        pytest.skip('server-side copies are specific to s3')
+    import botocore
+    backend = cci.backend_interface
+    for name in ['a', 'b']:
+        cci.upload_json(cci.pathjoin(object_name, 'source', name), dict(name=name))
+    time.sleep(cci.wait_time)
+
+    # ETags are not MD5s with SSE-KMS or SSE-C: only the size is checked
+    client = backend.connection.meta.client
+    copy_object = client.copy_object
+
+    def encrypted_copy(**kwargs):
+        response = copy_object(**kwargs)
+        response['CopyObjectResult']['ETag'] = '"not-an-md5"'
+        return response
+    monkeypatch.setattr(client, 'copy_object', encrypted_copy)
+    cci.cp(cci.pathjoin(object_name, 'source', 'a'), cci.pathjoin(object_name, 'copy'), overwrite=True)
+
+    # connection errors are reported per object
+    _copy_object = backend._copy_object
+
+    def flaky_copy(source, *args, **kwargs):
+        if source.endswith('/b'):
+            raise botocore.exceptions.EndpointConnectionError(endpoint_url=cci.backend_interface.url)
+        return _copy_object(source, *args, **kwargs)
+    monkeypatch.setattr(backend, '_copy_object', flaky_copy)
+    errors = cci.cp(cci.pathjoin(object_name, 'source'), cci.pathjoin(object_name, 'copies'),
+                    recursive=True, overwrite=True)
+    assert [name for name, _ in errors] == [cci.pathjoin(object_name, 'source', 'b')]
+    time.sleep(cci.wait_time)
+    assert cci.glob(object_name + '/copies/*') == [cci.pathjoin(object_name, 'copies', 'a')]
+    cci.rm(object_name, recursive=True)
+
+
+def test_download_to_file_failure(cci, object_name, tmp_path, monkeypatch):
+    cci.upload_json(object_name, dict(content='new'))
+    time.sleep(cci.wait_time)
+    path = tmp_path / 'file.json'
+    path.write_text('old')
+    if cci.backend == 's3':
+        def broken_download(*args, **kwargs):
+            raise IOError('connection lost')
+        monkeypatch.setattr(cci.backend_interface, 'download_parts_into', broken_download)
+        with pytest.raises(IOError):
+            cci.download_to_file(object_name, str(path))
+        # the destination is left as it was
+        assert os.listdir(str(tmp_path)) == ['file.json']
+        assert path.read_text() == 'old'
+        monkeypatch.undo()
+
+    cci.download_to_file(object_name, str(path))
+    assert os.listdir(str(tmp_path)) == ['file.json']
+    assert path.read_text() == '{"content": "new"}'
+    cci.rm(object_name)
@@ -1,10 +1,16 @@
 '''Helper functions
 '''
+import hashlib
 import itertools
+import mmap
 import os
 import re
 import string
+import struct
 import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
 from functools import wraps
 from urllib.parse import unquote
 
@@ -12,7 +18,7 @@ import numpy as np
 import six
 from dateutil.tz import tzlocal
 
-from cottoncandy import options
+from cottoncandy import appdirs, options
 
 ##############################
 # Globals
@@ -30,6 +36,9 @@ MAX_MPU_PARTS = int(options.config.get('upload_settings', 'max_mpu_parts')) # 10
 MPU_THRESHOLD = int(options.config.get('upload_settings', 'mpu_use_threshold'))*MB
 MPU_CHUNKSIZE = int(options.config.get('upload_settings', 'mpu_chunksize'))*MB
 DASK_CHUNKSIZE = int(options.config.get('upload_settings', 'dask_chunksize'))*MB
+MPU_INFLIGHT_PARTS = int(options.config.get('upload_settings', 'mpu_inflight_parts'))
+MPD_THRESHOLD = int(options.config.get('download_settings', 'mpd_use_threshold'))*MB
+MPD_CHUNKSIZE = int(options.config.get('download_settings', 'mpd_chunksize'))*MB
 
 SEPARATOR = options.config.get('basic', 'path_separator')
 
@@ -39,6 +48,26 @@ MANDATORY_BUCKET_PREFIX = options.config.get('basic', 'mandatory_bucket_prefix')
 ISBOTO_VERBOSE = options.config.get('login', 'verbose_boto')
 
 THREADS = int(options.config.get('basic', 'threads'))
+SUBMIT_WORKERS = int(options.config.get('basic', 'submit_workers'))
+MAX_POOL_CONNECTIONS = (int(options.config.get('basic', 'max_pool_connections')) or
+                        max(10, THREADS * SUBMIT_WORKERS))
+
+# Compression
+#------------
+COMPRESSION_WORKERS = int(options.config.get('compression', 'workers')) or os.cpu_count() or 1
+# numcodecs codecs that release the GIL while compressing
+NOGIL_CODECS = ('zstd', 'lz4', 'blosc', 'zlib', 'gzip', 'bz2', 'lzma')
+
+# Local cache
+#------------
+USE_CACHE = options.config.get('cache', 'use_cache').lower() in ('true', 't', 'y', 'yes')
+CACHE_PATH = (os.path.expanduser(options.config.get('cache', 'path')) or
+              appdirs.user_cache_dir("cottoncandy", appauthor="cottoncandy"))
+CACHE_SIZE = int(options.config.get('cache', 'size'))*MB
+ARRAY_CACHE_SIZE = int(options.config.get('cache', 'array_memory'))*MB
+METADATA_TTL = float(options.config.get('cache', 'metadata_ttl'))
+USE_LISTING_INDEX = options.config.get('cache', 'listing_index').lower() in ('true', 't', 'y', 'yes')
+LISTING_MAX_AGE = float(options.config.get('cache', 'listing_max_age'))
 
 ##############################
 # misc functions
@@ -144,6 +173,37 @@ def get_fileobject_size(file_object):
     return nbytes
 
 
+def file_etag(file_name, threshold=MPU_THRESHOLD, chunksize=MPU_CHUNKSIZE):
+    '''ETag that S3 gives to a file uploaded with ``upload_file``
+
+    Single-part uploads have the MD5 of the file. Multipart uploads
+    have the MD5 of the MD5s of the parts, followed by the number
+    of parts.
+
+    Parameters
+    ----------
+    file_name : str
+    threshold : int
+        size from which files are uploaded in parts
+    chunksize : int
+        size of the parts
+
+    Returns
+    -------
+    etag : str
+        without the quotes
+    '''
+    whole = hashlib.md5()
+    parts = []
+    with open(file_name, 'rb') as fl:
+        for chunk in iter(lambda: fl.read(chunksize), b''):
+            whole.update(chunk)
+            parts.append(hashlib.md5(chunk).digest())
+    if os.path.getsize(file_name) < threshold:
+        return whole.hexdigest()
+    return '%s-%i' % (hashlib.md5(b''.join(parts)).hexdigest(), len(parts))
+
+
 def get_key_from_s3fs():
     '''Get AWS keys from default S3fs location if available.
 
@@ -231,6 +291,26 @@ def unquote_names(object_names):
     return [unquote(t) for t in object_names]
 
 
+def print_listing(listing, do_unquote=True):
+    '''Print name, size, and modification date of listed objects.
+
+    Parameters
+    ----------
+    listing : list (of (name, size, etag, mtime) tuples) or Listing
+    do_unquote : bool
+        decode URL-quoted names
+    '''
+    if len(listing):
+        object_names = [unquote(t[0]) if do_unquote else t[0] for t in listing]
+        maxlen = max(map(len, object_names))
+        dates = [datetime.fromtimestamp(t[3], tzlocal()).strftime('%Y/%m/%d (%H:%M:%S)')
+                 for t in listing]
+        padding = '{0: <%i} {1} {2}M' % (min(maxlen+3, 70))
+        sizes = [round(t[1]/2.**20,1) for t in listing]
+        info = [padding.format(name[-100:],date,size) for name,date,size in zip(object_names, dates, sizes)]
+        print('\n'.join(info))
+
+
 def print_objects(object_list):
     '''Print name, size, and creation date of objects in list.
 
@@ -330,6 +410,69 @@ def remove_trivial_magic(s):
     return s[:-1] # remove '*' at end
 
 
+def translate_glob(pattern, match_separator=False):
+    r'''Translate a glob pattern to a regular expression
+
+    Like ``fnmatch.translate``, but ``*`` and ``?`` do not match
+    the separator unless ``match_separator`` is True.
+
+    Returns
+    -------
+    regex : str
+        Unanchored expression. Compile with ``re.DOTALL`` and
+        append ``\Z`` to match whole names.
+    '''
+    anything = '.' if match_separator else '[^%s]' % re.escape(SEPARATOR)
+    res = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        i += 1
+        if c == '*':
+            if not (res and res[-1] == anything + '*'):
+                res.append(anything + '*')
+        elif c == '?':
+            res.append(anything)
+        elif c == '[':
+            j = i
+            if j < n and pattern[j] == '!':
+                j += 1
+            if j < n and pattern[j] == ']':
+                j += 1
+            while j < n and pattern[j] != ']':
+                j += 1
+            if j >= n:
+                res.append('\\[')
+            else:
+                stuff = pattern[i:j].replace('\\', '\\\\')
+                i = j + 1
+                if stuff[0] == '!':
+                    stuff = '^' + stuff[1:]
+                elif stuff[0] in ('^', '['):
+                    stuff = '\\' + stuff
+                res.append('[%s]' % stuff)
+        else:
+            res.append(re.escape(c))
+    return ''.join(res)
+
+
+def glob_regex(pattern):
+    '''Translate a glob pattern over object names to a regular expression
+
+    Wildcards in the "directory" components of the pattern match
+    within one component. Wildcards in the last component also
+    match ``/``, so that ``path/*`` matches all the objects under
+    ``path/``.
+
+    Returns
+    -------
+    regex : str
+        Unanchored expression (see ``translate_glob``)
+    '''
+    head, sep, tail = pattern.rpartition(SEPARATOR)
+    return translate_glob(head + sep) + translate_glob(tail, match_separator = True)
+
+
 def split_uri(uri, pattern='s3://', separator='/'):
     """Convert a URI to a bucket, object name tuple.
 
@@ -463,6 +606,454 @@ def read_buffered(frm, to, buffersize=64):
             raise("Unknown python version") # not sure six will ever do anything here (6=2x3)
 
 
+def read_into(stream, buffer, blocksize=MB):
+    '''Fill a writable buffer with the contents of a file-like object
+
+    Parameters
+    ----------
+    stream : buffer
+        Object with a ``read`` (or ``readinto``) method
+    buffer : writable buffer
+        Destination (e.g. a contiguous ``np.ndarray`` or ``bytearray``).
+        It is filled in place.
+    blocksize : int
+        Maximum number of bytes read at a time
+
+    Returns
+    -------
+    nbytes : int
+        Number of bytes written to ``buffer``
+    '''
+    view = memoryview(buffer).cast('B')
+    nbytes = view.nbytes
+    readinto = getattr(stream, 'readinto', None)
+    position = 0
+    while position < nbytes:
+        end = min(nbytes, position + blocksize)
+        if readinto is not None:
+            nread = readinto(view[position:end])
+        else:
+            data = stream.read(end - position)
+            nread = len(data)
+            view[position:position + nread] = data
+        if not nread:
+            raise IOError('Stream ended after %i of %i bytes' % (position, nbytes))
+        position += nread
+    return position
+
+
+def split_byte_range(nbytes, chunksize):
+    '''Split ``nbytes`` into consecutive parts of at most ``chunksize`` bytes
+
+    Parameters
+    ----------
+    nbytes : int
+    chunksize : int
+
+    Returns
+    -------
+    parts : list of tuples
+        ``(start, stop)`` half-open byte interval for each part
+    '''
+    chunksize = max(int(chunksize), 1)
+    return [(start, min(start + chunksize, nbytes)) for start in range(0, nbytes, chunksize)]
+
+
+def parse_array_metadata(metadata):
+    '''Get the array description stored by ``upload_raw_array``
+
+    Parameters
+    ----------
+    metadata : dict
+        Object metadata
+
+    Returns
+    -------
+    shape : tuple
+    dtype : np.dtype
+    order : str
+        'C' or 'F'
+    compression : str
+        'False' if the array is not compressed. Otherwise,
+        'gzip' or the name of the ``numcodecs`` codec.
+    '''
+    shape = metadata['shape']
+    shape = tuple(map(int, shape.split(','))) if shape else ()
+    dtype = np.dtype(metadata['dtype'])
+    order = metadata.get('order', 'C')
+
+    if 'gzip' in metadata:
+        # Backward compatibility, "gzip" flag takes precedence
+        compression = 'gzip' if string2bool(metadata['gzip']) else 'False'
+    else:
+        compression = metadata['compression']
+    if compression == 'None':
+        compression = 'False'
+    return shape, dtype, order, compression
+
+
+def check_output_array(out, shape, dtype, order='C'):
+    '''Check that a caller-provided array can receive a downloaded array
+
+    Parameters
+    ----------
+    out : np.ndarray or writable buffer
+        Destination array (e.g. ``np.memmap``), or a buffer
+        (e.g. ``multiprocessing.shared_memory.SharedMemory.buf``)
+        large enough to hold the array.
+    shape : tuple
+    dtype : np.dtype
+    order : str
+        'C' or 'F', memory layout of the downloaded data
+
+    Returns
+    -------
+    out : np.ndarray
+        ``out`` itself, or an array view of the buffer.
+    '''
+    if not isinstance(out, np.ndarray):
+        count = int(np.prod(shape, dtype=np.int64))
+        out = np.frombuffer(out, dtype=dtype, count=count).reshape(shape, order=order)
+
+    if (out.shape != tuple(shape)) or (out.dtype != dtype):
+        raise ValueError('`out` must have shape %s and dtype %s, got %s and %s' % \
+                         (tuple(shape), dtype, out.shape, out.dtype))
+    if not out.flags['%s_CONTIGUOUS' % order]:
+        raise ValueError('`out` must be %s-contiguous' % order)
+    if not out.flags.writeable:
+        raise ValueError('`out` must be writeable')
+    return out
+
+
+def read_npy_header(stream):
+    '''Read the header of a ``.npy`` file from a stream
+
+    Parameters
+    ----------
+    stream : buffer
+        Object with a ``read`` method, positioned at the start of the file.
+        After the call, it is positioned at the start of the array data.
+
+    Returns
+    -------
+    shape : tuple
+    fortran_order : bool
+    dtype : np.dtype
+    '''
+    version = np.lib.format.read_magic(stream)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+    elif version == (2, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+    else:
+        raise ValueError('Unsupported .npy format version: %s' % (version,))
+    if dtype.hasobject:
+        raise ValueError('Arrays of python objects cannot be read in place')
+    return shape, fortran_order, dtype
+
+
+def normalize_row_index(index, nrows):
+    '''Convert an index along the first axis into row numbers
+
+    Parameters
+    ----------
+    index : int, slice, list of int, or boolean mask
+        Index along the first axis of an array
+    nrows : int
+        Length of the first axis
+
+    Returns
+    -------
+    rows : 1D np.ndarray
+        Non-negative row numbers in the requested order
+    squeeze : bool
+        True if ``index`` is a scalar and the first axis
+        must be dropped from the result
+    '''
+    if isinstance(index, slice):
+        return np.arange(*index.indices(nrows)), False
+
+    squeeze = np.ndim(index) == 0
+    rows = np.atleast_1d(np.asarray(index))
+    if rows.dtype == bool:
+        if rows.shape != (nrows,):
+            raise IndexError('Boolean index must have shape (%i,)' % nrows)
+        return np.flatnonzero(rows), False
+
+    if rows.size == 0:
+        rows = rows.astype(np.int64)
+    if rows.ndim != 1 or not np.issubdtype(rows.dtype, np.integer):
+        raise IndexError('Only integers, slices, and 1D integer or '
+                         'boolean arrays are valid row indices')
+
+    rows = np.where(rows < 0, rows + nrows, rows).astype(np.int64)
+    if np.any((rows < 0) | (rows >= nrows)):
+        raise IndexError('Row index out of bounds for axis 0 with size %i' % nrows)
+    return rows, squeeze
+
+
+def contiguous_runs(rows):
+    '''Coalesce sorted unique row numbers into runs of adjacent rows
+
+    Parameters
+    ----------
+    rows : 1D np.ndarray
+        Sorted and unique row numbers
+
+    Returns
+    -------
+    runs : list of tuples
+        ``(start, stop)`` half-open interval for each run
+    '''
+    if len(rows) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+    starts = rows[np.r_[0, breaks]]
+    stops = rows[np.r_[breaks - 1, len(rows) - 1]] + 1
+    return list(zip(starts.tolist(), stops.tolist()))
+
+
+def _memmap_advisor(array):
+    '''Return a function that gives paging advice for views of a memory map'''
+    mapped = getattr(array, '_mmap', None)
+    if (mapped is None) or (not hasattr(mapped, 'madvise')):
+        # not a np.memmap, or madvise is not available
+        return lambda view, advice: None
+
+    base = np.frombuffer(mapped, dtype=np.uint8).__array_interface__['data'][0]
+    # releasing pages of a private (copy-on-write) map discards changes
+    can_release = getattr(array, 'mode', None) != 'c'
+
+    def advise(view, advice):
+        if (not hasattr(mmap, advice)) or (advice == 'MADV_DONTNEED' and not can_release):
+            return
+        start = view.__array_interface__['data'][0] - base
+        stop = start + view.nbytes
+        if advice == 'MADV_DONTNEED':
+            # only release pages that are fully inside the view
+            start = -(-start // mmap.PAGESIZE) * mmap.PAGESIZE
+            stop = (stop // mmap.PAGESIZE) * mmap.PAGESIZE
+        else:
+            start = (start // mmap.PAGESIZE) * mmap.PAGESIZE
+        if stop > start:
+            mapped.madvise(getattr(mmap, advice), start, stop - start)
+    return advise
+
+
+def iter_array_windows(array, size, release=True):
+    '''A generator over consecutive windows of a contiguous array
+
+    For a ``np.memmap``, the kernel is asked to read the file
+    ahead sequentially, and the pages of each window are released
+    once the next window is requested. The resident memory stays
+    flat even when the array is much larger than memory.
+
+    Parameters
+    ----------
+    array : np.ndarray
+        A contiguous array
+    size : int
+        Number of array elements in each window
+    release : bool
+        Release the pages of each window when the next one is
+        requested. Consumers that still use the windows afterwards
+        (e.g. in other threads) release them with ``_memmap_advisor``.
+
+    Returns
+    -------
+    iterator : generator object
+        Yields 1D views of the array memory
+    '''
+    flat = array.reshape(-1, order='A')
+    advise = _memmap_advisor(array)
+    advise(flat, 'MADV_SEQUENTIAL')
+    for start in range(0, flat.size, size):
+        window = flat[start:start + size]
+        advise(window, 'MADV_WILLNEED')
+        yield window
+        if release:
+            advise(window, 'MADV_DONTNEED')
+
+
+class IterStream(object):
+    '''Read-only, non-seekable file-like object over an iterator of byte chunks
+
+    Chunks are only produced when the stream is read, so data can be
+    generated (e.g. compressed) while it is being uploaded.
+
+    Parameters
+    ----------
+    iterable : iterable
+        Yields bytes-like objects
+    '''
+    def __init__(self, iterable):
+        self._iterator = iter(iterable)
+        self._chunk = memoryview(b'')
+        self._offset = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def tell(self):
+        return self._offset
+
+    def read(self, size=-1):
+        '''Read ``size`` bytes, or fewer only at the end of the stream'''
+        parts = []
+        remaining = None if (size is None or size < 0) else size
+        while remaining != 0:
+            if not len(self._chunk):
+                try:
+                    self._chunk = memoryview(next(self._iterator)).cast('B')
+                except StopIteration:
+                    break
+                continue
+            nbytes = len(self._chunk) if remaining is None else min(remaining, len(self._chunk))
+            parts.append(self._chunk[:nbytes])
+            self._chunk = self._chunk[nbytes:]
+            if remaining is not None:
+                remaining -= nbytes
+        data = b''.join(parts)
+        self._offset += len(data)
+        return data
+
+    def close(self):
+        self._chunk = memoryview(b'')
+        self._iterator = iter(())
+
+
+def gzip_chunks(array, blocksize=MPU_CHUNKSIZE, compresslevel=9):
+    '''A generator that compresses the contents of an array in gzip format
+
+    Parameters
+    ----------
+    array : np.ndarray
+        A contiguous array
+    blocksize : int
+        Number of bytes compressed at a time
+    compresslevel : int
+
+    Returns
+    -------
+    iterator : generator object
+        Yields compressed bytes. Together, they form a single gzip member.
+    '''
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for window in iter_array_windows(array, max(blocksize // array.itemsize, 1)):
+        compressed = compressor.compress(window)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+FRAME_HEADER = struct.Struct('<Q')  # compressed byte size of the frame
+
+
+def ordered_map(function, iterable, workers=1, processes=False):
+    '''A generator that applies a function in parallel, in order
+
+    At most ``workers`` items are processed ahead of the
+    consumer, so memory use stays bounded.
+
+    Parameters
+    ----------
+    function : callable
+    iterable : iterable
+    workers : int
+        Number of workers. With 1 worker, no pool is created.
+    processes : bool
+        Use a process pool instead of a thread pool. Required
+        for functions that hold the GIL.
+
+    Returns
+    -------
+    iterator : generator object
+        Yields ``function(item)`` in the order of ``iterable``
+    '''
+    if workers <= 1:
+        for item in iterable:
+            yield function(item)
+        return
+
+    pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with pool(max_workers=workers) as executor:
+        pending = deque()
+        for item in iterable:
+            pending.append(executor.submit(function, item))
+            if len(pending) > workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def encode_frames(codec, array, frame_size, workers=1):
+    '''A generator that compresses an array in independent frames
+
+    Each frame is preceded by a fixed-size header holding its
+    compressed byte size, so frames can be decoded as they
+    are read from a stream.
+
+    Parameters
+    ----------
+    codec : numcodecs.abc.Codec
+    array : np.ndarray
+        A contiguous array
+    frame_size : int
+        Number of array elements in each frame
+    workers : int
+        Number of frames compressed in parallel. Codecs that release
+        the GIL use threads, other codecs use processes.
+
+    Returns
+    -------
+    iterator : generator object
+        Yields the header and the compressed bytes of each frame
+    '''
+    # frames are compressed ahead of the consumer: the pages of a frame
+    # are only released once it is compressed and consumed
+    advise = _memmap_advisor(array)
+    windows = deque()
+
+    def frames():
+        for window in iter_array_windows(array, frame_size, release=False):
+            windows.append(window)
+            yield window
+
+    processes = codec.codec_id not in NOGIL_CODECS
+    for encoded in ordered_map(codec.encode, frames(), workers=workers, processes=processes):
+        yield FRAME_HEADER.pack(memoryview(encoded).nbytes)
+        yield encoded
+        advise(windows.popleft(), 'MADV_DONTNEED')
+
+
+def decode_frames(stream, codec, array, frame_size):
+    '''Decode frames written by ``encode_frames`` from a stream into an array
+
+    Each frame is decoded as soon as it is read, so only one
+    compressed frame is held in memory at a time.
+
+    Parameters
+    ----------
+    stream : buffer
+        Object with a ``read`` method
+    codec : numcodecs.abc.Codec
+    array : np.ndarray
+        A contiguous array, filled in place
+    frame_size : int
+        Number of array elements in each frame
+    '''
+    flat = array.reshape(-1, order='A')
+    header = bytearray(FRAME_HEADER.size)
+    for start in range(0, flat.size, frame_size):
+        read_into(stream, header)
+        frame = bytearray(FRAME_HEADER.unpack(header)[0])
+        read_into(stream, frame)
+        codec.decode(frame, out=flat[start:start + frame_size])
+
+
 class GzipInputStream:
     """Simple class that allow streaming reads from GZip files
     (from https://gist.github.com/beaufour/4205533).